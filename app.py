@@ -1,17 +1,79 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+import asyncio
+import json
 import os
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from google_wrapper import GoogleCalendarWrapper
-from logic.parse_and_sync_service import process_message
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from functools import partial
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Any, AsyncIterator, BinaryIO, Dict, Iterator, Optional
+from loguru import logger
+from agent import route_and_parse_async
+from chat_router import CalendarNotAllowed, UnknownChat, get_default_router
+from job_queue import QueueFull, ShardedJobQueue
+from metrics import gauge_lines, render as render_metrics
+from parse_cache import get_default_cache
+from throttle import get_throttle, is_retryable
+from logic.parse_and_sync_service import process_message, sync_event
+from utils.whatsapp_export import iter_messages
+
+if TYPE_CHECKING:
+    from calendar_pool import CalendarClientPool
+
+
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "8"))
+IMPORT_SPOOL_BYTES = int(os.getenv("IMPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# How long POST /messages (and an import's calendar write) waits for its queued job.
+MESSAGE_TIMEOUT_SECONDS = float(os.getenv("MESSAGE_TIMEOUT_SECONDS", "60"))
+
+_pool_lock = threading.Lock()
+
+
+def calendar_pool(state) -> Optional["CalendarClientPool"]:
+    """The process-wide Calendar pool, built by lifespan at startup. If building it failed
+    (e.g. a transient error fetching discovery or credentials), the next caller tries again.
+    """
+    with _pool_lock:
+        if getattr(state, "calendars", None) is None:
+            try:
+                # Imported here: googleapiclient is slow to load and importing the app should stay cheap.
+                from calendar_pool import CalendarClientPool
+                state.calendars = CalendarClientPool.from_env()
+                state.calendars_error = None
+            except Exception as e:
+                logger.info("app: calendar pool unavailable: {}", e)
+                state.calendars = None
+                state.calendars_error = str(e)
+        return state.calendars
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shard per worker; a chat's calendar work (messages and import writes) always goes
+    # to the same shard and runs in order. Jobs are callables.
+    app.state.jobs = ShardedJobQueue(
+        lambda work: work(),
+        workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_queue=int(os.getenv("JOB_QUEUE_SIZE", "100")),
+    )
+    app.state.jobs.start()
+    await asyncio.to_thread(calendar_pool, app.state)
+    yield
+    app.state.jobs.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class MessageIn(BaseModel):
     text: str
+    # The group the message came from: picks the calendar (CHAT_CALENDARS) and the ordering shard.
+    chat_id: Optional[str] = None
+    # Optional; must be the chat's own calendar.
+    calendar_id: Optional[str] = None
 
 
 class MessageOut(BaseModel):
@@ -22,28 +84,248 @@ class MessageOut(BaseModel):
     event_id: Optional[str] = None
 
 
-def build_calendar_wrapper() -> tuple[GoogleCalendarWrapper, str]:
-    sa_path = os.getenv("SERVICE_ACCOUNT_FILE")
-    calendar_id = os.getenv("CALENDAR_ID")
-    tz = os.getenv("GCAL_TZ", "Asia/Jerusalem")
-    if not sa_path or not calendar_id:
-        raise RuntimeError("Missing SERVICE_ACCOUNT_FILE or CALENDAR_ID env var")
-    creds = Credentials.from_service_account_file(sa_path, scopes=["https://www.googleapis.com/auth/calendar"])
-    service = build("calendar", "v3", credentials=creds)
-    return GoogleCalendarWrapper(service, calendar_id=calendar_id), tz
+class JobOut(BaseModel):
+    job_id: str
+    status: str
+    result: Optional[MessageOut] = None
+    error: Optional[str] = None
+
+
+def _route(chat_id: Optional[str], calendar_id: Optional[str], pool: "CalendarClientPool") -> str:
+    """The calendar chat_id is routed to; raises UnknownChat or CalendarNotAllowed."""
+    return get_default_router().resolve(chat_id, calendar_id, pool.default_calendar_id)
+
+
+def _route_error(e: Exception) -> Optional[HTTPException]:
+    if isinstance(e, UnknownChat):
+        return HTTPException(404, detail=str(e))
+    if isinstance(e, CalendarNotAllowed):
+        return HTTPException(403, detail=str(e))
+    return None
+
+
+def _shard_key(chat_id: Optional[str], calendar_id: Optional[str]) -> Optional[str]:
+    # Without a chat id, writes to one calendar are ordered among themselves.
+    return chat_id or calendar_id
+
+
+def _submit(request: Request, payload: MessageIn):
+    """Queue payload on its chat's shard; raises UnknownChat/CalendarNotAllowed/QueueFull."""
+    pool = calendar_pool(request.app.state)
+    calendar_id = _route(payload.chat_id, payload.calendar_id, pool) if pool is not None else None
+    return request.app.state.jobs.submit(_shard_key(payload.chat_id, calendar_id),
+                                         partial(handle_message, payload, pool))
+
+
+def handle_message(payload: MessageIn, pool: Optional["CalendarClientPool"]) -> MessageOut:
+    if pool is None:
+        raise RuntimeError(getattr(app.state, "calendars_error", "Calendar pool not initialized"))
+    calendar_id = _route(payload.chat_id, payload.calendar_id, pool)
+    wrapper = pool.get(calendar_id)
+    result = process_message(payload.text, wrapper, pool.tz, mirror=pool.mirror(calendar_id))
+    return MessageOut(**{
+        "kind": result.get("kind"),
+        "name": result.get("name"),
+        "date": str(result.get("date")),
+        "action": result.get("action"),
+        "event_id": result.get("event_id"),
+    })
 
 
 @app.post("/messages", response_model=MessageOut)
-def receive_message(payload: MessageIn):
+def receive_message(payload: MessageIn, request: Request):
+    """Process the message and return the result. It runs on its chat's shard, so it is
+    ordered with the chat's queued messages (POST /messages/async). If it has not finished
+    within MESSAGE_TIMEOUT_SECONDS the response is 504 with the job id; the job still runs
+    and can be polled at GET /jobs/{job_id}.
+    """
+    jobs = getattr(request.app.state, "jobs", None)
     try:
-        wrapper, tz = build_calendar_wrapper()
-        result = process_message(payload.text, wrapper, tz)
-        return MessageOut(**{
-            "kind": result.get("kind"),
-            "name": result.get("name"),
-            "date": str(result.get("date")),
-            "action": result.get("action"),
-            "event_id": result.get("event_id"),
-        })
+        if jobs is None:
+            return handle_message(payload, calendar_pool(request.app.state))
+        job = _submit(request, payload)
+        if not job.wait(MESSAGE_TIMEOUT_SECONDS):
+            raise HTTPException(504, detail={"job_id": job.id, "status": job.status})
+        if job.exception is not None:
+            raise job.exception
+        return job.result
+    except HTTPException:
+        raise
+    except QueueFull as e:
+        raise HTTPException(429, detail=str(e), headers={"Retry-After": "1"})
+    except (UnknownChat, CalendarNotAllowed) as e:
+        raise _route_error(e)
     except Exception as e:
+        if is_retryable(e):
+            # Backend quota still exhausted after retries; nothing was lost, ask the client to retry.
+            raise HTTPException(503, detail=str(e), headers={"Retry-After": "30"})
         raise HTTPException(500, detail=str(e))
+
+
+@app.post("/messages/async", response_model=JobOut, status_code=202)
+def enqueue_message(payload: MessageIn, request: Request):
+    """Accept the message and process it on its chat's shard; poll GET /jobs/{job_id}.
+    Messages of one chat (or, without chat_id, of one calendar) are processed in the order received.
+    """
+    try:
+        job = _submit(request, payload)
+    except (UnknownChat, CalendarNotAllowed) as e:
+        raise _route_error(e)
+    except QueueFull as e:
+        raise HTTPException(429, detail=str(e), headers={"Retry-After": "1"})
+    return JobOut(job_id=job.id, status=job.status)
+
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(job_id: str, request: Request):
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="unknown job id")
+    return JobOut(job_id=job.id, status=job.status, result=job.result, error=job.error)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Prometheus text exposition: stage histograms, LLM/cache/pre-filter/Calendar counters,
+    plus job queue and parse cache gauges read at scrape time.
+    """
+    lines = [render_metrics().rstrip("\n")]
+    jobs = getattr(request.app.state, "jobs", None)
+    if jobs is not None:
+        lines += gauge_lines("chat_sanity_jobs", "Jobs by status; depth is the queue length.", jobs.stats(), "status")
+    lines += gauge_lines("chat_sanity_throttle_concurrency_limit", "Adaptive concurrency limit per backend.",
+                         {name: get_throttle(name).limiter.limit for name in ("gemini", "calendar")}, "backend")
+    cache = get_default_cache()
+    if cache is not None:
+        stats = cache.stats()
+        lines += gauge_lines("chat_sanity_parse_cache_entries", "Entries in the parse cache memory tier.",
+                             {"": stats["memory_entries"]})
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+def _import_items(body: BinaryIO, ndjson: bool, dayfirst: bool) -> Iterator[Dict[str, Any]]:
+    """Yield {'text', 'offset', 'timestamp', 'author'} items from the spooled upload;
+    a malformed NDJSON line yields {'offset', 'error'} instead of ending the stream.
+    """
+    if not ndjson:
+        for message in iter_messages(body, dayfirst=dayfirst):
+            yield {"text": message.text, "offset": message.offset,
+                   "timestamp": message.timestamp, "author": message.author}
+        return
+    offset = 0
+    for line in body:
+        line_offset, offset = offset, offset + len(line)
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            yield {"text": item.get("text", ""), "offset": line_offset,
+                   "timestamp": item.get("timestamp"), "author": item.get("author")}
+        except (ValueError, AttributeError) as e:
+            yield {"offset": line_offset, "error": f"malformed line: {e}"}
+
+
+@app.post("/imports")
+async def import_messages(
+    request: Request,
+    sync: bool = False,
+    calendar_id: Optional[str] = None,
+    chat_id: Optional[str] = None,
+    concurrency: int = IMPORT_CONCURRENCY,
+    dayfirst: bool = False,
+):
+    """Stream a WhatsApp export (text/plain) or NDJSON of {"text": ...} objects through
+    route_and_parse with bounded concurrency; results stream back as NDJSON, one line per
+    message (in completion order, with its index and byte offset). With sync=true events
+    are also written to chat_id's calendar (calendar_id, if given, must be that one), one
+    at a time and in message order on the chat's job shard, so dedup sees earlier writes,
+    an update never overtakes the create it refers to, and concurrent /messages for the
+    same chat do not interleave with the import's writes.
+    """
+    pool = await asyncio.to_thread(calendar_pool, request.app.state) if sync else None
+    if sync and pool is None:
+        raise HTTPException(500, detail=getattr(request.app.state, "calendars_error", "Calendar pool not initialized"))
+    if sync:
+        try:
+            calendar_id = _route(chat_id, calendar_id, pool)
+        except (UnknownChat, CalendarNotAllowed) as e:
+            raise _route_error(e)
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    limit = max(1, concurrency)
+    # Spool the upload (to disk past IMPORT_SPOOL_BYTES) so the response can stream
+    # while the body is parsed lazily, without holding either in memory.
+    body = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    # Parses run concurrently; calendar writes are queued on the shard by message index.
+    jobs = getattr(request.app.state, "jobs", None)
+    shard_key = _shard_key(chat_id, calendar_id)
+    turn = asyncio.Condition()
+    synced = [0]
+
+    async def _one(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        stamp = item.get("timestamp")
+        out: Dict[str, Any] = {
+            "index": index,
+            "offset": item.get("offset"),
+            "timestamp": stamp.isoformat() if isinstance(stamp, datetime) else stamp,
+            "author": item.get("author"),
+        }
+        parsed = None
+        try:
+            if "error" in item:
+                raise ValueError(item["error"])
+            parsed = await route_and_parse_async(item["text"])
+            date = getattr(parsed, "date", None)
+            out.update(kind=getattr(parsed, "kind", "other"), name=getattr(parsed, "name", None),
+                       date=str(date) if date else None, reason=getattr(parsed, "reason", None))
+        except Exception as e:
+            logger.info("import: message {} failed: {}", index, e)
+            out["error"] = str(e)
+        if not sync:
+            return out
+        job = None
+        async with turn:
+            await turn.wait_for(lambda: synced[0] == index)
+            try:
+                if out.get("kind") == "event":
+                    write = partial(sync_event, parsed, pool.get(calendar_id), pool.tz, pool.mirror(calendar_id))
+                    if jobs is None:
+                        out.update(await asyncio.to_thread(write))
+                    else:
+                        job = jobs.submit(shard_key, write)
+            except Exception as e:
+                logger.info("import: message {} failed: {}", index, e)
+                out["error"] = str(e)
+            finally:
+                synced[0] += 1
+                turn.notify_all()
+        if job is not None:
+            # Queued in message order; wait for the write without holding up the next ones.
+            if not await asyncio.to_thread(job.wait, MESSAGE_TIMEOUT_SECONDS):
+                logger.info("import: message {} write still {} after {}s", index, job.status, MESSAGE_TIMEOUT_SECONDS)
+                out.update(error="calendar write timed out", job_id=job.id)
+            elif job.exception is not None:
+                logger.info("import: message {} failed: {}", index, job.exception)
+                out["error"] = str(job.exception)
+            else:
+                out.update(job.result)
+        return out
+
+    async def _results() -> AsyncIterator[bytes]:
+        in_flight: set = set()
+        index = 0
+        for item in _import_items(body, ndjson, dayfirst):
+            if len(in_flight) >= limit:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield (json.dumps(task.result(), ensure_ascii=False) + "\n").encode("utf-8")
+            in_flight.add(asyncio.create_task(_one(index, item)))
+            index += 1
+        for task in asyncio.as_completed(in_flight):
+            yield (json.dumps(await task, ensure_ascii=False) + "\n").encode("utf-8")
+        body.close()
+        logger.info("import: streamed {} messages", index)
+
+    return StreamingResponse(_results(), media_type="application/x-ndjson")
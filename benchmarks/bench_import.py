@@ -0,0 +1,140 @@
+"""Import-time (startup) benchmark: how long a fresh interpreter takes to import each
+entry module, which dependencies dominate, and whether the lazily loaded heavy ones
+(pydantic_ai, the Google SDKs, logfire, python-bidi) stayed unloaded.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --modules agent app --repeat 10 --baseline benchmarks/results/import-base.json
+
+Every measurement runs in a new process with -X importtime. Results are written as
+JSON (default benchmarks/results/import-<utc time>.json); with --baseline the exit
+code is 1 when a module's median import time regressed by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+DEFAULT_MODULES = ["agent", "parse_and_sync_service", "ingest", "app"]
+# Loaded on first use; importing an entry module should not pull these in.
+HEAVY_MODULES = ["pydantic_ai", "google.genai", "googleapiclient", "logfire", "bidi"]
+
+_PROBE = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def _importtime(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """The top entries of a -X importtime report by self time (microseconds)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+        except ValueError:
+            continue
+    return sorted(rows, key=lambda r: r["self_us"], reverse=True)[:top]
+
+
+def profile_import(module: str, repeat: int = 5, top: int = 10) -> Dict[str, Any]:
+    """Import module in repeat fresh interpreters; timings, top self-time imports, heavy modules loaded."""
+    code = _PROBE.format(paths=[str(ROOT), str(ROOT / "logic")], module=module, heavy=HEAVY_MODULES)
+    env = dict(os.environ, PYDANTIC_AI_NO_BANNER="1")
+    # As deployed (docs/deployment.md): logfire's pydantic plugin is only wanted with LOGFIRE=1.
+    env.setdefault("PYDANTIC_DISABLE_PLUGINS", "logfire-plugin")
+    seconds: List[float] = []
+    heavy: List[str] = []
+    slowest: List[Dict[str, Any]] = []
+    for i in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+        probe = json.loads(proc.stdout.strip().splitlines()[-1])
+        seconds.append(probe["seconds"])
+        heavy = probe["heavy"]
+        if i == 0:
+            slowest = _importtime(proc.stderr, top)
+    return {
+        "runs": repeat,
+        "median_ms": 1000 * statistics.median(seconds),
+        "min_ms": 1000 * min(seconds),
+        "max_ms": 1000 * max(seconds),
+        "heavy_loaded": heavy,
+        "slowest": slowest,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, now in current["modules"].items():
+        before = baseline.get("modules", {}).get(name)
+        if before and before["median_ms"] and now["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: median {before['median_ms']:.0f} -> {now['median_ms']:.0f} ms")
+        for heavy in now["heavy_loaded"]:
+            if before and heavy not in before.get("heavy_loaded", []):
+                regressions.append(f"{name}: now imports {heavy} eagerly")
+    return regressions
+
+
+def print_table(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print(f"{'module':<24}{'median ms':>11}{'min ms':>9}{'vs base':>9}  heavy loaded")
+    for name, m in results["modules"].items():
+        base = (baseline or {}).get("modules", {}).get(name)
+        delta = f"{m['median_ms'] / base['median_ms'] - 1:+.0%}" if base and base["median_ms"] else ""
+        print(f"{name:<24}{m['median_ms']:>11.0f}{m['min_ms']:>9.0f}{delta:>9}  {', '.join(m['heavy_loaded']) or '-'}")
+        for row in m["slowest"][:3]:
+            print(f"    {row['module']:<40}{row['self_us'] / 1000:>8.1f} ms self")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="*", default=DEFAULT_MODULES, help="modules to import (flat names)")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to keep per module")
+    parser.add_argument("--out", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, as a fraction")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "modules": {module: profile_import(module, args.repeat, args.top) for module in args.modules},
+    }
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    out = Path(args.out) if args.out else RESULTS_DIR / f"import-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print_table(results, baseline)
+    print(f"results: {out}")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
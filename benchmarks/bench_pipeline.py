@@ -0,0 +1,251 @@
+"""Offline benchmark of the message pipeline: export parsing, pre-filter, rtl, routing
+(with a fake Gemini model), calendar sync (with a fake Calendar) and end-to-end
+process_message.
+
+    python benchmarks/bench_pipeline.py --messages 2000 --llm-latency 0.2
+    python benchmarks/bench_pipeline.py --chat data/chat.txt --baseline benchmarks/results/base.json
+
+Each stage reports throughput, p50/p95/p99/max latency per item and, unless
+--no-memory, the tracemalloc peak of a second pass. Results are written as JSON
+(default benchmarks/results/pipeline-<utc time>.json); with --baseline the run is
+compared against an earlier result and the exit code is 1 on a regression.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "logic", ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# Measure the pipeline itself by default; --cache runs with a fresh parse cache.
+os.environ.setdefault("PARSE_CACHE", "0")
+# The fakes have no quota; set THROTTLE=1 to include client-side rate limiting.
+os.environ.setdefault("THROTTLE", "0")
+os.environ.setdefault("PYDANTIC_AI_NO_BANNER", "1")
+
+from loguru import logger  # noqa: E402
+from agent import route_and_parse, use_model  # noqa: E402
+from calendar_mirror import CalendarMirror  # noqa: E402
+from google_wrapper import GoogleCalendarWrapper  # noqa: E402
+from parse_and_sync_service import process_message, sync_event  # noqa: E402
+from parse_cache import ParseCache  # noqa: E402
+from prefilter import PreFilter  # noqa: E402
+from utils.utils import _rtl_cached, rtl  # noqa: E402
+from utils.whatsapp_export import ChatMessage, iter_messages  # noqa: E402
+from fakes import FakeCalendarService, fake_model, synthetic_chat  # noqa: E402
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+TZ = "Asia/Jerusalem"
+
+# A stage builds fresh state and returns (items, fn); fn(item) is timed per item.
+Stage = Callable[[], Tuple[List[Any], Callable[[Any], Any]]]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100) of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def _timed(items: Iterable[Any], fn: Callable[[Any], Any]) -> Tuple[List[float], float]:
+    durations = []
+    started = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - t)
+    return durations, time.perf_counter() - started
+
+
+def run_stage(stage: Stage, memory: bool = True) -> Dict[str, float]:
+    items, fn = stage()
+    durations, total = _timed(items, fn)
+    ordered = sorted(durations)
+    out = {
+        "count": len(durations),
+        "total_seconds": total,
+        "throughput_per_s": len(durations) / total if total else 0.0,
+        "mean_ms": 1000 * sum(durations) / len(durations) if durations else 0.0,
+        "p50_ms": 1000 * percentile(ordered, 50),
+        "p95_ms": 1000 * percentile(ordered, 95),
+        "p99_ms": 1000 * percentile(ordered, 99),
+        "max_ms": 1000 * ordered[-1] if ordered else 0.0,
+    }
+    if memory:
+        # Separate pass: tracemalloc slows allocation-heavy code too much to time it.
+        items, fn = stage()
+        tracemalloc.start()
+        try:
+            for item in items:
+                fn(item)
+            out["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+    return out
+
+
+def load_messages(chats: List[str], messages: int, seed: int, dayfirst: bool) -> Tuple[List[bytes], List[ChatMessage]]:
+    raw = [Path(p).read_bytes() for p in chats] or [synthetic_chat(messages, seed=seed).encode("utf-8")]
+    parsed = [m for data in raw for m in iter_messages(io.BytesIO(data), dayfirst=dayfirst)]
+    return raw, parsed
+
+
+def build_stages(raw: List[bytes], messages: List[ChatMessage], args: argparse.Namespace) -> Dict[str, Stage]:
+    texts = [m.text for m in messages]
+
+    def _cache() -> Optional[ParseCache]:
+        return ParseCache() if args.cache else None
+
+    def _calendar() -> Tuple[FakeCalendarService, GoogleCalendarWrapper, Optional[CalendarMirror]]:
+        service = FakeCalendarService(latency_seconds=args.calendar_latency)
+        wrapper = GoogleCalendarWrapper(service, calendar_id="bench")
+        return service, wrapper, CalendarMirror(wrapper) if args.mirror else None
+
+    def export():
+        # One item per export file; the per-message rate is in the summary line.
+        return raw, lambda data: sum(1 for _ in iter_messages(io.BytesIO(data), dayfirst=args.dayfirst))
+
+    def prefilter():
+        pf = PreFilter()
+        return texts, pf.check
+
+    def rtl_stage():
+        _rtl_cached.cache_clear()
+        return texts, rtl
+
+    def route():
+        cache = _cache()
+        return texts, lambda text: route_and_parse(text, cache=cache)
+
+    events: List[Any] = []
+
+    def sync():
+        if not events:
+            parsed = (route_and_parse(t) for t in texts)
+            events.extend(p for p in parsed if getattr(p, "kind", None) == "event")
+        _, wrapper, mirror = _calendar()
+        return events, lambda event: sync_event(event, wrapper, TZ, mirror=mirror)
+
+    def e2e():
+        _, wrapper, mirror = _calendar()
+        return texts, lambda text: process_message(text, wrapper, TZ, mirror=mirror)
+
+    return {"export": export, "prefilter": prefilter, "rtl": rtl_stage, "route": route, "sync": sync, "e2e": e2e}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    model = fake_model(latency_seconds=args.llm_latency, jitter_seconds=args.llm_jitter, seed=args.seed)
+    raw, messages = load_messages(args.chat, args.messages, args.seed, args.dayfirst)
+    results: Dict[str, Any] = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "git": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "messages": len(messages),
+            "bytes": sum(len(r) for r in raw),
+            "chats": args.chat or ["synthetic"],
+            "llm_latency": args.llm_latency,
+            "llm_jitter": args.llm_jitter,
+            "calendar_latency": args.calendar_latency,
+            "mirror": args.mirror,
+            "cache": args.cache,
+        },
+        "stages": {},
+    }
+    with use_model(model):
+        stages = build_stages(raw, messages, args)
+        for name in args.stages or list(stages):
+            results["stages"][name] = run_stage(stages[name], memory=not args.no_memory)
+            logger.info("bench: {} {}", name, results["stages"][name])
+    export = results["stages"].get("export")
+    if export and export["total_seconds"]:
+        results["meta"]["export_messages_per_s"] = len(messages) / export["total_seconds"]
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions: throughput down, or p95 up, by more than tolerance (a fraction)."""
+    regressions = []
+    for name, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            continue
+        if before["throughput_per_s"] and now["throughput_per_s"] < before["throughput_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_per_s']:.1f} -> {now['throughput_per_s']:.1f}/s")
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {now['p95_ms']:.2f} ms")
+    return regressions
+
+
+def print_table(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print(f"{'stage':<10}{'items':>8}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}{'vs base':>10}")
+    for name, s in results["stages"].items():
+        base = (baseline or {}).get("stages", {}).get(name)
+        delta = f"{s['throughput_per_s'] / base['throughput_per_s'] - 1:+.0%}" if base and base["throughput_per_s"] else ""
+        peak = f"{s['peak_kib']:.0f}" if "peak_kib" in s else "-"
+        print(f"{name:<10}{s['count']:>8}{s['throughput_per_s']:>12.1f}{s['p50_ms']:>10.2f}"
+              f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{peak:>11}{delta:>10}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chat", action="append", default=[], help="WhatsApp export to replay (repeatable)")
+    parser.add_argument("--messages", type=int, default=1000, help="synthetic messages when no --chat is given")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dayfirst", action="store_true", help="export dates are day/month")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="fake model latency per call, seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="extra uniform random latency, seconds")
+    parser.add_argument("--calendar-latency", type=float, default=0.0, help="fake Calendar latency per request, seconds")
+    parser.add_argument("--mirror", action="store_true", help="dedup against a CalendarMirror instead of events.list")
+    parser.add_argument("--cache", action="store_true", help="route through a fresh in-memory parse cache")
+    parser.add_argument("--stages", nargs="*", help="subset of: export prefilter rtl route sync e2e")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, as a fraction")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own logging")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logger.remove()
+    results = run(args)
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    out = Path(args.out) if args.out else RESULTS_DIR / f"pipeline-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print_table(results, baseline)
+    print(f"results: {out}")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
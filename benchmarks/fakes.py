@@ -0,0 +1,314 @@
+"""Deterministic stand-ins for Gemini and Google Calendar, for offline benchmarks.
+
+FakeCalendarService mimics the parts of the Calendar v3 client this repo uses
+(events().insert/get/patch/delete/list with sync tokens, new_batch_http_request).
+fake_model() is a pydantic_ai FunctionModel that answers with canned Parsed outputs
+after a configurable latency.
+"""
+import asyncio
+import copy
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+
+class FakeResp:
+    def __init__(self, status: int) -> None:
+        self.status = status
+
+
+class FakeHttpError(Exception):
+    """Carries resp.status like googleapiclient.errors.HttpError."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"{status}: {message}")
+        self.resp = FakeResp(status)
+
+
+class FakeRequest:
+    """method, uri and body like googleapiclient's HttpRequest (the cassette keys on them)."""
+
+    def __init__(self, service: "FakeCalendarService", fn: Callable[["FakeRequest"], Any], method: str = "GET",
+                 path: str = "", params: Optional[Dict[str, Any]] = None, body: Optional[dict] = None) -> None:
+        self.service = service
+        self.fn = fn
+        self.headers: Dict[str, str] = {}
+        self.method = method
+        self.uri = f"https://fake.calendar/{path}?{urlencode(sorted((params or {}).items()))}"
+        self.body = json.dumps(body, ensure_ascii=False, sort_keys=True) if body is not None else None
+
+    def execute(self) -> Any:
+        self.service._wait()
+        return self.fn(self)
+
+
+class FakeBatch:
+    """One HTTP round trip (one latency wait) for all added requests."""
+
+    def __init__(self, service: "FakeCalendarService") -> None:
+        self.service = service
+        self.items: List[tuple] = []
+
+    def add(self, request: FakeRequest, callback: Optional[Callable] = None, request_id: Optional[str] = None) -> None:
+        self.items.append((request, callback, request_id))
+
+    def execute(self) -> None:
+        self.service._wait()
+        self.service.calls["batch"] += 1
+        for request, callback, request_id in self.items:
+            try:
+                response, error = request.fn(request), None
+            except Exception as e:
+                response, error = None, e
+            if callback is not None:
+                callback(request_id, response, error)
+
+
+def _start_key(item: Dict[str, Any]) -> str:
+    start = item.get("start") or {}
+    return start.get("dateTime") or start.get("date") or ""
+
+
+def _to_utc(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=datetime.now().astimezone().tzinfo)
+
+
+class FakeEvents:
+    def __init__(self, service: "FakeCalendarService") -> None:
+        self.service = service
+
+    def insert(self, calendarId: str, body: dict) -> FakeRequest:
+        return FakeRequest(self.service, lambda r: self.service._insert(body), "POST", f"{calendarId}/events",
+                           body=body)
+
+    def get(self, calendarId: str, eventId: str) -> FakeRequest:
+        return FakeRequest(self.service, lambda r: self.service._get(eventId), "GET", f"{calendarId}/events/{eventId}")
+
+    def patch(self, calendarId: str, eventId: str, body: dict) -> FakeRequest:
+        return FakeRequest(self.service, lambda r: self.service._patch(eventId, body, r.headers.get("If-Match")),
+                           "PATCH", f"{calendarId}/events/{eventId}", body=body)
+
+    def delete(self, calendarId: str, eventId: str) -> FakeRequest:
+        return FakeRequest(self.service, lambda r: self.service._delete(eventId), "DELETE",
+                           f"{calendarId}/events/{eventId}")
+
+    def list(self, calendarId: str, **params: Any) -> FakeRequest:
+        return FakeRequest(self.service, lambda r: self.service._list(**params), "GET", f"{calendarId}/events",
+                           params=params)
+
+
+class FakeCalendarService:
+    """In-memory calendar; every execute() sleeps latency_seconds to model the HTTP round trip."""
+
+    def __init__(self, latency_seconds: float = 0.0, page_size: int = 250) -> None:
+        self.latency_seconds = latency_seconds
+        self.page_size = page_size
+        self.calls: Dict[str, int] = {"insert": 0, "get": 0, "patch": 0, "delete": 0, "list": 0, "batch": 0}
+        self._lock = threading.Lock()
+        self._events: Dict[str, Dict[str, Any]] = {}
+        # Sequence number of the last change to each event, for syncToken lists.
+        self._changed: Dict[str, int] = {}
+        self._seq = 0
+
+    def events(self) -> FakeEvents:
+        return FakeEvents(self)
+
+    def new_batch_http_request(self, callback: Optional[Callable] = None) -> FakeBatch:
+        return FakeBatch(self)
+
+    def _wait(self) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _touch(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self._seq += 1
+        event["etag"] = f'"{self._seq}"'
+        self._changed[event["id"]] = self._seq
+        return copy.deepcopy(event)
+
+    def _insert(self, body: dict) -> dict:
+        with self._lock:
+            self.calls["insert"] += 1
+            event = dict(copy.deepcopy(body), id=f"evt{len(self._events) + 1}", status="confirmed")
+            self._events[event["id"]] = event
+            return self._touch(event)
+
+    def _live(self, event_id: str) -> Dict[str, Any]:
+        event = self._events.get(event_id)
+        if event is None or event.get("status") == "cancelled":
+            raise FakeHttpError(404, f"event {event_id} not found")
+        return event
+
+    def _get(self, event_id: str) -> dict:
+        with self._lock:
+            self.calls["get"] += 1
+            return copy.deepcopy(self._live(event_id))
+
+    def _patch(self, event_id: str, body: dict, if_match: Optional[str]) -> dict:
+        with self._lock:
+            self.calls["patch"] += 1
+            event = self._live(event_id)
+            if if_match and if_match != event.get("etag"):
+                raise FakeHttpError(412, "precondition failed")
+            event.update(copy.deepcopy(body))
+            return self._touch(event)
+
+    def _delete(self, event_id: str) -> None:
+        with self._lock:
+            self.calls["delete"] += 1
+            event = self._live(event_id)
+            event["status"] = "cancelled"
+            self._touch(event)
+            return None
+
+    def _list(self, syncToken: Optional[str] = None, showDeleted: bool = False, pageToken: Optional[str] = None,
+              timeMin: Optional[str] = None, timeMax: Optional[str] = None, q: Optional[str] = None,
+              maxResults: Optional[int] = None, **_: Any) -> dict:
+        with self._lock:
+            self.calls["list"] += 1
+            since = int(syncToken) if syncToken else 0
+            items = []
+            for event_id, event in self._events.items():
+                if self._changed[event_id] <= since:
+                    continue
+                if event.get("status") == "cancelled" and not (showDeleted or syncToken):
+                    continue
+                if q and not any(q.casefold() in (event.get(f) or "").casefold()
+                                 for f in ("summary", "description", "location")):
+                    continue
+                start = _start_key(event)
+                if timeMin and (not start or _to_utc(start) < _to_utc(timeMin)):
+                    continue
+                if timeMax and (not start or _to_utc(start) >= _to_utc(timeMax)):
+                    continue
+                items.append(event)
+            timed = sorted((e for e in items if _start_key(e)), key=lambda e: _to_utc(_start_key(e)))
+            items = timed + [e for e in items if not _start_key(e)]
+            size = min(maxResults or self.page_size, self.page_size)
+            first = int(pageToken or 0)
+            page = {"items": [copy.deepcopy(e) for e in items[first:first + size]]}
+            if first + size < len(items):
+                page["nextPageToken"] = str(first + size)
+            else:
+                page["nextSyncToken"] = str(self._seq)
+            return page
+
+
+# Canned classification: the fake model answers like Gemini would for the synthetic chat.
+_LINK_RE = re.compile(r"https?://\S+")
+_PAY_RE = re.compile(r"paybox|bitpay|\bbit\b|תשלום", re.IGNORECASE)
+_TIME_RE = re.compile(r"(?<!\d)(\d{1,2}):(\d{2})(?!\d)")
+_DATE_RE = re.compile(r"(?<!\d)(\d{1,2})[/.](\d{1,2})(?!\d)")
+
+
+def canned_output(text: str, base_date: datetime) -> Dict[str, Any]:
+    """Event/Task/Other payload for text, derived only from the text (deterministic)."""
+    first_line = next((line.strip() for line in (text or "").splitlines() if line.strip()), "")
+    name = first_line[:60] or "?"
+    date = base_date
+    d = _DATE_RE.search(text or "")
+    if d:
+        try:
+            date = date.replace(day=int(d.group(1)), month=int(d.group(2)))
+        except ValueError:
+            pass
+    link = _LINK_RE.search(text or "")
+    if link and _PAY_RE.search(text or ""):
+        return {"kind": "task", "name": name, "description": text, "date": date.isoformat(), "link": link.group(0)}
+    t = _TIME_RE.search(text or "")
+    if t and int(t.group(1)) < 24 and int(t.group(2)) < 60:
+        date = date.replace(hour=int(t.group(1)), minute=int(t.group(2)), second=0, microsecond=0)
+        return {"kind": "event", "name": name, "description": text, "date": date.isoformat(), "location": "גן"}
+    return {"kind": "other", "original_message": text, "reason": "no date or payment link"}
+
+
+def _prompt(messages: List[ModelMessage]) -> str:
+    for part in messages[-1].parts:
+        if isinstance(part, UserPromptPart) and isinstance(part.content, str):
+            return part.content
+    return ""
+
+
+def fake_model(
+    latency_seconds: float = 0.0,
+    jitter_seconds: float = 0.0,
+    base_date: datetime = datetime(2025, 9, 1, 9, 0),
+    seed: int = 0,
+) -> FunctionModel:
+    """FunctionModel for agent.use_model(...).
+
+    Single prompts get one Event/Task/Other tool call; batch prompts (a JSON list of
+    messages) get a BatchOutput with one result per id.
+    """
+    rng = random.Random(seed)
+
+    async def respond(messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+        delay = latency_seconds + (rng.uniform(0, jitter_seconds) if jitter_seconds else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        prompt = _prompt(messages)
+        tools = [t.name for t in info.output_tools]
+        if len(tools) == 1:
+            batch = json.loads(prompt)
+            results = []
+            for m in batch:
+                stamp = datetime.fromisoformat(m["timestamp"]) if m.get("timestamp") else base_date
+                results.append({"id": m["id"], "result": canned_output(m["text"], stamp)})
+            return ModelResponse(parts=[ToolCallPart(tools[0], {"results": results})])
+        payload = canned_output(prompt, base_date)
+        tool = next(n for n in tools if n.lower().endswith(payload["kind"]))
+        return ModelResponse(parts=[ToolCallPart(tool, payload)])
+
+    return FunctionModel(respond)
+
+
+_ANNOUNCEMENTS = [
+    "שימו לב - מחר אסיפת הורים ב{hh}:{mm}",
+    "תזכורת: מסיבת סוכות בגן ביום רביעי {d}/{m} בשעה {hh}:{mm}, נא להגיע בלבן",
+    "Parents meeting on {d}/{m} at {hh}:{mm} in the school hall",
+    "❣️נשמח לראותכם {d}/{m} בשעה {hh}:{mm} (בגן) <This message was edited>",
+    "יום הולדת לנועה ב{d}/{m} {hh}:{mm}\nמביאים כיבוד קל 🎂",
+]
+_PAYMENTS = [
+    "הורים יקרים, תשלום לקופת גן 50 ש״ח בפייבוקס https://links.payboxapp.com/{n}",
+    "Please pay for the trip via bit https://www.bitpay.co.il/app/share-info?i={n}",
+]
+_CHATTER = [
+    "תודה רבה!", "👍", "מישהו יודע אם מחר יש צהרון?", "<Media omitted>", "אמן", "Thanks!",
+    "בוקר טוב לכולם ☀️", "מי שכח כובע כחול בגן?", "הילדים נהנו מאוד היום ❤️\nתודה לצוות",
+]
+_AUTHORS = ["Dana", "Yossi", "Olesya", "מיכל", "אבי", "+972 50-123-4567"]
+
+
+def synthetic_chat(messages: int = 1000, seed: int = 42, start: datetime = datetime(2025, 9, 1, 8, 0),
+                   long_every: int = 50) -> str:
+    """Android-format WhatsApp export with a realistic mix of chatter, events and payments."""
+    rng = random.Random(seed)
+    lines = []
+    stamp = start
+    for n in range(messages):
+        stamp += timedelta(minutes=rng.randint(1, 180))
+        roll = rng.random()
+        if roll < 0.15:
+            when = stamp + timedelta(days=rng.randint(0, 14))
+            text = rng.choice(_ANNOUNCEMENTS).format(
+                d=when.day, m=when.month, hh=f"{rng.choice([8, 10, 16, 17, 20]):02d}", mm=rng.choice(["00", "30"]))
+        elif roll < 0.22:
+            text = rng.choice(_PAYMENTS).format(n=n)
+        else:
+            text = rng.choice(_CHATTER)
+        if long_every and n % long_every == long_every - 1:
+            text = "\n".join([text] + [rng.choice(_CHATTER) for _ in range(30)])
+        lines.append(f"{stamp.month}/{stamp.day}/{stamp.year % 100}, {stamp:%H:%M} - {rng.choice(_AUTHORS)}: {text}")
+        if n == 0:
+            lines.insert(0, f"{stamp.month}/{stamp.day}/{stamp.year % 100}, {stamp:%H:%M} - "
+                            "Messages and calls are end-to-end encrypted.")
+    return "\n".join(lines) + "\n"
@@ -1,25 +1,42 @@
-from pydantic_ai import Agent, BinaryContent
+import asyncio
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from functools import lru_cache
 from dotenv import load_dotenv
-import logfire
 from dataclasses import dataclass
 from datetime import datetime
-from pydantic_ai.providers.google import GoogleProvider
-from pydantic_ai.models.google import GoogleModel
-from typing import Annotated, Literal
-from pydantic import BaseModel, Field
+from typing import TYPE_CHECKING, Annotated, Iterator, Literal
+from pydantic import BaseModel, Field, TypeAdapter
 from loguru import logger
 from pathlib import Path
+from zoneinfo import ZoneInfo
 from utils.utils import rtl
+from utils.images import PreparedImage, prepare_image, thumbnail_diff
+from parse_cache import ParseCache, get_default_cache, text_key, image_key
+from prefilter import PreFilter, get_default_prefilter
+import metrics
+from throttle import get_throttle, is_retryable
+from cassette import get_cassette
+from compact import estimate_tokens, get_default_compactor
+from text_patterns import has_absolute_date
 
-load_dotenv()
-
-# provider = GoogleProvider(vertexai=True, api_key=os.getenv('GOOGLE_API_KEY'))
+if TYPE_CHECKING:
+    # pydantic_ai (and the provider SDK behind it) takes seconds to import; it is loaded on first use.
+    from pydantic_ai import Agent
+    from pydantic_ai.models import Model
 
+load_dotenv()
 
-# logfire.configure()  
-# logfire.instrument_pydantic_ai()  
-# logfire.instrument_asyncpg()  
-model = GoogleModel('gemini-2.5-flash')
+# Any pydantic-ai provider ("google", "google-vertex", "openai", ...) and model name.
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'google')
+MODEL_NAME = os.getenv('LLM_MODEL', 'gemini-2.5-flash')
+MODEL_ID = f'{LLM_PROVIDER}:{MODEL_NAME}'
+# "Today" for messages with relative dates (מחר, ביום רביעי), when they carry no timestamp.
+LOCAL_TZ = os.getenv('GCAL_TZ', 'Asia/Jerusalem')
+# Bump whenever the instructions or output schema change, so cached parses are not reused.
+PROMPT_VERSION = '1'
 
 # RTL helpers for proper Hebrew rendering in consoles without bidi support
 RLI = "\u2067"  # Right-to-Left isolate
@@ -49,28 +66,227 @@ class Other(BaseModel):
 
 # Discriminated union for parsed outputs
 Parsed = Annotated[Event | Task | Other, Field(discriminator='kind')]
+_parsed_adapter = TypeAdapter(Parsed)
 
-def parse_event_picture(path: str):
-    """Parse an event image file (jpg/png) and return an Event.
-    Args:
-        path (str): Path to the image file.
+
+class BatchMessage(BaseModel):
+    id: str
+    text: str
+    timestamp: datetime | None = None
+
+
+class BatchItem(BaseModel):
+    id: str
+    result: Parsed
+
+
+class BatchOutput(BaseModel):
+    results: list[BatchItem]
+
+_batch_adapter = TypeAdapter(BatchOutput)
+
+PICTURE_INSTRUCTIONS = (
+    "Decide whether the image is an event announcement/flyer or not. "
+    "If it's an event, return kind='event' with name, description, date, location. "
+    "If it's not an event, return kind='other' with original_message set to the image path and a brief reason. "
+    "If in Hebrew, do not translate and do not mix English and Hebrew."
+)
+
+TEXT_INSTRUCTIONS = (
+    "Decide whether the input describes an event or a task. "
+    "Return a JSON object with a 'kind' field set to 'event' or 'task'. "
+    "If it's an event, include: name, description, date, location. "
+    "If it's a task, include: name, description, date, link. "
+    "Task usually will have link to paybox or bit, but doesn't must to have a date" 
+    "If date not specified, set to message date and time"
+    "If neither, return kind='other' with original_message and a brief reason. "
+    "Set original_message to the raw input text. "
+    "If in Hebrew, do not translate and do not mix English and Hebrew."
+)
+
+BATCH_INSTRUCTIONS = (
+    "The input is a JSON list of chat messages, each with an id, a timestamp and a text. "
+    "Classify every message independently and return one entry in 'results' per message, "
+    "with the same id and a 'result' that follows these rules: "
+    + TEXT_INSTRUCTIONS
+    + " Use the message's own timestamp as the message date and time. "
+    "Never merge, drop or invent ids."
+)
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+
+# Rough input budget per batched request, and a cap on results per request
+# (output tokens grow with every message in the batch).
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "6000"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "25"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Max differing bits between perceptual hashes for two images to be compared as the same flyer,
+# and the max per-pixel difference of their thumbnails for them to count as one.
+IMAGE_PHASH_DISTANCE = int(os.getenv("IMAGE_PHASH_DISTANCE", "6"))
+IMAGE_THUMB_DIFF = int(os.getenv("IMAGE_THUMB_DIFF", "16"))
+
+
+_model_override: "Model | None" = None
+
+
+@lru_cache(maxsize=None)
+def _build_model() -> "Model":
+    from pydantic_ai.models import infer_model
+
+    with metrics.STAGE_SECONDS.time("model_build"):
+        if os.getenv('LOGFIRE', '0') == '1':
+            import logfire
+            logfire.configure()
+            logfire.instrument_pydantic_ai()
+        logger.info("agent: model {}", MODEL_ID)
+        return infer_model(MODEL_ID)
+
+
+def get_model() -> "Model":
+    """The model agent runs use: the one installed by use_model(), else LLM_PROVIDER:LLM_MODEL
+    (the client is created on the first call, so importing this module needs no API key).
     """
-    logger.info("parse_event_picture: parsing image at path={}", path)
-    with open(path, 'rb') as f:
-        image_bytes = f.read()
-
-    agent = Agent(  
-    model=model,
-    instructions=(
-        "Decide whether the image is an event announcement/flyer or not. "
-        "If it's an event, return kind='event' with name, description, date, location. "
-        "If it's not an event, return kind='other' with original_message set to the image path and a brief reason. "
-        "If in Hebrew, do not translate and do not mix English and Hebrew."
-    ),
-    output_type=Parsed
+    return _model_override if _model_override is not None else _build_model()
+
+
+@contextmanager
+def use_model(model: "Model") -> Iterator["Model"]:
+    """Run every agent against model (e.g. a FunctionModel in tests and benchmarks)."""
+    global _model_override
+    previous, _model_override = _model_override, model
+    try:
+        yield model
+    finally:
+        _model_override = previous
+
+
+# Agents are built without a model; each run passes get_model().
+@lru_cache(maxsize=None)
+def get_picture_agent() -> "Agent":
+    """Return the process-wide agent used for event pictures (built on first use)."""
+    from pydantic_ai import Agent
+
+    with metrics.STAGE_SECONDS.time("agent_build"):
+        return Agent(instructions=PICTURE_INSTRUCTIONS, output_type=Parsed)
+
+
+@lru_cache(maxsize=None)
+def get_text_agent() -> "Agent":
+    """Return the process-wide agent used for free text (built on first use)."""
+    from pydantic_ai import Agent
+
+    with metrics.STAGE_SECONDS.time("agent_build"):
+        return Agent(instructions=TEXT_INSTRUCTIONS, output_type=Parsed)
+
+
+@lru_cache(maxsize=None)
+def get_batch_agent() -> "Agent":
+    """Return the process-wide agent that classifies many messages per request."""
+    from pydantic_ai import Agent
+
+    with metrics.STAGE_SECONDS.time("agent_build"):
+        return Agent(instructions=BATCH_INSTRUCTIONS, output_type=BatchOutput)
+
+
+def _record_usage(agent_name: str, result) -> None:
+    metrics.LLM_REQUESTS.inc(agent_name, "ok")
+    try:
+        usage = result.usage() if callable(result.usage) else result.usage  # method before pydantic-ai 2
+        metrics.LLM_TOKENS.inc(agent_name, "input", value=usage.input_tokens or 0)
+        metrics.LLM_TOKENS.inc(agent_name, "output", value=usage.output_tokens or 0)
+    except Exception:
+        pass
+
+
+@dataclass
+class _Usage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass
+class _ReplayedRun:
+    """Stands in for an AgentRunResult served from the cassette."""
+    output: object
+    usage: _Usage
+
+
+def _tape(agent_name: str, prompt) -> dict:
+    """cassette.call() arguments for an agent run: the request key covers model, prompt
+    version and prompt (images by content hash); the input (for diffs) only the prompt.
+    """
+    if isinstance(prompt, str):
+        content, label = prompt, prompt[:80]
+    else:
+        content = [
+            {"media_type": p.media_type, "sha256": hashlib.sha256(p.data).hexdigest()} if hasattr(p, "data") else str(p)
+            for p in prompt
+        ]
+        label = f"<{agent_name} {content[0]['sha256'][:12]}>" if content and isinstance(content[0], dict) else str(content)[:80]
+    adapter = _batch_adapter if agent_name == "batch" else _parsed_adapter
+
+    def encode(result) -> dict:
+        try:
+            usage = result.usage() if callable(result.usage) else result.usage
+            tokens = {"input_tokens": usage.input_tokens or 0, "output_tokens": usage.output_tokens or 0}
+        except Exception:
+            tokens = {}
+        return {"output": adapter.dump_python(result.output, mode="json"), "usage": tokens}
+
+    def decode(payload: dict) -> _ReplayedRun:
+        return _ReplayedRun(adapter.validate_python(payload["output"]), _Usage(**payload.get("usage", {})))
+
+    return dict(
+        request={"agent": agent_name, "model": MODEL_NAME, "prompt_version": PROMPT_VERSION, "prompt": content},
+        input=[agent_name, content],
+        label=label,
+        encode=encode,
+        decode=decode,
     )
-    result = agent.run_sync([BinaryContent(image_bytes, media_type='image/jpeg')])
-    out = result.output
+
+
+def _run_agent(agent_name: str, agent: "Agent", prompt):
+    """agent.run_sync(prompt) under the Gemini throttle, timed and counted under llm_<agent_name>.
+    With a cassette (CASSETTE=record|replay) the run is recorded, or served from the recording.
+    """
+    cassette = get_cassette()
+
+    def run():
+        # The model is resolved only for a live call: replaying needs no provider or API key.
+        return get_throttle("gemini").call(agent.run_sync, prompt, model=get_model())
+
+    try:
+        with metrics.STAGE_SECONDS.time(f"llm_{agent_name}"):
+            result = cassette.call("llm", run, **_tape(agent_name, prompt)) if cassette else run()
+    except Exception:
+        metrics.LLM_REQUESTS.inc(agent_name, "error")
+        raise
+    _record_usage(agent_name, result)
+    return result
+
+
+async def _run_agent_async(agent_name: str, agent: "Agent", prompt):
+    cassette = get_cassette()
+
+    async def run():
+        return await get_throttle("gemini").call_async(agent.run, prompt, model=get_model())
+
+    try:
+        with metrics.STAGE_SECONDS.time(f"llm_{agent_name}"):
+            result = await (cassette.call_async("llm", run, **_tape(agent_name, prompt)) if cassette else run())
+    except Exception:
+        metrics.LLM_REQUESTS.inc(agent_name, "error")
+        raise
+    _record_usage(agent_name, result)
+    return result
+
+
+def _read_image(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _finish_picture(out, path: str):
     # Ensure original_message for 'other' and 'event' carries source path
     if getattr(out, 'original_message', None) is None:
         try:
@@ -81,32 +297,18 @@ def parse_event_picture(path: str):
         logger.info("parse_event_picture: event name='{}' date={} location='{}'", getattr(out, 'name', None), getattr(out, 'date', None), getattr(out, 'location', None))
     else:
         logger.info("parse_event_picture: other reason='{}'", getattr(out, 'reason', None))
-    return out  
+    return out
 
 
-def parse_text(text: str):
-    """Parse free text into Event or Task; if neither, return Other.
-    """
-    logger.info("parse_text: parsing text (len={})", len(text) if text else 0)
-    agent = Agent(  
-    model=model,
-    instructions=(
-        "Decide whether the input describes an event or a task. "
-        "Return a JSON object with a 'kind' field set to 'event' or 'task'. "
-        "If it's an event, include: name, description, date, location. "
-        "If it's a task, include: name, description, date, link. "
-        "Task usually will have link to paybox or bit, but doesn't must to have a date" 
-        "If date not specified, set to message date and time"
-        "If neither, return kind='other' with original_message and a brief reason. "
-        "Set original_message to the raw input text. "
-        "If in Hebrew, do not translate and do not mix English and Hebrew."
-    ),
-    output_type=Parsed
-    )
-    result = agent.run_sync(text or "")
-    out = result.output
-    # Ensure original_message is set even if model omits it
-    if getattr(out, 'original_message', None) is None:
+def _compact(text: str) -> str:
+    compactor = get_default_compactor()
+    return compactor(text) if compactor else text
+
+
+def _finish_text(out, text: str, compacted: bool = False):
+    # Ensure original_message is set even if model omits it, and is the full text when
+    # the model only saw a compacted prompt.
+    if getattr(out, 'original_message', None) is None or compacted:
         try:
             out.original_message = text
         except Exception:
@@ -115,52 +317,428 @@ def parse_text(text: str):
     return out
 
 
-def route_and_parse(user_input: str) -> Parsed:
-    """Pure-Python router: if input is an existing image path -> parse_event_picture; else -> parse_text.
-    Returns Event | Task | Other.
+def _prepare(image_bytes: bytes, path: str) -> PreparedImage:
+    prepared = prepare_image(image_bytes)
+    logger.info("parse_event_picture: prepared path={} type={} bytes {} -> {}", path, prepared.media_type, prepared.original_size, len(prepared.data))
+    return prepared
+
+
+def parse_event_picture(path: str):
+    """Parse an event image file (jpg/png/webp) and return an Event.
+    The image is downscaled/re-encoded first (see utils.images.prepare_image).
+    Args:
+        path (str): Path to the image file.
     """
-    logger.info("route_and_parse: routing input='{}'", user_input)
-    def _apply_rtl(x):
-        try:
-            k = getattr(x, 'kind', None)
-            if k == 'event':
-                if getattr(x, 'name', None):
-                    x.name = rtl(x.name)
-                if getattr(x, 'description', None):
-                    x.description = rtl(x.description)
-                if getattr(x, 'location', None):
-                    x.location = rtl(x.location)
-            elif k == 'task':
-                if getattr(x, 'name', None):
-                    x.name = rtl(x.name)
-                if getattr(x, 'description', None):
-                    x.description = rtl(x.description)
-        except Exception:
-            pass
-        return x
-    p = None
+    logger.info("parse_event_picture: parsing image at path={}", path)
+    return _parse_prepared(_prepare(_read_image(path), path), path)
+
+
+def _image_prompt(prepared: PreparedImage) -> list:
+    from pydantic_ai import BinaryContent
+
+    return [BinaryContent(prepared.data, media_type=prepared.media_type)]
+
+
+def _parse_prepared(prepared: PreparedImage, path: str):
+    result = _run_agent("picture", get_picture_agent(), _image_prompt(prepared))
+    return _finish_picture(result.output, path)
+
+
+async def parse_event_picture_async(path: str):
+    """Async variant of parse_event_picture; file reading and resizing run off the event loop."""
+    logger.info("parse_event_picture_async: parsing image at path={}", path)
+    image_bytes = await asyncio.to_thread(_read_image, path)
+    return await _parse_prepared_async(await asyncio.to_thread(_prepare, image_bytes, path), path)
+
+
+async def _parse_prepared_async(prepared: PreparedImage, path: str):
+    result = await _run_agent_async("picture", get_picture_agent(), _image_prompt(prepared))
+    return _finish_picture(result.output, path)
+
+
+def parse_text(text: str):
+    """Parse free text into Event or Task; if neither, return Other.
+    """
+    logger.info("parse_text: parsing text (len={})", len(text) if text else 0)
+    prompt = _compact(text or "")
+    result = _run_agent("text", get_text_agent(), prompt)
+    return _finish_text(result.output, text, prompt != (text or ""))
+
+
+async def parse_text_async(text: str):
+    """Async variant of parse_text, for running many LLM calls on one event loop.
+    """
+    logger.info("parse_text_async: parsing text (len={})", len(text) if text else 0)
+    prompt = _compact(text or "")
+    result = await _run_agent_async("text", get_text_agent(), prompt)
+    return _finish_text(result.output, text, prompt != (text or ""))
+
+
+@metrics.timed("rtl")
+def _apply_rtl(x):
+    try:
+        k = getattr(x, 'kind', None)
+        if k == 'event':
+            if getattr(x, 'name', None):
+                x.name = rtl(x.name)
+            if getattr(x, 'description', None):
+                x.description = rtl(x.description)
+            if getattr(x, 'location', None):
+                x.location = rtl(x.location)
+        elif k == 'task':
+            if getattr(x, 'name', None):
+                x.name = rtl(x.name)
+            if getattr(x, 'description', None):
+                x.description = rtl(x.description)
+    except Exception:
+        pass
+    return x
+
+
+def _image_path(user_input: str) -> Path | None:
+    """Return the image path if user_input points at an existing image file."""
     try:
         p = Path(user_input).expanduser()
+        # Check the suffix first: most inputs are chat text, and stat() on a long
+        # message fails with "File name too long".
+        if p.suffix.lower() in IMAGE_SUFFIXES and p.exists():
+            return p
     except Exception:
-        p = None
-    if p and p.exists() and p.suffix.lower() in {'.jpg', '.jpeg', '.png', '.webp'}:
+        return None
+    return None
+
+
+def _image_error(user_input: str, e: Exception) -> Other:
+    if is_retryable(e):
+        # Quota/transient failure that outlasted the retries: let the caller retry later.
+        raise e
+    if isinstance(e, FileNotFoundError):
+        logger.info("route_and_parse: image path not found -> other")
+        return Other(kind='other', original_message=user_input, reason='image path not found')
+    logger.info("route_and_parse: image parse error -> other: {}", e)
+    return Other(kind='other', original_message=user_input, reason=f'image parse error: {e}')
+
+
+def _text_key(text: str, reference: datetime | None = None) -> str:
+    """Parse cache key: provider, model, prompt version and compaction settings; for text
+    without an absolute date also the day it was sent (the message timestamp, else today).
+    Its date comes from that day ("מחר אסיפה", or undated text, which gets the message
+    date), so the same text sent on a later day is parsed again.
+    """
+    context = []
+    compactor = get_default_compactor()
+    if compactor is not None:
+        context.append(compactor.cache_key)
+    if not has_absolute_date(text):
+        reference = reference or datetime.now(ZoneInfo(LOCAL_TZ))
+        context.append(f"day:{reference.date().isoformat()}")
+    return text_key(text, MODEL_ID, PROMPT_VERSION, "|".join(context))
+
+
+def _cache_get(cache: ParseCache | None, key: str | None, source: str, kind: str = 'text'):
+    if cache is None or key is None:
+        return None
+    raw = cache.get(key)
+    metrics.CACHE_LOOKUPS.inc(kind, 'miss' if raw is None else 'hit')
+    if raw is None:
+        return None
+    try:
+        out = _parsed_adapter.validate_json(raw)
+    except Exception as e:
+        logger.info("route_and_parse: dropping unreadable cache entry: {}", e)
+        return None
+    out.original_message = source
+    logger.info("route_and_parse: cache hit kind={}", getattr(out, 'kind', None))
+    return out
+
+
+def _cache_set(cache: ParseCache | None, key: str | None, out) -> None:
+    if cache is None or key is None:
+        return
+    try:
+        cache.set(key, _parsed_adapter.dump_json(out).decode('utf-8'))
+    except Exception as e:
+        logger.info("route_and_parse: cache write failed: {}", e)
+
+
+def _similar_image(cache: ParseCache | None, prepared: PreparedImage, path: str):
+    """Parse of an earlier, perceptually identical image (e.g. a re-compressed forward).
+    The thumbnails must match too: the same template with another date is a new flyer.
+    """
+    if cache is None or prepared.phash is None or prepared.thumb is None:
+        return None
+    similar = cache.find_image(
+        prepared.phash, IMAGE_PHASH_DISTANCE,
+        confirm=lambda thumb: thumb is not None and thumbnail_diff(thumb, prepared.thumb) <= IMAGE_THUMB_DIFF,
+    )
+    out = _cache_get(cache, similar, path, kind='similar_image') if similar else None
+    if out is not None:
+        logger.info("route_and_parse: image matches an already parsed flyer")
+    return out
+
+
+def _remember_image(cache: ParseCache | None, key: str | None, prepared: PreparedImage, out) -> None:
+    _cache_set(cache, key, out)
+    if cache is not None and key is not None and prepared.phash is not None:
+        cache.add_image_hash(prepared.phash, key, prepared.thumb)
+
+
+def _prefilter_check(prefilter: PreFilter | None, text: str) -> str | None:
+    if prefilter is None:
+        return None
+    rejected = prefilter.check(text)
+    if rejected is None:
+        metrics.PREFILTER_DECISIONS.inc('pass', '')
+    else:
+        metrics.PREFILTER_DECISIONS.inc('audit' if prefilter.config.audit else 'reject', rejected)
+    return rejected
+
+
+def _prefilter_other(user_input: str, reason: str) -> Other:
+    logger.info("route_and_parse: prefilter -> other ({})", reason)
+    return Other(kind='other', original_message=user_input or "", reason=f"prefilter: {reason}")
+
+
+@metrics.timed("route")
+def route_and_parse(
+    user_input: str,
+    cache: ParseCache | None = None,
+    prefilter: PreFilter | None = None,
+) -> Parsed:
+    """Pure-Python router: if input is an existing image path -> parse_event_picture; else -> parse_text.
+    Text with no event/task signal is answered by the pre-filter (default: get_default_prefilter())
+    and identical texts/images are served from the parse cache (default: get_default_cache()).
+    Returns Event | Task | Other.
+    """
+    logger.info("route_and_parse: routing input='{}'", user_input)
+    cache = cache or get_default_cache()
+    prefilter = prefilter or get_default_prefilter()
+    p = _image_path(user_input)
+    if p:
         try:
-            out = parse_event_picture(str(p))
+            image_bytes = _read_image(str(p))
+            key = image_key(image_bytes, MODEL_ID, PROMPT_VERSION) if cache else None
+            out = _cache_get(cache, key, str(p), kind='image')
+            if out is None:
+                prepared = _prepare(image_bytes, str(p))
+                out = _similar_image(cache, prepared, str(p)) or _parse_prepared(prepared, str(p))
+                _remember_image(cache, key, prepared, out)
             out = _apply_rtl(out)
             logger.info("route_and_parse: image -> event name='{}'", getattr(out, 'name', None))
             return out
-        except FileNotFoundError:
-            logger.info("route_and_parse: image path not found -> other")
-            return Other(kind='other', original_message=user_input, reason='image path not found')
         except Exception as e:
-            logger.info("route_and_parse: image parse error -> other: {}", e)
-            return Other(kind='other', original_message=user_input, reason=f'image parse error: {e}')
+            return _image_error(user_input, e)
     # default: treat as text
-    out = parse_text(user_input)
+    rejected = _prefilter_check(prefilter, user_input)
+    if rejected and not prefilter.config.audit:
+        return _prefilter_other(user_input, rejected)
+    key = _text_key(user_input) if cache else None
+    out = _cache_get(cache, key, user_input)
+    if out is None:
+        out = parse_text(user_input)
+        _cache_set(cache, key, out)
+    if rejected:
+        prefilter.audit(user_input, rejected, out)
     out = _apply_rtl(out)
     logger.info("route_and_parse: text parsed kind={} name='{}'", getattr(out, 'kind', None), getattr(out, 'name', None))
     return out
 
+
+@metrics.timed("route")
+async def route_and_parse_async(
+    user_input: str,
+    cache: ParseCache | None = None,
+    prefilter: PreFilter | None = None,
+) -> Parsed:
+    """Async variant of route_and_parse; same routing, pre-filter, caching and fallbacks.
+    """
+    logger.info("route_and_parse_async: routing input='{}'", user_input)
+    cache = cache or get_default_cache()
+    prefilter = prefilter or get_default_prefilter()
+    p = _image_path(user_input)
+    if p:
+        try:
+            image_bytes = await asyncio.to_thread(_read_image, str(p))
+            key = image_key(image_bytes, MODEL_ID, PROMPT_VERSION) if cache else None
+            out = _cache_get(cache, key, str(p), kind='image')
+            if out is None:
+                prepared = await asyncio.to_thread(_prepare, image_bytes, str(p))
+                out = _similar_image(cache, prepared, str(p)) or await _parse_prepared_async(prepared, str(p))
+                _remember_image(cache, key, prepared, out)
+            out = _apply_rtl(out)
+            logger.info("route_and_parse_async: image -> event name='{}'", getattr(out, 'name', None))
+            return out
+        except Exception as e:
+            return _image_error(user_input, e)
+    rejected = _prefilter_check(prefilter, user_input)
+    if rejected and not prefilter.config.audit:
+        return _prefilter_other(user_input, rejected)
+    key = _text_key(user_input) if cache else None
+    out = _cache_get(cache, key, user_input)
+    if out is None:
+        out = await parse_text_async(user_input)
+        _cache_set(cache, key, out)
+    if rejected:
+        prefilter.audit(user_input, rejected, out)
+    out = _apply_rtl(out)
+    logger.info("route_and_parse_async: text parsed kind={} name='{}'", getattr(out, 'kind', None), getattr(out, 'name', None))
+    return out
+
+def _message_payload(m: BatchMessage) -> dict:
+    return {"id": m.id, "timestamp": m.timestamp.isoformat() if m.timestamp else None, "text": _compact(m.text)}
+
+
+def pack_batches(
+    messages: list[BatchMessage],
+    max_tokens: int = BATCH_TOKEN_BUDGET,
+    max_items: int = BATCH_MAX_ITEMS,
+) -> list[list[BatchMessage]]:
+    """Greedily pack messages, in order, into batches under the token budget.
+    A message larger than the budget gets a batch of its own.
+    """
+    batches: list[list[BatchMessage]] = []
+    current: list[BatchMessage] = []
+    used = 0
+    for m in messages:
+        cost = estimate_tokens(m.text) + 20  # id/timestamp/JSON overhead
+        if current and (used + cost > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(m)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _batch_error(m: BatchMessage, e: Exception) -> Other:
+    logger.info("parse_batch: message id={} failed -> other: {}", m.id, e)
+    return Other(kind='other', original_message=m.text, reason=f'parse error: {e}')
+
+
+async def _run_batch(batch: list[BatchMessage], failed: set[str]) -> dict[str, Parsed]:
+    """Classify one packed batch; split and retry halves when the output does not validate.
+    Messages that still fail on their own get an Other with the error; their ids are added to failed.
+    Quota/transient errors that outlasted the throttle's retries are raised (see is_retryable).
+    """
+    if len(batch) == 1:
+        m = batch[0]
+        try:
+            result = await _run_agent_async("batch", get_batch_agent(), json.dumps([_message_payload(m)], ensure_ascii=False))
+            items = {item.id: item.result for item in result.output.results}
+            if m.id in items:
+                return {m.id: _finish_text(items[m.id], m.text, get_default_compactor() is not None)}
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            logger.info("parse_batch: single-message batch failed, falling back to parse_text: {}", e)
+        try:
+            return {m.id: await parse_text_async(m.text)}
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            failed.add(m.id)
+            return {m.id: _batch_error(m, e)}
+    try:
+        payload = json.dumps([_message_payload(m) for m in batch], ensure_ascii=False)
+        result = await _run_agent_async("batch", get_batch_agent(), payload)
+        items = {item.id: item.result for item in result.output.results}
+    except Exception as e:
+        if is_retryable(e):
+            # Splitting would only send more requests into the same quota.
+            raise
+        logger.info("parse_batch: batch of {} failed, splitting: {}", len(batch), e)
+        items = {}
+    compacted = get_default_compactor() is not None
+    out = {m.id: _finish_text(items[m.id], m.text, compacted) for m in batch if m.id in items}
+    missing = [m for m in batch if m.id not in out]
+    if missing:
+        if items:
+            logger.info("parse_batch: {} of {} ids missing, retrying them", len(missing), len(batch))
+        half = len(missing) // 2 or 1
+        for part in (missing[:half], missing[half:]):
+            if part:
+                out.update(await _run_batch(part, failed))
+    return out
+
+
+@metrics.timed("parse_batch")
+async def parse_batch_async(
+    messages: list[BatchMessage],
+    cache: ParseCache | None = None,
+    prefilter: PreFilter | None = None,
+    max_tokens: int = BATCH_TOKEN_BUDGET,
+    max_items: int = BATCH_MAX_ITEMS,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> list[Parsed]:
+    """Classify many text messages with one LLM request per packed batch.
+    Applies the same pre-filter, cache and rtl handling as route_and_parse.
+    Returns results in the same order as messages. Like route_and_parse, raises a
+    quota/transient error (is_retryable) after caching the other batches' results.
+    """
+    ids = [m.id for m in messages]
+    if len(set(ids)) != len(ids):
+        raise ValueError("parse_batch: message ids must be unique")
+    cache = cache or get_default_cache()
+    prefilter = prefilter or get_default_prefilter()
+    results: dict[str, Parsed] = {}
+    keys: dict[str, str | None] = {}
+    audited: dict[str, str] = {}
+    pending: list[BatchMessage] = []
+    for m in messages:
+        rejected = _prefilter_check(prefilter, m.text)
+        if rejected and not prefilter.config.audit:
+            results[m.id] = _prefilter_other(m.text, rejected)
+            continue
+        if rejected:
+            audited[m.id] = rejected
+        keys[m.id] = _text_key(m.text, m.timestamp) if cache else None
+        hit = _cache_get(cache, keys[m.id], m.text)
+        if hit is not None:
+            results[m.id] = _apply_rtl(hit)
+            continue
+        pending.append(m)
+
+    batches = pack_batches(pending, max_tokens=max_tokens, max_items=max_items)
+    logger.info("parse_batch: {} messages, {} to the LLM in {} requests", len(messages), len(pending), len(batches))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    failed: set[str] = set()
+
+    async def _bounded(batch: list[BatchMessage]) -> dict[str, Parsed]:
+        async with semaphore:
+            return await _run_batch(batch, failed)
+
+    by_text = {m.id: m.text for m in pending}
+    # One failing batch must not discard the others' results.
+    outcomes = await asyncio.gather(*(_bounded(b) for b in batches), return_exceptions=True)
+    retry_later: Exception | None = None
+    for batch, parsed in zip(batches, outcomes):
+        if isinstance(parsed, BaseException):
+            if not isinstance(parsed, Exception):
+                raise parsed
+            if is_retryable(parsed):
+                retry_later = retry_later or parsed
+                continue
+            failed.update(m.id for m in batch)
+            parsed = {m.id: _batch_error(m, parsed) for m in batch}
+        for mid, out in parsed.items():
+            if mid not in failed:
+                # Errors are not cached, so the next run tries again.
+                _cache_set(cache, keys.get(mid), out)
+            if mid in audited:
+                prefilter.audit(by_text[mid], audited[mid], out)
+            results[mid] = _apply_rtl(out)
+    if retry_later is not None:
+        raise retry_later
+    return [results[i] for i in ids]
+
+
+def parse_batch(messages: list[BatchMessage], **kwargs) -> list[Parsed]:
+    """Blocking wrapper around parse_batch_async (see there for arguments)."""
+    return asyncio.run(parse_batch_async(messages, **kwargs))
+
+
 def main():
     event_or_task = route_and_parse(r'data\\event1.jpg')
 
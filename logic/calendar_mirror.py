@@ -0,0 +1,188 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from loguru import logger
+from google_wrapper import GoogleCalendarWrapper
+from title_index import DEFAULT_THRESHOLD, TitleIndex
+
+
+DEFAULT_MAX_STALENESS_SECONDS = 60
+
+
+def _parse_start(item: Dict[str, Any]) -> Optional[datetime]:
+    start = item.get("start") or {}
+    try:
+        if start.get("dateTime"):
+            dt = datetime.fromisoformat(start["dateTime"].replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=ZoneInfo(start.get("timeZone") or "UTC"))
+            return dt.astimezone(timezone.utc)
+        if start.get("date"):
+            return datetime.fromisoformat(start["date"]).replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+    return None
+
+
+def _as_utc(dt: datetime, tz: str) -> datetime:
+    if dt.tzinfo is None:
+        try:
+            dt = dt.replace(tzinfo=ZoneInfo(tz))
+        except Exception:
+            dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _is_gone(e: Exception) -> bool:
+    status = getattr(getattr(e, "resp", None), "status", None)
+    return str(status) == "410"
+
+
+class CalendarMirror:
+    """In-process copy of a calendar, indexed by start time and by title (TitleIndex).
+
+    Seeded with one full events.list and then kept current with incremental sync
+    tokens, so dedup lookups do not cost an API request per message.
+    """
+
+    def __init__(
+        self,
+        wrapper: GoogleCalendarWrapper,
+        max_staleness_seconds: float = DEFAULT_MAX_STALENESS_SECONDS,
+    ) -> None:
+        self.wrapper = wrapper
+        self.max_staleness_seconds = max_staleness_seconds
+        self.sync_token: Optional[str] = None
+        self.last_sync: float = 0.0
+        self._lock = threading.RLock()
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._titles = TitleIndex()
+        self._starts: Dict[str, datetime] = {}
+        self._by_start: List[Tuple[datetime, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _list_pages(self, **params) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            kwargs = dict(params, calendarId=self.wrapper.calendar_id, singleEvents=True, maxResults=2500)
+            if page_token:
+                kwargs["pageToken"] = page_token
+            page = self.wrapper.execute("list", self.wrapper.service.events().list(**kwargs))
+            items.extend(page.get("items", []))
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return items, page.get("nextSyncToken")
+
+    def seed(self) -> None:
+        """Full load of the calendar; resets the index and the sync token."""
+        items, token = self._list_pages()
+        with self._lock:
+            self._items.clear()
+            self._titles.clear()
+            self._starts.clear()
+            self._by_start = []
+            for item in items:
+                self._put(item)
+            self.sync_token = token
+            self.last_sync = time.monotonic()
+        logger.info("calendar mirror: seeded {} events calendar={}", len(items), self.wrapper.calendar_id)
+
+    def refresh(self) -> None:
+        """Apply changes since the last sync (or seed if there is no sync token yet)."""
+        if self.sync_token is None:
+            self.seed()
+            return
+        try:
+            items, token = self._list_pages(syncToken=self.sync_token, showDeleted=True)
+        except Exception as e:
+            if _is_gone(e):
+                logger.info("calendar mirror: sync token expired, reseeding")
+                self.seed()
+                return
+            raise
+        with self._lock:
+            for item in items:
+                if item.get("status") == "cancelled":
+                    self._drop(item.get("id"))
+                else:
+                    self._put(item)
+            if token:
+                self.sync_token = token
+            self.last_sync = time.monotonic()
+        if items:
+            logger.info("calendar mirror: applied {} changes", len(items))
+
+    def _ensure_fresh(self) -> None:
+        if self.sync_token is None or time.monotonic() - self.last_sync > self.max_staleness_seconds:
+            self.refresh()
+
+    def _put(self, item: Dict[str, Any]) -> None:
+        event_id = item.get("id")
+        if not event_id:
+            return
+        self._drop(event_id)
+        start = _parse_start(item)
+        self._items[event_id] = item
+        self._titles.add(event_id, item.get("summary", ""), start)
+        if start is not None:
+            self._starts[event_id] = start
+            bisect.insort(self._by_start, (start, event_id))
+
+    def _drop(self, event_id: Optional[str]) -> None:
+        if event_id not in self._items:
+            return
+        del self._items[event_id]
+        self._titles.remove(event_id)
+        start = self._starts.pop(event_id, None)
+        if start is not None:
+            i = bisect.bisect_left(self._by_start, (start, event_id))
+            if i < len(self._by_start) and self._by_start[i] == (start, event_id):
+                del self._by_start[i]
+
+    def upsert(self, item: Dict[str, Any]) -> None:
+        """Record an event we just wrote, so later lookups see it before the next sync."""
+        with self._lock:
+            self._put(item)
+
+    def remove(self, event_id: str) -> None:
+        with self._lock:
+            self._drop(event_id)
+
+    def between(self, start: datetime, end: datetime, tz: str = "UTC") -> List[Dict[str, Any]]:
+        """Events starting in [start, end], ordered by start time."""
+        self._ensure_fresh()
+        lo, hi = _as_utc(start, tz), _as_utc(end, tz)
+        with self._lock:
+            i = bisect.bisect_left(self._by_start, (lo, ""))
+            out = []
+            while i < len(self._by_start) and self._by_start[i][0] <= hi:
+                out.append(self._items[self._by_start[i][1]])
+                i += 1
+            return out
+
+    def find(
+        self,
+        name: str,
+        when: datetime,
+        window_minutes: int,
+        tz: str = "UTC",
+        threshold: float = DEFAULT_THRESHOLD,
+    ) -> Optional[Dict[str, Any]]:
+        """The event within +-window_minutes of when whose title is most similar to name
+        (see title_index.title_similarity), if any scores at least threshold.
+        """
+        self._ensure_fresh()
+        window = timedelta(minutes=window_minutes)
+        lo, hi = _as_utc(when - window, tz), _as_utc(when + window, tz)
+        with self._lock:
+            for _, event_id in self._titles.search(name, lo, hi, threshold):
+                start = self._starts.get(event_id)
+                if start is not None and lo <= start <= hi:
+                    return self._items[event_id]
+        return None
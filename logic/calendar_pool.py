@@ -0,0 +1,84 @@
+import os
+import threading
+from typing import Dict, Optional
+import google_auth_httplib2
+import httplib2
+from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+from loguru import logger
+from google_wrapper import GoogleCalendarWrapper
+from calendar_mirror import CalendarMirror
+
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+
+class CalendarClientPool:
+    """Process-wide Calendar clients, built once and shared across worker threads.
+
+    Credentials (and their cached access token) and the discovery-built service are
+    created once. httplib2 is not thread-safe, so each thread gets its own authorized
+    HTTP object, which it keeps and reuses for connection pooling. Wrappers are keyed
+    by calendar id.
+    """
+
+    def __init__(self, credentials: Credentials, default_calendar_id: str, tz: str = "Asia/Jerusalem", mirror: bool = False) -> None:
+        self.credentials = credentials
+        self.default_calendar_id = default_calendar_id
+        self.tz = tz
+        self.use_mirror = mirror
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wrappers: Dict[str, GoogleCalendarWrapper] = {}
+        self._mirrors: Dict[str, CalendarMirror] = {}
+        self.service = build(
+            "calendar",
+            "v3",
+            http=self._thread_http(),
+            requestBuilder=self._build_request,
+            cache_discovery=False,
+        )
+        logger.info("calendar pool: service built default_calendar={} mirror={}", default_calendar_id, mirror)
+
+    @classmethod
+    def from_env(cls) -> "CalendarClientPool":
+        sa_path = os.getenv("SERVICE_ACCOUNT_FILE")
+        calendar_id = os.getenv("CALENDAR_ID")
+        tz = os.getenv("GCAL_TZ", "Asia/Jerusalem")
+        if not sa_path or not calendar_id:
+            raise RuntimeError("Missing SERVICE_ACCOUNT_FILE or CALENDAR_ID env var")
+        creds = Credentials.from_service_account_file(sa_path, scopes=SCOPES)
+        return cls(creds, calendar_id, tz=tz, mirror=os.getenv("CALENDAR_MIRROR", "0") == "1")
+
+    def _thread_http(self) -> google_auth_httplib2.AuthorizedHttp:
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs) -> HttpRequest:
+        # Ignore the http captured at build time and use the calling thread's own.
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def get(self, calendar_id: Optional[str] = None) -> GoogleCalendarWrapper:
+        calendar_id = calendar_id or self.default_calendar_id
+        with self._lock:
+            wrapper = self._wrappers.get(calendar_id)
+            if wrapper is None:
+                wrapper = GoogleCalendarWrapper(self.service, calendar_id=calendar_id)
+                self._wrappers[calendar_id] = wrapper
+            return wrapper
+
+    def mirror(self, calendar_id: Optional[str] = None) -> Optional[CalendarMirror]:
+        """Shared CalendarMirror for the calendar, or None when mirroring is off."""
+        if not self.use_mirror:
+            return None
+        wrapper = self.get(calendar_id)
+        with self._lock:
+            mirror = self._mirrors.get(wrapper.calendar_id)
+            if mirror is None:
+                mirror = CalendarMirror(wrapper)
+                self._mirrors[wrapper.calendar_id] = mirror
+            return mirror
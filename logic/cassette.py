@@ -0,0 +1,330 @@
+"""Record/replay of Gemini and Calendar calls, for re-running a chat export offline.
+
+    CASSETTE=record CASSETTE_PATH=run1.db python logic/cassette.py run chat.txt
+    CASSETTE=replay CASSETTE_PATH=run1.db ...      # same run, no network
+    python logic/cassette.py diff run1.db run2.db  # inputs whose parses changed
+
+Calls are keyed by a hash of the request (agent, model, prompt version and prompt; or
+Calendar method, URI and body). A request made n times is stored as n occurrences and
+replayed in the same order, so repeated lookups see the state they saw when recorded.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+
+
+MODES = ("off", "record", "replay")
+DEFAULT_PATH = os.getenv("CASSETTE_PATH", "cassette.db")
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recording for a request (the input, prompt or model changed)."""
+
+
+class _Resp(dict):
+    def __init__(self, status: Optional[int]) -> None:
+        super().__init__()
+        self.status = status
+
+
+class ReplayedError(Exception):
+    """A recorded failure; carries resp.status like googleapiclient.errors.HttpError."""
+
+    def __init__(self, status: Optional[int], message: str) -> None:
+        super().__init__(message)
+        self.resp = _Resp(status)
+
+
+def encode_error(e: BaseException) -> Dict[str, Any]:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "resp", None), "status", None)
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+    return {"status": status, "message": str(e)}
+
+
+def decode_error(error: Dict[str, Any]) -> ReplayedError:
+    return ReplayedError(error.get("status"), error.get("message", ""))
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    return str(value)
+
+
+def request_hash(request: Any) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=_default)
+                          .encode("utf-8")).hexdigest()
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class Cassette:
+    """SQLite archive of request -> response (zlib-compressed JSON).
+
+    call() runs fn in record mode and stores its result (or error); in replay mode it
+    returns the stored result without calling fn, raising CassetteMiss if there is none.
+    encode/decode convert between the live result and JSON.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, mode: str = "replay") -> None:
+        if mode not in ("record", "replay"):
+            raise ValueError(f"cassette mode must be record or replay, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._seen: Dict[str, int] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS interactions ("
+            " hash TEXT NOT NULL, seq INTEGER NOT NULL, kind TEXT NOT NULL, input TEXT, label TEXT,"
+            " payload BLOB NOT NULL, recorded REAL NOT NULL, PRIMARY KEY (hash, seq))"
+        )
+        self._db.commit()
+        logger.info("cassette: {} {}", mode, path)
+
+    def _next(self, key: str) -> int:
+        with self._lock:
+            seq = self._seen.get(key, 0)
+            self._seen[key] = seq + 1
+            return seq
+
+    def _load(self, key: str, seq: int) -> Dict[str, Any]:
+        with self._lock:
+            # Past the recorded occurrences, the last one is the best answer.
+            row = self._db.execute(
+                "SELECT payload FROM interactions WHERE hash = ? AND seq <= ? ORDER BY seq DESC LIMIT 1", (key, seq)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            raise CassetteMiss(f"cassette: no recording for request {key[:12]} in {self.path}")
+        self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def _store(self, key: str, seq: int, kind: str, input_id: Optional[str], label: Optional[str],
+               entry: Dict[str, Any]) -> None:
+        payload = zlib.compress(json.dumps(entry, ensure_ascii=False, default=_default).encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO interactions (hash, seq, kind, input, label, payload, recorded)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, seq, kind, input_id, label, payload, time.time()),
+            )
+            self._db.commit()
+            self.recorded += 1
+
+    def _replay(self, key: str, seq: int, decode: Callable[[Any], Any]) -> Any:
+        entry = self._load(key, seq)
+        if "error" in entry:
+            raise decode_error(entry["error"])
+        return decode(entry["response"])
+
+    def call(
+        self,
+        kind: str,
+        fn: Callable[[], Any],
+        request: Any,
+        encode: Callable[[Any], Any] = _identity,
+        decode: Callable[[Any], Any] = _identity,
+        input: Any = None,
+        label: Optional[str] = None,
+    ) -> Any:
+        """fn() in record mode, the recorded result in replay mode.
+
+        input identifies what was parsed independently of model and prompt (for diff());
+        label is a short human-readable description of it.
+        """
+        key = request_hash([kind, request])
+        seq = self._next(key)
+        if self.mode == "replay":
+            return self._replay(key, seq, decode)
+        input_id = request_hash(input) if input is not None else None
+        try:
+            result = fn()
+        except Exception as e:
+            self._store(key, seq, kind, input_id, label, {"error": encode_error(e)})
+            raise
+        self._store(key, seq, kind, input_id, label, {"response": encode(result)})
+        return result
+
+    async def call_async(
+        self,
+        kind: str,
+        fn: Callable[[], Awaitable[Any]],
+        request: Any,
+        encode: Callable[[Any], Any] = _identity,
+        decode: Callable[[Any], Any] = _identity,
+        input: Any = None,
+        label: Optional[str] = None,
+    ) -> Any:
+        key = request_hash([kind, request])
+        seq = self._next(key)
+        if self.mode == "replay":
+            return self._replay(key, seq, decode)
+        input_id = request_hash(input) if input is not None else None
+        try:
+            result = await fn()
+        except Exception as e:
+            await asyncio.to_thread(self._store, key, seq, kind, input_id, label, {"error": encode_error(e)})
+            raise
+        await asyncio.to_thread(self._store, key, seq, kind, input_id, label, {"response": encode(result)})
+        return result
+
+    def entries(self, kind: str) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(input, label, entry) for the first occurrence of every recorded request of kind."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT input, label, payload FROM interactions WHERE kind = ? AND seq = 0 AND input IS NOT NULL"
+                " ORDER BY recorded", (kind,)
+            ).fetchall()
+        for input_id, label, payload in rows:
+            yield input_id, label, json.loads(zlib.decompress(payload))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+_active: Optional[Cassette] = None
+
+
+@lru_cache(maxsize=None)
+def _from_env() -> Optional[Cassette]:
+    mode = os.getenv("CASSETTE", "off")
+    if mode not in MODES:
+        raise ValueError(f"CASSETTE must be one of {MODES}, not {mode!r}")
+    return None if mode == "off" else Cassette(DEFAULT_PATH, mode)
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The cassette in use: the one installed by use_cassette(), else CASSETTE/CASSETTE_PATH from env."""
+    return _active if _active is not None else _from_env()
+
+
+@contextmanager
+def use_cassette(cassette: Cassette) -> Iterator[Cassette]:
+    global _active
+    previous, _active = _active, cassette
+    try:
+        yield cassette
+    finally:
+        _active = previous
+
+
+@dataclass
+class ParseDiff:
+    label: str
+    old: Any
+    new: Any
+
+
+def _comparable(entry: Dict[str, Any]) -> Any:
+    if "error" in entry:
+        return {"error": entry["error"].get("status")}
+    response = dict(entry["response"])
+    response.pop("usage", None)
+    return response
+
+
+def diff(old: Cassette, new: Cassette, kind: str = "llm") -> Tuple[List[ParseDiff], int]:
+    """Inputs recorded in both cassettes whose results differ, and how many were compared."""
+    before = {input_id: (label, entry) for input_id, label, entry in old.entries(kind)}
+    changed: List[ParseDiff] = []
+    compared = 0
+    for input_id, label, entry in new.entries(kind):
+        if input_id not in before:
+            continue
+        compared += 1
+        old_result, new_result = _comparable(before[input_id][1]), _comparable(entry)
+        if old_result != new_result:
+            changed.append(ParseDiff(label or input_id, old_result, new_result))
+    return changed, compared
+
+
+def _replay_service():
+    # Static discovery and an API key: requests can be built (and keyed) without credentials.
+    from googleapiclient.discovery import build
+    return build("calendar", "v3", developerKey="cassette-replay", cache_discovery=False, static_discovery=True)
+
+
+def run_chat(path: str, cassette: Cassette, tz: str, dayfirst: bool = False, calendar_id: Optional[str] = None) -> None:
+    """process_message over every message of a chat export under the cassette."""
+    from google_wrapper import GoogleCalendarWrapper
+    from parse_and_sync_service import process_message
+    from utils.whatsapp_export import iter_whatsapp_chat
+
+    if cassette.mode == "replay":
+        wrapper = GoogleCalendarWrapper(_replay_service(), calendar_id=calendar_id or os.getenv("CALENDAR_ID", "primary"))
+    else:
+        from calendar_pool import CalendarClientPool
+        wrapper = CalendarClientPool.from_env().get(calendar_id)
+    started = time.perf_counter()
+    messages = failed = 0
+    with use_cassette(cassette):
+        for message in iter_whatsapp_chat(path, dayfirst=dayfirst):
+            messages += 1
+            try:
+                process_message(message.text, wrapper, tz)
+            except Exception as e:
+                failed += 1
+                logger.info("cassette: message at offset={} failed: {}", message.offset, e)
+    logger.info("cassette: {} {} messages in {:.2f}s failed={} hits={} misses={} recorded={}", cassette.mode,
+                messages, time.perf_counter() - started, failed, cassette.hits, cassette.misses, cassette.recorded)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="process a chat export, recording or replaying every call")
+    run.add_argument("chat")
+    run.add_argument("--cassette", default=DEFAULT_PATH)
+    run.add_argument("--mode", choices=("record", "replay"), default=os.getenv("CASSETTE", "replay"))
+    run.add_argument("--tz", default=os.getenv("GCAL_TZ", "Asia/Jerusalem"))
+    run.add_argument("--dayfirst", action="store_true")
+    run.add_argument("--calendar-id")
+    compare = commands.add_parser("diff", help="list inputs parsed differently in two recordings")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        cassette = Cassette(args.cassette, args.mode)
+        try:
+            run_chat(args.chat, cassette, args.tz, dayfirst=args.dayfirst, calendar_id=args.calendar_id)
+        finally:
+            cassette.close()
+        return 0
+    old, new = Cassette(args.old, "replay"), Cassette(args.new, "replay")
+    changed, compared = diff(old, new)
+    for change in changed:
+        print(f"--- {change.label}")
+        print(f"  old: {json.dumps(change.old, ensure_ascii=False, sort_keys=True)}")
+        print(f"  new: {json.dumps(change.new, ensure_ascii=False, sort_keys=True)}")
+    print(f"{len(changed)} of {compared} inputs parsed differently")
+    return 1 if changed else 0
+
+
+if __name__ == "__main__":
+    # Run as a script: the repo root (utils/) must be importable as well as logic/.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import json
+import os
+from functools import lru_cache
+from typing import Dict, Optional
+from loguru import logger
+
+
+class UnknownChat(LookupError):
+    """A chat with no calendar route while routing is strict."""
+
+
+class CalendarNotAllowed(PermissionError):
+    """A caller asked for a calendar other than the one its chat is routed to."""
+
+
+class ChatRouter:
+    """Maps a chat/group id to the calendar its events go to.
+
+    Chats without a route use default_calendar_id (None: the pool's CALENDAR_ID), or
+    raise UnknownChat when strict, so an unmapped group never writes to another's calendar.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, str]] = None, default_calendar_id: Optional[str] = None,
+                 strict: bool = False) -> None:
+        self.routes = dict(routes or {})
+        self.default_calendar_id = default_calendar_id
+        self.strict = strict
+
+    @classmethod
+    def from_env(cls) -> "ChatRouter":
+        """CHAT_CALENDARS is a JSON object {chat_id: calendar_id}, inline or the path of a
+        JSON file; CHAT_ROUTING_STRICT=1 rejects chats that are not in it.
+        """
+        raw = os.getenv("CHAT_CALENDARS", "").strip()
+        if raw and not raw.startswith("{"):
+            with open(raw, encoding="utf-8") as f:
+                raw = f.read()
+        routes = json.loads(raw) if raw else {}
+        if not isinstance(routes, dict):
+            raise ValueError("CHAT_CALENDARS must be a JSON object of chat id -> calendar id")
+        strict = os.getenv("CHAT_ROUTING_STRICT", "0") == "1"
+        logger.info("chat router: {} routes strict={}", len(routes), strict)
+        return cls({str(k): str(v) for k, v in routes.items()}, strict=strict)
+
+    def calendar_for(self, chat_id: Optional[str]) -> Optional[str]:
+        if chat_id is not None and chat_id in self.routes:
+            return self.routes[chat_id]
+        if self.strict:
+            raise UnknownChat(f"no calendar configured for chat {chat_id!r}")
+        return self.default_calendar_id
+
+    def resolve(self, chat_id: Optional[str], requested: Optional[str] = None,
+                default_calendar_id: Optional[str] = None) -> Optional[str]:
+        """The chat's calendar (default_calendar_id when the router has none). A requested
+        calendar id is only accepted when it is that calendar, so callers cannot write to
+        other calendars the service account can reach.
+        """
+        routed = self.calendar_for(chat_id) or default_calendar_id
+        if requested is not None and requested != routed:
+            raise CalendarNotAllowed(f"calendar {requested!r} is not the calendar of chat {chat_id!r}")
+        return routed
+
+
+@lru_cache(maxsize=None)
+def get_default_router() -> ChatRouter:
+    return ChatRouter.from_env()
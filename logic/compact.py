@@ -0,0 +1,157 @@
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+from loguru import logger
+import metrics
+from text_patterns import (DATE_TIME_PATTERNS, EDITED_RE, EVENT_KEYWORDS, PAYMENT_PATTERNS, WEEKDAY_WORDS, strip_marks,
+                           with_reversed)
+
+
+DEFAULT_TOKEN_BUDGET = 300
+# Shorter messages are sent as they are: there is little to save and every word may matter.
+DEFAULT_MIN_TOKENS = 150
+DEFAULT_CONTEXT = 1
+
+# WhatsApp *bold*, _italic_ and ~strike~ markers, and runs of repeated punctuation.
+_FORMATTING_RE = re.compile(r"(?:^|(?<=\s))[*_~]+(?=\S)|(?<=\S)[*_~]+(?=[\s.,!?:;)]|$)", re.MULTILINE)
+_REPEATED_RE = re.compile(r"([!?.,\-=~])\1+")
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# Variation selectors and the keycap mark travel with emoji.
+_EMOJI_MARKS = {"\ufe0e", "\ufe0f", "\u20e3"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~3 chars per token, which is conservative for Hebrew)."""
+    return len(text or "") // 3 + 1
+
+
+def strip_decorations(text: str) -> str:
+    """Text without emoji, symbols, format characters, WhatsApp formatting markers, edit
+    markers, repeated punctuation and blank lines. Letters, digits, punctuation and
+    currency signs (₪) are kept.
+    """
+    text = EDITED_RE.sub(" ", text or "")
+    kept = []
+    for ch in text:
+        category = unicodedata.category(ch)
+        if category in ("So", "Sk", "Cf", "Co", "Cs") or ch in _EMOJI_MARKS:
+            kept.append(" ")
+        else:
+            kept.append(ch)
+    text = _REPEATED_RE.sub(r"\1", _FORMATTING_RE.sub("", "".join(kept)))
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+@dataclass
+class CompactionConfig:
+    enabled: bool = True
+    token_budget: int = DEFAULT_TOKEN_BUDGET
+    min_tokens: int = DEFAULT_MIN_TOKENS
+    # Sentences kept on each side of a sentence with a signal.
+    context: int = DEFAULT_CONTEXT
+
+
+@dataclass
+class Compacted:
+    text: str
+    original_tokens: int
+    tokens: int
+    kept: int
+    sentences: int
+
+    @property
+    def saved(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+class PromptCompactor:
+    """Shrinks long messages before they are sent to the LLM.
+
+    Decorations are stripped; if the text is still over the token budget, only the
+    sentences with a date/time, link, weekday or event-keyword signal (the pre-filter's
+    patterns) are kept, with context sentences around them, strongest signals first.
+    """
+
+    def __init__(self, config: Optional[CompactionConfig] = None) -> None:
+        self.config = config or CompactionConfig()
+        # Dates, times and links place the event; keywords only suggest one.
+        self._strong_re = re.compile("|".join(DATE_TIME_PATTERNS + PAYMENT_PATTERNS), re.IGNORECASE)
+        self._weak_re = re.compile("|".join(with_reversed(WEEKDAY_WORDS + EVENT_KEYWORDS)), re.IGNORECASE)
+
+    @property
+    def cache_key(self) -> str:
+        """The settings that change what the model sees, for parse cache keys."""
+        c = self.config
+        return f"compact:{int(c.enabled)}:{c.token_budget}:{c.min_tokens}:{c.context}"
+
+    def _score(self, sentence: str) -> int:
+        plain = strip_marks(sentence)
+        return 2 if self._strong_re.search(plain) else 1 if self._weak_re.search(plain) else 0
+
+    def compact(self, text: str) -> Compacted:
+        original = estimate_tokens(text)
+        if not self.config.enabled or original <= self.config.min_tokens:
+            return Compacted(text, original, original, 1, 1)
+        cleaned = strip_decorations(text)
+        sentences = [s for line in cleaned.splitlines() for s in _SENTENCE_RE.split(line) if s]
+        if estimate_tokens(cleaned) <= self.config.token_budget:
+            return Compacted(cleaned, original, estimate_tokens(cleaned), len(sentences), len(sentences))
+
+        scores = [self._score(s) for s in sentences]
+        # Candidates in priority order: strong signals, weak signals, then their context
+        # (nearest first); with no signal at all, the opening of the message.
+        order: List[int] = [i for i, s in enumerate(scores) if s == 2] + [i for i, s in enumerate(scores) if s == 1]
+        for distance in range(1, self.config.context + 1):
+            for i in [i for i, s in enumerate(scores) if s]:
+                order += [j for j in (i - distance, i + distance) if 0 <= j < len(sentences)]
+        if not order:
+            order = list(range(len(sentences)))
+
+        chosen: set = set()
+        used = 0
+        for i in order:
+            if i in chosen:
+                continue
+            cost = estimate_tokens(sentences[i])
+            if chosen and used + cost > self.config.token_budget:
+                continue
+            chosen.add(i)
+            used += cost
+        compacted = "\n".join(sentences[i] for i in sorted(chosen))
+        if estimate_tokens(compacted) > self.config.token_budget:
+            # A single sentence over the budget.
+            compacted = compacted[: 3 * self.config.token_budget]
+        return Compacted(compacted, original, estimate_tokens(compacted), len(chosen), len(sentences))
+
+    def __call__(self, text: str) -> str:
+        """compact(text).text, logging and counting the tokens saved."""
+        result = self.compact(text)
+        if result.saved > 0:
+            metrics.PROMPT_TOKENS_SAVED.inc(value=result.saved)
+            logger.info("compact: {} -> {} tokens (saved {}), kept {}/{} sentences",
+                        result.original_tokens, result.tokens, result.saved, result.kept, result.sentences)
+        return result.text
+
+
+@lru_cache(maxsize=None)
+def get_default_compactor() -> Optional[PromptCompactor]:
+    """Process-wide compactor configured from env; None unless PROMPT_COMPACTION=1.
+
+    PROMPT_TOKEN_BUDGET caps the compacted prompt, PROMPT_COMPACTION_MIN_TOKENS is the size
+    below which messages are sent unchanged, PROMPT_COMPACTION_CONTEXT the context sentences.
+    """
+    if os.getenv("PROMPT_COMPACTION", "0") != "1":
+        return None
+    config = CompactionConfig(
+        token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+        min_tokens=int(os.getenv("PROMPT_COMPACTION_MIN_TOKENS", DEFAULT_MIN_TOKENS)),
+        context=int(os.getenv("PROMPT_COMPACTION_CONTEXT", DEFAULT_CONTEXT)),
+    )
+    logger.info("compact: enabled budget={} min_tokens={} context={}", config.token_budget, config.min_tokens,
+                config.context)
+    return PromptCompactor(config)
@@ -1,8 +1,57 @@
-from typing import Any, Optional
+from typing import Any, Callable, Dict, List, Optional
+from dataclasses import dataclass
+from functools import partial
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import time
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from loguru import logger
 from agent import Event
+import metrics
+from throttle import get_throttle, is_rate_limited
+from cassette import decode_error, encode_error, get_cassette
+
+
+# Google recommends at most 50 calls per Calendar batch request.
+CALENDAR_BATCH_LIMIT = 50
+
+# BatchResult.op -> API method, so batched and single calls share metric labels.
+_BATCH_OPS = {"insert": "insert", "update": "patch", "delete": "delete"}
+
+
+class MissingBatchResponse(RuntimeError):
+    """A batch request succeeded but returned no part for one of its calls."""
+
+
+@dataclass
+class BatchResult:
+    op: str
+    request_id: str
+    event_id: Optional[str] = None
+    response: Optional[dict] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _describe(op: str, request: Any) -> dict:
+    """Cassette key of a request: method, URI (without the API key) and body."""
+    uri = getattr(request, "uri", None)
+    if uri:
+        parts = urlsplit(uri)
+        query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if k != "key"))
+        uri = urlunsplit(parts._replace(query=query))
+    return {"op": op, "method": getattr(request, "method", None), "uri": uri, "body": getattr(request, "body", None)}
+
+
+def _outcome(e: Optional[Exception]) -> str:
+    """Metric label for a request result: ok, the HTTP status, or error."""
+    if e is None:
+        return "ok"
+    status = getattr(getattr(e, "resp", None), "status", None)
+    return str(status) if status else "error"
 
 
 class GoogleCalendarWrapper:
@@ -10,6 +59,22 @@ class GoogleCalendarWrapper:
         self.service = service
         self.calendar_id = calendar_id
 
+    def execute(self, op: str, request: Any) -> Any:
+        """Execute one API request under the Calendar throttle (rate limit, adaptive concurrency,
+        retries), recording its duration and outcome under calendar_<op>.
+        """
+        cassette = get_cassette()
+        try:
+            with metrics.STAGE_SECONDS.time(f"calendar_{op}"):
+                # A failed insert may still have created the event, so only rate limits are retried.
+                send = partial(get_throttle("calendar").call, request.execute, server_errors=op != "insert")
+                response = cassette.call("calendar", send, request=_describe(op, request)) if cassette else send()
+        except Exception as e:
+            metrics.CALENDAR_REQUESTS.inc(op, _outcome(e))
+            raise
+        metrics.CALENDAR_REQUESTS.inc(op, "ok")
+        return response
+
     def _rfc3339(self, dt: datetime, tz: str = "UTC") -> dict:
         if dt.tzinfo is None:
             try:
@@ -30,16 +95,44 @@ class GoogleCalendarWrapper:
         }
         return body
 
+    def _patch_body(
+        self,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "UTC",
+    ) -> dict:
+        body: dict = {}
+        if name is not None:
+            body["summary"] = name
+        if description is not None:
+            body["description"] = description
+        if location is not None:
+            body["location"] = location
+        if start is not None:
+            body["start"] = self._rfc3339(start, tz)
+        if end is not None:
+            body["end"] = self._rfc3339(end, tz)
+        return body
+
     def create_event(self, e: Event, duration_minutes: int = 60, tz: str = "UTC") -> str:
         body = self._event_body(e, duration_minutes=duration_minutes, tz=tz)
         logger.info("google calendar: creating event name='{}' date={} tz={}", e.name, e.date, tz)
-        created = (
-            self.service.events()
-            .insert(calendarId=self.calendar_id, body=body)
-            .execute()
-        )
+        created = self.execute("insert", self.service.events().insert(calendarId=self.calendar_id, body=body))
         return created.get("id")
 
+    def _unchanged(self, current: dict, field: str, value: Any) -> bool:
+        if field in ("start", "end"):
+            try:
+                a = datetime.fromisoformat(current[field]["dateTime"].replace("Z", "+00:00"))
+                b = datetime.fromisoformat(value["dateTime"])
+                return a == b
+            except Exception:
+                return False
+        return current.get(field) == value
+
     def update_event(
         self,
         event_id: str,
@@ -50,28 +143,205 @@ class GoogleCalendarWrapper:
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
         tz: str = "UTC",
+        current: Optional[dict] = None,
+        etag: Optional[str] = None,
     ) -> dict:
-        current = self.service.events().get(calendarId=self.calendar_id, eventId=event_id).execute()
-        if name is not None:
-            current["summary"] = name
-        if description is not None:
-            current["description"] = description
-        if location is not None:
-            current["location"] = location
-        if start is not None:
-            current["start"] = self._rfc3339(start, tz)
-        if end is not None:
-            current["end"] = self._rfc3339(end, tz)
-        logger.info("google calendar: updating event id={} name='{}'", event_id, current.get("summary"))
-        updated = (
-            self.service.events()
-            .update(calendarId=self.calendar_id, eventId=event_id, body=current)
-            .execute()
-        )
-        return updated
+        """Patch only the given fields in a single request (no read first).
+
+        If the caller already holds the event (current), fields that did not change are
+        not sent, nothing is sent at all when nothing changed, and its etag is used for
+        If-Match so a concurrent edit fails with 412 instead of being overwritten.
+        """
+        body = self._patch_body(name, description, location, start, end, tz)
+        if current is not None:
+            body = {k: v for k, v in body.items() if not self._unchanged(current, k, v)}
+            etag = etag or current.get("etag")
+            if not body:
+                logger.info("google calendar: event id={} unchanged, skipping update", event_id)
+                return current
+        if not body:
+            return {"id": event_id}
+        logger.info("google calendar: patching event id={} fields={}", event_id, sorted(body))
+        request = self.service.events().patch(calendarId=self.calendar_id, eventId=event_id, body=body)
+        if etag:
+            request.headers["If-Match"] = etag
+        return self.execute("patch", request)
+
+    def get_event(self, event_id: str) -> Optional[dict]:
+        """The event resource, or None if it was deleted (404/410 or status cancelled)."""
+        try:
+            event = self.execute("get", self.service.events().get(calendarId=self.calendar_id, eventId=event_id))
+        except Exception as e:
+            if _outcome(e) in ("404", "410"):
+                return None
+            raise
+        return None if event.get("status") == "cancelled" else event
 
     def delete_event(self, event_id: str) -> None:
         logger.info("google calendar: deleting event id={}", event_id)
-        self.service.events().delete(calendarId=self.calendar_id, eventId=event_id).execute()
+        self.execute("delete", self.service.events().delete(calendarId=self.calendar_id, eventId=event_id))
         return None
 
+    def batch(self, chunk_size: int = CALENDAR_BATCH_LIMIT) -> "CalendarBatch":
+        """Collect inserts/updates/deletes and send them as Calendar batch requests.
+
+            with wrapper.batch() as b:
+                b.create_event(evt, tz="Asia/Jerusalem")
+                b.delete_event(old_id)
+            results = b.results
+        """
+        return CalendarBatch(self, chunk_size=chunk_size)
+
+
+class CalendarBatch:
+    """Queued Calendar writes, executed in chunks of at most chunk_size per HTTP batch.
+
+    Each queued call returns a request id; results (in queue order) carry the
+    response or the per-item error. Optional per-item callbacks get the BatchResult.
+    """
+
+    def __init__(self, wrapper: GoogleCalendarWrapper, chunk_size: int = CALENDAR_BATCH_LIMIT) -> None:
+        self.wrapper = wrapper
+        self.chunk_size = max(1, min(chunk_size, CALENDAR_BATCH_LIMIT))
+        self.results: List[BatchResult] = []
+        self._ops: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def __enter__(self) -> "CalendarBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.execute()
+
+    def _add(self, op: str, request: Any, event_id: Optional[str], callback: Optional[Callable[[BatchResult], Any]]) -> str:
+        request_id = str(len(self._ops) + len(self.results))
+        self._ops.append((BatchResult(op=op, request_id=request_id, event_id=event_id), request, callback))
+        return request_id
+
+    def create_event(
+        self,
+        e: Event,
+        duration_minutes: int = 60,
+        tz: str = "UTC",
+        callback: Optional[Callable[[BatchResult], Any]] = None,
+    ) -> str:
+        w = self.wrapper
+        body = w._event_body(e, duration_minutes=duration_minutes, tz=tz)
+        request = w.service.events().insert(calendarId=w.calendar_id, body=body)
+        return self._add("insert", request, None, callback)
+
+    def update_event(
+        self,
+        event_id: str,
+        *,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "UTC",
+        etag: Optional[str] = None,
+        callback: Optional[Callable[[BatchResult], Any]] = None,
+    ) -> str:
+        # A batch cannot read-modify-write, so updates only send the changed fields.
+        w = self.wrapper
+        body = w._patch_body(name, description, location, start, end, tz)
+        request = w.service.events().patch(calendarId=w.calendar_id, eventId=event_id, body=body)
+        if etag:
+            request.headers["If-Match"] = etag
+        return self._add("update", request, event_id, callback)
+
+    def delete_event(self, event_id: str, callback: Optional[Callable[[BatchResult], Any]] = None) -> str:
+        w = self.wrapper
+        request = w.service.events().delete(calendarId=w.calendar_id, eventId=event_id)
+        return self._add("delete", request, event_id, callback)
+
+    def execute(self) -> List[BatchResult]:
+        ops, self._ops = self._ops, []
+        pending: Dict[str, tuple] = {}
+
+        def _send(chunk: List[tuple]) -> List[tuple]:
+            """HTTP batches for the chunk; (response, exception) per item, in chunk order.
+            Items rate limited on their own (403 rateLimitExceeded, 429) inside a batch that
+            succeeded are sent again in a new batch after the throttle's backoff.
+            """
+            throttle = get_throttle("calendar")
+            answers: Dict[str, tuple] = {}
+            todo = chunk
+            attempt = 0
+            while True:
+                batch = self.wrapper.service.new_batch_http_request()
+                for result, request, _ in todo:
+                    answers.pop(result.request_id, None)
+                    batch.add(request, callback=lambda rid, resp, exc: answers.__setitem__(rid, (resp, exc)),
+                              request_id=result.request_id)
+                # Every call in the batch counts against the quota; inserts make it unsafe to repeat.
+                has_insert = any(result.op == "insert" for result, _, _ in todo)
+                try:
+                    throttle.call(batch.execute, cost=len(todo), server_errors=not has_insert)
+                except Exception as e:
+                    if not attempt:
+                        raise
+                    # The first batch's answers stand; only the resent items get the error.
+                    answers.update((result.request_id, (None, e)) for result, _, _ in todo)
+                    break
+                limited = []
+                for op in todo:
+                    _, exception = answers.get(op[0].request_id, (None, None))
+                    if exception is not None and is_rate_limited(exception):
+                        limited.append((op, exception))
+                delay = throttle.retry_delay(attempt, limited[0][1], server_errors=False) if limited else None
+                if delay is None:
+                    break
+                logger.info("google calendar: {} of {} batch ops rate limited, resending", len(limited), len(todo))
+                time.sleep(delay)
+                todo = [op for op, _ in limited]
+                attempt += 1
+            return [answers.get(result.request_id) or (None, MissingBatchResponse(
+                f"no response for batch {result.op} request {result.request_id}")) for result, _, _ in chunk]
+
+        def _on_response(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+            result, callback = pending.pop(request_id)
+            metrics.CALENDAR_REQUESTS.inc(_BATCH_OPS[result.op], _outcome(exception))
+            if exception is not None:
+                result.error = exception
+                logger.info("google calendar: batch {} id={} failed: {}", result.op, result.event_id, exception)
+            else:
+                result.response = response or {}
+                if result.op == "insert":
+                    result.event_id = result.response.get("id")
+            if callback is not None:
+                callback(result)
+
+        for i in range(0, len(ops), self.chunk_size):
+            chunk = ops[i:i + self.chunk_size]
+            for result, request, callback in chunk:
+                pending[result.request_id] = (result, callback)
+            logger.info("google calendar: executing batch of {} ops", len(chunk))
+            cassette = get_cassette()
+            try:
+                with metrics.STAGE_SECONDS.time("calendar_batch"):
+                    if cassette:
+                        answers = cassette.call(
+                            "calendar", partial(_send, chunk),
+                            request=[_describe(_BATCH_OPS[result.op], request) for result, request, _ in chunk],
+                            encode=lambda items: [{"error": encode_error(e)} if e else {"response": r} for r, e in items],
+                            decode=lambda items: [(a.get("response"), decode_error(a["error"]) if "error" in a else None)
+                                                  for a in items],
+                        )
+                    else:
+                        answers = _send(chunk)
+            except Exception as e:
+                metrics.CALENDAR_REQUESTS.inc("batch", _outcome(e))
+                # The whole HTTP batch failed; report it on every item.
+                for result, _, _ in chunk:
+                    _on_response(result.request_id, None, e)
+            else:
+                metrics.CALENDAR_REQUESTS.inc("batch", "ok")
+                for (result, _, _), (response, exception) in zip(chunk, answers):
+                    _on_response(result.request_id, response, exception)
+            self.results.extend(result for result, _, _ in chunk)
+        return self.results
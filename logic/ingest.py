@@ -0,0 +1,285 @@
+"""Incremental ingestion of WhatsApp chat exports into their calendars.
+
+    PYTHONPATH=. python logic/ingest.py gan=exports/gan.txt class5=exports/class5.txt
+
+Each chat goes to the calendar CHAT_CALENDARS routes it to (see chat_router). Re-running
+on a newer export of the same chat only processes the messages added since, and retries
+the ones that failed.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+from loguru import logger
+from chat_router import ChatRouter, get_default_router
+from google_wrapper import GoogleCalendarWrapper
+from near_dup import NearDuplicateIndex, get_default_near_dups
+from parse_and_sync_service import process_message
+from parse_cache import normalize_text
+from text_patterns import has_absolute_date
+from utils.whatsapp_export import ChatMessage, iter_whatsapp_chat
+
+if TYPE_CHECKING:
+    from calendar_pool import CalendarClientPool
+
+
+DEFAULT_LEDGER_PATH = os.getenv("INGEST_LEDGER_DB", "ingest_ledger.db")
+
+
+def _same_reference(message: ChatMessage, earlier: Dict[str, Any]) -> bool:
+    """Whether the message means the same thing as the earlier one it repeats: it names its
+    dates, or was posted the same day. "מחר חוג ב16:00" a week later is next week's class.
+    """
+    if has_absolute_date(message.text):
+        return True
+    stamp = earlier.get("timestamp")
+    return bool(stamp and message.timestamp and datetime.fromisoformat(stamp).date() == message.timestamp.date())
+
+
+def message_fingerprint(message: ChatMessage) -> str:
+    """Stable id for a message across re-exports: timestamp + author + text hash."""
+    text_hash = hashlib.sha256(normalize_text(message.text).encode("utf-8")).hexdigest()
+    stamp = message.timestamp.isoformat() if message.timestamp else f"{message.date} {message.time}"
+    return hashlib.sha256(f"{stamp}\0{message.author or ''}\0{text_hash}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Watermark:
+    timestamp: Optional[datetime]
+    offset: int
+
+
+@dataclass
+class IngestReport:
+    total: int = 0
+    skipped_old: int = 0
+    skipped_seen: int = 0
+    processed: int = 0
+    failed: int = 0
+    events: int = 0
+    # Edited/re-posted variants of an earlier message: skipped, or sent as an update of its event.
+    near_duplicates: int = 0
+    linked_updates: int = 0
+
+
+class IngestLedger:
+    """SQLite ledger of processed messages and a per-chat watermark."""
+
+    def __init__(self, db_path: str = DEFAULT_LEDGER_PATH) -> None:
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " fingerprint TEXT PRIMARY KEY, chat_id TEXT NOT NULL, timestamp TEXT,"
+            " kind TEXT, action TEXT, event_id TEXT, processed_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS messages_chat ON messages(chat_id, timestamp);"
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " chat_id TEXT PRIMARY KEY, timestamp TEXT, byte_offset INTEGER NOT NULL, updated_at REAL NOT NULL);"
+        )
+        self._db.commit()
+
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT chat_id, timestamp, kind, action, event_id FROM messages WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("chat_id", "timestamp", "kind", "action", "event_id"), row))
+
+    def seen(self, fingerprint: str) -> bool:
+        return self.get(fingerprint) is not None
+
+    def record(self, fingerprint: str, chat_id: str, message: ChatMessage, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages"
+                " (fingerprint, chat_id, timestamp, kind, action, event_id, processed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    fingerprint,
+                    chat_id,
+                    message.timestamp.isoformat() if message.timestamp else None,
+                    result.get("kind"),
+                    result.get("action"),
+                    result.get("event_id"),
+                    time.time(),
+                ),
+            )
+
+    def watermark(self, chat_id: str) -> Optional[Watermark]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT timestamp, byte_offset FROM watermarks WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        stamp, offset = row
+        return Watermark(datetime.fromisoformat(stamp) if stamp else None, offset)
+
+    def set_watermark(self, chat_id: str, mark: Watermark) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO watermarks (chat_id, timestamp, byte_offset, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, mark.timestamp.isoformat() if mark.timestamp else None, mark.offset, time.time()),
+            )
+
+    def commit(self) -> None:
+        with self._lock:
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+def ingest_chat(
+    file_path: str,
+    chat_id: str,
+    wrapper: GoogleCalendarWrapper,
+    tz: str,
+    ledger: IngestLedger,
+    dayfirst: bool = False,
+    process: Callable[..., Dict[str, Any]] = process_message,
+    commit_every: int = 50,
+    near_dups: Optional[NearDuplicateIndex] = None,
+) -> IngestReport:
+    """Run only the new messages of a (re-)exported chat through process_message.
+
+    Messages older than the chat's watermark are skipped without a lookup; the rest
+    are checked against the ledger by fingerprint. The watermark only advances past
+    messages that were processed successfully, so failures are retried next time.
+
+    With near_dups (default: NEAR_DUPS=1, see near_dup.get_default_near_dups), a message
+    that is a near-duplicate of an earlier one in the chat (an edit, a re-post with
+    different emoji) reuses the earlier result without an LLM call when its dates/times/links
+    are the same, and otherwise is processed as an update of the earlier message's event.
+    Both only apply when the text names its dates or the two were posted the same day:
+    a repeated "מחר חוג ב16:00" a week later is a new occurrence.
+    """
+    report = IngestReport()
+    near_dups = near_dups if near_dups is not None else get_default_near_dups()
+    mark = ledger.watermark(chat_id)
+    since = mark.timestamp if mark else None
+    new_mark = mark or Watermark(None, 0)
+    advancing = True
+    logger.info("ingest: chat={} file={} watermark={}", chat_id, file_path, since)
+    for message in iter_whatsapp_chat(file_path, dayfirst=dayfirst):
+        report.total += 1
+        if since and message.timestamp and message.timestamp < since:
+            report.skipped_old += 1
+            continue
+        fingerprint = message_fingerprint(message)
+        if ledger.seen(fingerprint):
+            report.skipped_seen += 1
+        else:
+            match = near_dups.query(message.text, scope=chat_id) if near_dups is not None else None
+            earlier = ledger.get(match.key) if match else None
+            if earlier and not _same_reference(message, earlier):
+                earlier = None
+            try:
+                if earlier and match.same_signals:
+                    logger.info("ingest: message at offset={} repeats an earlier one (similarity={:.2f}), skipping",
+                                message.offset, match.similarity)
+                    result = {"kind": earlier["kind"], "action": "duplicate", "event_id": earlier["event_id"]}
+                    report.near_duplicates += 1
+                elif earlier and earlier.get("event_id"):
+                    logger.info("ingest: message at offset={} changes {} -> {} of event id={}",
+                                message.offset, match.removed, match.added, earlier["event_id"])
+                    result = process(message.text, wrapper, tz, linked_event_id=earlier["event_id"])
+                    report.near_duplicates += 1
+                    if result.get("event_id") == earlier["event_id"]:
+                        report.linked_updates += 1
+                else:
+                    result = process(message.text, wrapper, tz)
+            except Exception as e:
+                logger.info("ingest: message at offset={} failed: {}", message.offset, e)
+                report.failed += 1
+                advancing = False
+                continue
+            ledger.record(fingerprint, chat_id, message, result)
+            if near_dups is not None:
+                near_dups.add(fingerprint, message.text, scope=chat_id)
+            report.processed += 1
+            if result.get("event_id") and result.get("action") != "duplicate":
+                report.events += 1
+        if advancing and message.timestamp and (new_mark.timestamp is None or message.timestamp >= new_mark.timestamp):
+            new_mark = Watermark(message.timestamp, message.end_offset)
+            ledger.set_watermark(chat_id, new_mark)
+        if report.processed and report.processed % commit_every == 0:
+            ledger.commit()
+    ledger.commit()
+    logger.info("ingest: chat={} done {}", chat_id, report)
+    return report
+
+
+def ingest_chats(
+    chats: Dict[str, str],
+    pool: "CalendarClientPool",
+    ledger: IngestLedger,
+    router: Optional[ChatRouter] = None,
+    workers: int = 4,
+    dayfirst: bool = False,
+    process: Callable[..., Dict[str, Any]] = process_message,
+    near_dups: Optional[NearDuplicateIndex] = None,
+) -> Dict[str, IngestReport]:
+    """ingest_chat for several chats ({chat_id: export path}) in parallel, each into the
+    calendar the router maps it to. A chat is ingested by a single worker, start to end,
+    so its messages keep their order; different chats share the pool's clients.
+    """
+    router = router or ChatRouter()
+
+    def _one(chat_id: str, path: str) -> IngestReport:
+        calendar_id = router.calendar_for(chat_id)
+        mirror = pool.mirror(calendar_id)
+        handler = partial(process, mirror=mirror) if mirror is not None else process
+        return ingest_chat(path, chat_id, pool.get(calendar_id), pool.tz, ledger, dayfirst=dayfirst,
+                           process=handler, near_dups=near_dups)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chats) or 1)), thread_name_prefix="ingest") as executor:
+        futures = {chat_id: executor.submit(_one, chat_id, path) for chat_id, path in chats.items()}
+        reports = {chat_id: future.result() for chat_id, future in futures.items()}
+    logger.info("ingest: {} chats done with {} workers", len(reports), workers)
+    return reports
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("chats", nargs="+", metavar="CHAT_ID=PATH", help="chat id and the path of its export")
+    parser.add_argument("--ledger", default=DEFAULT_LEDGER_PATH)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "4")))
+    parser.add_argument("--dayfirst", action="store_true")
+    args = parser.parse_args(argv)
+    chats = {}
+    for spec in args.chats:
+        chat_id, sep, path = spec.partition("=")
+        if not sep or not chat_id or not path:
+            parser.error(f"expected CHAT_ID=PATH, got {spec!r}")
+        chats[chat_id] = path
+
+    from calendar_pool import CalendarClientPool
+
+    pool = CalendarClientPool.from_env()
+    ledger = IngestLedger(args.ledger)
+    try:
+        reports = ingest_chats(chats, pool, ledger, router=get_default_router(), workers=args.workers, dayfirst=args.dayfirst)
+    finally:
+        ledger.close()
+    for chat_id, report in reports.items():
+        print(f"{chat_id}: {report}")
+    return 1 if any(report.failed for report in reports.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from loguru import logger
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    args: tuple = field(repr=False)
+    status: str = "queued"  # queued | running | done | failed
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    exception: Optional[BaseException] = field(default=None, repr=False)
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished (True) or timeout passed (False)."""
+        return self._done.wait(timeout)
+
+
+class JobQueue:
+    """Bounded in-process queue drained by a fixed pool of worker threads.
+
+    submit() raises QueueFull instead of blocking when max_queue jobs are waiting.
+    Finished jobs are kept (up to max_finished, oldest dropped first) so their
+    result can be polled.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Any],
+        workers: int = 4,
+        max_queue: int = 100,
+        max_finished: int = 1000,
+    ) -> None:
+        self.handler = handler
+        self.workers = workers
+        self.max_finished = max_finished
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info("job queue: started {} workers max_queue={}", self.workers, self._queue.maxsize)
+
+    def stop(self, wait: bool = True) -> None:
+        """Let workers finish the jobs already queued, then exit."""
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+        self._threads = []
+
+    def submit(self, *args: Any) -> Job:
+        job = Job(id=uuid.uuid4().hex, args=args)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull(f"job queue is full ({self._queue.maxsize} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts["depth"] = self._queue.qsize()
+        return counts
+
+    def _work(self, jobs: "Optional[queue.Queue[Optional[Job]]]" = None) -> None:
+        jobs = jobs or self._queue
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            job.status = "running"
+            try:
+                job.result = self.handler(*job.args)
+                job.status = "done"
+            except Exception as e:
+                logger.info("job queue: job {} failed: {}", job.id, e)
+                job.error = str(e)
+                job.exception = e
+                job.status = "failed"
+            job.finished_at = time.time()
+            job.args = ()
+            job._done.set()
+            self._forget_old()
+
+    def _forget_old(self) -> None:
+        with self._lock:
+            finished = [j.id for j in self._jobs.values() if j.finished_at is not None]
+            for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+
+class ShardedJobQueue(JobQueue):
+    """JobQueue whose jobs are routed by key (a chat id) to one of `workers` shards.
+
+    Each shard is a bounded queue drained by a single thread, so jobs with the same key
+    run one at a time in submission order (a create is never overtaken by the update
+    that follows it), while different keys are processed in parallel.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Any],
+        workers: int = 4,
+        max_queue: int = 100,
+        max_finished: int = 1000,
+    ) -> None:
+        super().__init__(handler, workers=workers, max_queue=max_queue, max_finished=max_finished)
+        self._shards: "List[queue.Queue[Optional[Job]]]" = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+
+    def shard(self, key: str) -> int:
+        # Stable across processes (unlike hash()), so a chat keeps its shard between restarts.
+        return zlib.crc32(key.encode("utf-8")) % len(self._shards)
+
+    def start(self) -> None:
+        for i, shard in enumerate(self._shards):
+            t = threading.Thread(target=self._work, args=(shard,), name=f"job-shard-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info("job queue: started {} shards max_queue={} per shard", len(self._shards), self._queue.maxsize)
+
+    def stop(self, wait: bool = True) -> None:
+        for shard in self._shards:
+            shard.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+        self._threads = []
+
+    def submit(self, key: Optional[str], *args: Any) -> Job:
+        """Queue handler(*args) on key's shard; with no key the job has no ordering constraint."""
+        job = Job(id=uuid.uuid4().hex, args=args)
+        shard = self._shards[self.shard(key if key is not None else job.id)]
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            shard.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull(f"job queue shard is full ({shard.maxsize} waiting)")
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        counts = super().stats()
+        counts["depth"] = sum(shard.qsize() for shard in self._shards)
+        return counts
@@ -0,0 +1,212 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Seconds; covers in-process stages (sub-millisecond) up to slow LLM calls.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+ENABLED = os.getenv("METRICS", "1") != "0"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter; label values are passed positionally in label_names order."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, value: float = 1) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.label_names, k)} {_number(v)}" for k, v in items]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Bucketed observations (Prometheus histogram: cumulative buckets, _sum and _count)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, amount: float, *label_values: str) -> None:
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += amount
+
+    def time(self, *label_values: str) -> "Timer":
+        """Context manager that observes the elapsed wall time of its block."""
+        return Timer(self, label_values)
+
+    def count(self, *label_values: str) -> int:
+        with self._lock:
+            entry = self._values.get(label_values)
+            return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        out = []
+        for labels, (counts, total) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                out.append(f"{self.name}_bucket{_label_text(self.label_names, labels, le)} {running}")
+            out.append(f"{self.name}_sum{_label_text(self.label_names, labels)} {_number(total)}")
+            out.append(f"{self.name}_count{_label_text(self.label_names, labels)} {running}")
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram: Histogram, label_values: Tuple[str, ...]) -> None:
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+def timed(stage: str) -> Callable:
+    """Decorator recording each call of a (sync or async) function under STAGE_SECONDS{stage}."""
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with STAGE_SECONDS.time(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def gauge_lines(name: str, help_text: str, values: Dict[str, float], label: Optional[str] = None) -> List[str]:
+    """Exposition lines for a gauge computed at scrape time (e.g. queue depth)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for key, value in sorted(values.items()):
+        labels = f'{{{label}="{_escape(key)}"}}' if label else ""
+        lines.append(f"{name}{labels} {_number(value)}")
+    return lines
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_sanity_stage_seconds", "Wall time per pipeline stage.", ("stage",))
+LLM_REQUESTS = REGISTRY.counter(
+    "chat_sanity_llm_requests_total", "Agent runs by agent and outcome.", ("agent", "outcome"))
+LLM_TOKENS = REGISTRY.counter(
+    "chat_sanity_llm_tokens_total", "Tokens reported by the model, by agent and direction.", ("agent", "direction"))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "chat_sanity_parse_cache_lookups_total", "Parse cache lookups by input kind and result.", ("kind", "result"))
+PREFILTER_DECISIONS = REGISTRY.counter(
+    "chat_sanity_prefilter_total", "Pre-filter decisions (pass = sent to the LLM) by reason.", ("result", "reason"))
+CALENDAR_REQUESTS = REGISTRY.counter(
+    "chat_sanity_calendar_requests_total", "Calendar API requests by operation and outcome.", ("op", "outcome"))
+THROTTLE_RETRIES = REGISTRY.counter(
+    "chat_sanity_throttle_retries_total", "Retried backend calls by backend and cause.", ("backend", "cause"))
+THROTTLE_WAIT_SECONDS = REGISTRY.counter(
+    "chat_sanity_throttle_wait_seconds_total", "Time spent waiting for rate-limit tokens.", ("backend",))
+PROMPT_TOKENS_SAVED = REGISTRY.counter(
+    "chat_sanity_prompt_tokens_saved_total", "Estimated tokens removed from prompts by compaction.")
+
+
+def render() -> str:
+    return REGISTRY.render()
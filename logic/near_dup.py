@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+from loguru import logger
+from text_patterns import DAY_PATTERN, EDITED_RE, strip_marks
+
+
+DEFAULT_NUM_PERM = 64
+# 16 bands of 4 rows: pairs with Jaccard similarity ~0.5 and up become candidates.
+DEFAULT_BANDS = 16
+# Estimated Jaccard similarity above which a message is a variant of an earlier one.
+DEFAULT_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.6"))
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_PATH = os.getenv("NEAR_DUPS_DB", "near_dups.db")
+SHINGLE_SIZE = 5
+# Shorter texts ("תודה!", "👍") are not worth linking.
+MIN_CHARS = 16
+
+_EMPTY = (1 << 64) - 1
+# Links, times, dates, and weekday/relative day words (a correction may only change מחר to מחרתיים).
+_SIGNAL_RE = re.compile(
+    r"https?://\S+|\d{1,2}:\d{2}|\d{1,2}[./\-]\d{1,2}(?:[./\-]\d{2,4})?|\d{1,2}\s*(?:am|pm)\b|" + DAY_PATTERN,
+    re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+
+
+def shingle_text(text: str) -> str:
+    """Text reduced to what distinguishes announcements: no edit markers, emoji,
+    punctuation or marks; casefolded, whitespace collapsed.
+    """
+    text = EDITED_RE.sub(" ", unicodedata.normalize("NFKC", text or ""))
+    kept = [ch if unicodedata.category(ch)[0] in ("L", "N") or ch in ":/." else " " for ch in text.casefold()]
+    return _WS_RE.sub(" ", "".join(kept)).strip()
+
+
+def signals(text: str) -> List[str]:
+    """Dates, times, links and day words in the text, in order; variants that differ here are real updates."""
+    return [m.group(0).strip() for m in _SIGNAL_RE.finditer(strip_marks(EDITED_RE.sub(" ", text or "")))]
+
+
+def shingles(text: str, k: int = SHINGLE_SIZE) -> Set[int]:
+    s = shingle_text(text)
+    grams = {s[i:i + k] for i in range(max(1, len(s) - k + 1))} if s else set()
+    return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams}
+
+
+class MinHasher:
+    """num_perm hash functions as random 64-bit XOR masks over the (already uniform) blake2b
+    shingle hashes; min(map(...)) keeps the inner loop in C. Fixed seed, so signatures persist.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1) -> None:
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._masks = [rng.getrandbits(64) for _ in range(num_perm)]
+
+    def signature(self, hashed: Set[int]) -> Tuple[int, ...]:
+        if not hashed:
+            return tuple([_EMPTY] * self.num_perm)
+        values = list(hashed)
+        return tuple(min(map(mask.__xor__, values)) for mask in self._masks)
+
+
+def estimate_jaccard(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+@dataclass
+class NearDuplicate:
+    key: str
+    similarity: float
+    # Dates/times/links present only in the new text, or only in the earlier one.
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def same_signals(self) -> bool:
+        return not self.added and not self.removed
+
+
+def _diff(new: List[str], old: List[str]) -> Tuple[List[str], List[str]]:
+    return [s for s in new if s not in old], [s for s in old if s not in new]
+
+
+class NearDuplicateIndex:
+    """Streaming near-duplicate detector: MinHash signatures over character shingles with an
+    LSH band index, held in memory and optionally persisted to SQLite.
+
+    Entries are scoped (e.g. per chat), so identical announcements in different groups are
+    not linked. The oldest entries are dropped past max_entries.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        num_perm: int = DEFAULT_NUM_PERM,
+        bands: int = DEFAULT_BANDS,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (scope, signature, signals)
+        self._entries: "OrderedDict[str, Tuple[str, Tuple[int, ...], List[str]]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS near_dups ("
+                "key TEXT PRIMARY KEY, scope TEXT NOT NULL, signature BLOB NOT NULL,"
+                " signals TEXT NOT NULL, added REAL NOT NULL)"
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, scope, signature, signals FROM near_dups ORDER BY added DESC LIMIT ?", (max_entries,)
+            ).fetchall()
+            for key, scope, blob, sigs in reversed(rows):
+                signature = tuple(array("Q", blob))
+                if len(signature) == num_perm:
+                    self._put(key, scope, signature, json.loads(sigs))
+            logger.info("near dups: loaded {} signatures from {}", len(self._entries), db_path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield scope, band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def _put(self, key: str, scope: str, signature: Tuple[int, ...], sigs: List[str]) -> None:
+        self._remove(key)
+        self._entries[key] = (scope, signature, sigs)
+        for band_key in self._band_keys(scope, signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope, signature, _ = entry
+        for band_key in self._band_keys(scope, signature):
+            keys = self._buckets.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[band_key]
+
+    def _signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        if len(shingle_text(text)) < MIN_CHARS:
+            return None
+        return self.hasher.signature(shingles(text))
+
+    def query(self, text: str, scope: str = "") -> Optional[NearDuplicate]:
+        """The most similar earlier text in scope with estimated Jaccard >= threshold, if any."""
+        signature = self._signature(text)
+        if signature is None:
+            return None
+        with self._lock:
+            candidates: Set[str] = set()
+            for band_key in self._band_keys(scope, signature):
+                candidates |= self._buckets.get(band_key, set())
+            best: Optional[Tuple[float, str]] = None
+            for key in candidates:
+                similarity = estimate_jaccard(signature, self._entries[key][1])
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, key)
+            if best is None:
+                return None
+            added, removed = _diff(signals(text), self._entries[best[1]][2])
+        return NearDuplicate(best[1], best[0], added, removed)
+
+    def add(self, key: str, text: str, scope: str = "") -> None:
+        """Index text under key (e.g. the message fingerprint) for later queries."""
+        signature = self._signature(text)
+        if signature is None:
+            return
+        sigs = signals(text)
+        with self._lock:
+            self._put(key, scope, signature, sigs)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO near_dups (key, scope, signature, signals, added) VALUES (?, ?, ?, ?, ?)",
+                    (key, scope, array("Q", signature).tobytes(), json.dumps(sigs, ensure_ascii=False), time.time()),
+                )
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self._db.execute(
+                        "DELETE FROM near_dups WHERE key NOT IN"
+                        " (SELECT key FROM near_dups ORDER BY added DESC LIMIT ?)", (self.max_entries,)
+                    )
+                self._db.commit()
+
+    def link(self, key: str, text: str, scope: str = "") -> Optional[NearDuplicate]:
+        """query() then add(): the streaming form, one call per incoming message."""
+        match = self.query(text, scope)
+        self.add(key, text, scope)
+        return match
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+@lru_cache(maxsize=None)
+def get_default_near_dups() -> Optional[NearDuplicateIndex]:
+    """Process-wide index persisted to NEAR_DUPS_DB; None unless NEAR_DUPS=1."""
+    if os.getenv("NEAR_DUPS", "0") != "1":
+        return None
+    return NearDuplicateIndex(DEFAULT_PATH)
@@ -4,47 +4,101 @@ from typing import Optional, Dict, Any
 from loguru import logger
 from agent import route_and_parse, Event
 from google_wrapper import GoogleCalendarWrapper
+from calendar_mirror import CalendarMirror, _as_utc
+import metrics
+from throttle import is_retryable
+from title_index import DEFAULT_THRESHOLD, best_match
 
 
 SEARCH_WINDOW_MINUTES = 120
 
 
-def _time_bounds(dt: datetime) -> tuple[str, str]:
+def _time_bounds(dt: datetime, tz: str = "UTC") -> tuple[str, str]:
+    # Parsed dates are naive local times in tz; events.list wants RFC 3339 instants.
+    dt = _as_utc(dt, tz)
     start = dt - timedelta(minutes=SEARCH_WINDOW_MINUTES)
     end = dt + timedelta(minutes=SEARCH_WINDOW_MINUTES)
-    return start.isoformat() + "Z", end.isoformat() + "Z"
+    return start.isoformat().replace("+00:00", "Z"), end.isoformat().replace("+00:00", "Z")
 
 
-def find_existing_event(wrapper: GoogleCalendarWrapper, name: str, when: datetime) -> Optional[str]:
+@metrics.timed("find_existing")
+def find_existing_item(
+    wrapper: GoogleCalendarWrapper,
+    name: str,
+    when: datetime,
+    mirror: Optional[CalendarMirror] = None,
+    tz: str = "UTC",
+    threshold: float = DEFAULT_THRESHOLD,
+) -> Optional[Dict[str, Any]]:
+    """Like find_existing_event, but return the whole event resource (with its etag)."""
+    if mirror is not None:
+        try:
+            return mirror.find(name, when, SEARCH_WINDOW_MINUTES, tz=tz, threshold=threshold)
+        except Exception as e:
+            logger.info("find_existing_event: mirror lookup failed, using events.list: {}", e)
     try:
-        time_min, time_max = _time_bounds(when)
-        events = (
-            wrapper.service.events()
-            .list(
+        # No server-side q=name: it misses reworded, niqqud or rtl()-reordered titles.
+        # The window is small, so list everything in it and match titles locally.
+        time_min, time_max = _time_bounds(when, tz)
+        events = wrapper.execute(
+            "list",
+            wrapper.service.events().list(
                 calendarId=wrapper.calendar_id,
                 timeMin=time_min,
                 timeMax=time_max,
                 singleEvents=True,
                 orderBy="startTime",
-                q=name,
-            )
-            .execute()
+            ),
         )
-        for item in events.get("items", []):
-            if not item.get("summary"):
-                continue
-            if name in item["summary"] or item["summary"] in name:
-                return item.get("id")
+        return best_match(name, events.get("items", []), threshold)
     except Exception as e:
+        if is_retryable(e):
+            # Still throttled after retries: fail the message rather than create a duplicate.
+            raise
         logger.info("find_existing_event: list failed: {}", e)
     return None
 
 
-def sync_event(event: Event, wrapper: GoogleCalendarWrapper, tz: str) -> Dict[str, Any]:
-    existing_id = find_existing_event(wrapper, event.name, event.date)
-    if existing_id:
-        updated = wrapper.update_event(
-            existing_id,
+def find_existing_event(
+    wrapper: GoogleCalendarWrapper,
+    name: str,
+    when: datetime,
+    mirror: Optional[CalendarMirror] = None,
+    tz: str = "UTC",
+    threshold: float = DEFAULT_THRESHOLD,
+) -> Optional[str]:
+    """Id of an event within SEARCH_WINDOW_MINUTES of when whose title is similar to name
+    (title_index.title_similarity >= threshold, default TITLE_MATCH_THRESHOLD).
+    """
+    item = find_existing_item(wrapper, name, when, mirror=mirror, tz=tz, threshold=threshold)
+    return item.get("id") if item else None
+
+
+def _is_precondition_failed(e: Exception) -> bool:
+    status = getattr(getattr(e, "resp", None), "status", None)
+    return str(status) == "412"
+
+
+@metrics.timed("sync_event")
+def sync_event(
+    event: Event,
+    wrapper: GoogleCalendarWrapper,
+    tz: str,
+    mirror: Optional[CalendarMirror] = None,
+    linked_event_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Create the event, or patch the matching one. linked_event_id is the event created for
+    an earlier version of the same announcement (see near_dup); it is updated when the
+    title/time lookup finds nothing, e.g. because the corrected time moved it out of the window.
+    """
+    existing = find_existing_item(wrapper, event.name, event.date, mirror=mirror, tz=tz)
+    if not existing and linked_event_id:
+        existing = wrapper.get_event(linked_event_id)
+        if existing:
+            logger.info("sync_event: updating linked event id={}", linked_event_id)
+    if existing:
+        existing_id = existing.get("id")
+        fields = dict(
             name=event.name,
             description=event.description,
             location=event.location,
@@ -52,12 +106,42 @@ def sync_event(event: Event, wrapper: GoogleCalendarWrapper, tz: str) -> Dict[st
             end=event.date + timedelta(minutes=60),
             tz=tz,
         )
-        return {"action": "updated", "event_id": updated.get("id", existing_id)}
+        try:
+            # The lookup already returned the event, so this is a single patch (or nothing).
+            updated = wrapper.update_event(existing_id, current=existing, **fields)
+        except Exception as e:
+            if not _is_precondition_failed(e):
+                raise
+            # Someone edited the event since we read it: re-read it and diff against (and
+            # If-Match) the latest version, so their other changes are kept.
+            logger.info("sync_event: etag mismatch for id={}, re-reading", existing_id)
+            existing = wrapper.get_event(existing_id)
+            if existing is None:
+                logger.info("sync_event: event id={} was deleted meanwhile, creating", existing_id)
+                return _create(event, wrapper, tz, mirror)
+            updated = wrapper.update_event(existing_id, current=existing, **fields)
+        if mirror is not None and updated:
+            mirror.upsert(updated)
+        action = "unchanged" if updated is existing else "updated"
+        return {"action": action, "event_id": updated.get("id", existing_id)}
+    return _create(event, wrapper, tz, mirror)
+
+
+def _create(event: Event, wrapper: GoogleCalendarWrapper, tz: str, mirror: Optional[CalendarMirror]) -> Dict[str, Any]:
     new_id = wrapper.create_event(event, duration_minutes=60, tz=tz)
+    if mirror is not None and new_id:
+        mirror.upsert(dict(wrapper._event_body(event, duration_minutes=60, tz=tz), id=new_id))
     return {"action": "created", "event_id": new_id}
 
 
-def process_message(text: str, wrapper: GoogleCalendarWrapper, tz: str) -> Dict[str, Any]:
+@metrics.timed("process_message")
+def process_message(
+    text: str,
+    wrapper: GoogleCalendarWrapper,
+    tz: str,
+    mirror: Optional[CalendarMirror] = None,
+    linked_event_id: Optional[str] = None,
+) -> Dict[str, Any]:
     parsed = route_and_parse(text)
     result: Dict[str, Any] = {
         "kind": getattr(parsed, "kind", "other"),
@@ -65,6 +149,6 @@ def process_message(text: str, wrapper: GoogleCalendarWrapper, tz: str) -> Dict[
         "date": getattr(parsed, "date", None),
     }
     if getattr(parsed, "kind", None) == "event":
-        sync = sync_event(parsed, wrapper, tz)
+        sync = sync_event(parsed, wrapper, tz, mirror=mirror, linked_event_id=linked_event_id)
         result.update(sync)
     return result
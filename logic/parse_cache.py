@@ -0,0 +1,248 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+from loguru import logger
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_DISK_ENTRIES = 100_000
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a message for cache keying: NFKC, collapsed whitespace, trimmed."""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WS_RE.sub(" ", text).strip()
+
+
+def _digest(kind: str, payload: bytes, model_name: str, prompt_version: str, context: str = "") -> str:
+    h = hashlib.sha256()
+    for part in (kind, model_name, prompt_version, context):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    h.update(payload)
+    return h.hexdigest()
+
+
+def text_key(text: str, model_name: str, prompt_version: str, context: str = "") -> str:
+    """context: anything else the parse depends on (prompt compaction settings, and the
+    reference date for messages with relative dates like "מחר").
+    """
+    return _digest("text", normalize_text(text).encode("utf-8"), model_name, prompt_version, context)
+
+
+def image_key(image_bytes: bytes, model_name: str, prompt_version: str, context: str = "") -> str:
+    return _digest("image", image_bytes, model_name, prompt_version, context)
+
+
+class ParseCache:
+    """Two-tier cache of parsed LLM outputs (serialized JSON) keyed by content hash.
+
+    The memory tier is a bounded LRU; the optional disk tier is a SQLite file that
+    survives restarts. Both tiers honour the same TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple[Optional[float], str]]" = OrderedDict()
+        self._counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "writes": 0,
+            "evictions": 0,
+            "expired": 0,
+            "image_matches": 0,
+        }
+        # Cache key of an image's parse -> its perceptual hash and thumbnail (flyer dedup).
+        self._image_hashes: "OrderedDict[str, tuple[int, Optional[bytes]]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, expires REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS parse_cache_created ON parse_cache(created)")
+            # Entries of the old phash-only table cannot be confirmed against a thumbnail.
+            self._db.execute("DROP TABLE IF EXISTS image_hashes")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS image_prints (key TEXT PRIMARY KEY, phash TEXT NOT NULL, thumb BLOB)"
+            )
+            self._db.commit()
+            rows = self._db.execute("SELECT key, phash, thumb FROM image_prints ORDER BY rowid DESC LIMIT ?",
+                                    (max_entries,))
+            for key, phash, thumb in reversed(rows.fetchall()):
+                self._image_hashes[key] = (int(phash, 16), thumb)
+
+    def _expires_at(self, now: float) -> Optional[float]:
+        return now + self.ttl_seconds if self.ttl_seconds else None
+
+    def _remember(self, key: str, expires: Optional[float], value: str) -> None:
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > now:
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._counters["expired"] += 1
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires FROM parse_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires = row
+                    if expires is None or expires > now:
+                        self._remember(key, expires, value)
+                        self._counters["hits"] += 1
+                        self._counters["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM parse_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters["expired"] += 1
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        expires = self._expires_at(now)
+        with self._lock:
+            self._remember(key, expires, value)
+            self._counters["writes"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO parse_cache (key, value, created, expires) VALUES (?, ?, ?, ?)",
+                    (key, value, now, expires),
+                )
+                if self._counters["writes"] % 100 == 0:
+                    self._prune_disk(now)
+                self._db.commit()
+
+    def _prune_disk(self, now: float) -> None:
+        self._db.execute("DELETE FROM parse_cache WHERE expires IS NOT NULL AND expires <= ?", (now,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM parse_cache").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM parse_cache WHERE key IN "
+                "(SELECT key FROM parse_cache ORDER BY created LIMIT ?)",
+                (overflow,),
+            )
+            self._counters["evictions"] += overflow
+
+    def add_image_hash(self, phash: int, key: str, thumb: Optional[bytes] = None) -> None:
+        """Remember that the image with this perceptual hash (and thumbnail) was parsed under key."""
+        with self._lock:
+            self._image_hashes[key] = (phash, thumb)
+            self._image_hashes.move_to_end(key)
+            while len(self._image_hashes) > self.max_entries:
+                self._image_hashes.popitem(last=False)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO image_prints (key, phash, thumb) VALUES (?, ?, ?)",
+                    (key, f"{phash:016x}", thumb),
+                )
+                self._db.commit()
+
+    def find_image(self, phash: int, max_distance: int,
+                   confirm: Optional[Callable[[Optional[bytes]], bool]] = None) -> Optional[str]:
+        """Cache key of a previously parsed image within max_distance bits of phash, nearest
+        first. A close hash is only a candidate: with confirm, it must also accept the
+        candidate's thumbnail (templated flyers that differ only in their text share a hash).
+        """
+        with self._lock:
+            candidates = sorted(
+                (distance, key, thumb)
+                for key, (known, thumb) in self._image_hashes.items()
+                if (distance := (known ^ phash).bit_count()) <= max_distance
+            )
+        for _, key, thumb in candidates:
+            if confirm is None or confirm(thumb):
+                with self._lock:
+                    self._counters["image_matches"] += 1
+                return key
+        return None
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (exp, _) in self._memory.items() if exp is not None and exp <= now]:
+                del self._memory[key]
+                self._counters["expired"] += 1
+            if self._db is not None:
+                self._prune_disk(now)
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._image_hashes.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM parse_cache")
+                self._db.execute("DELETE FROM image_prints")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters; every hit is one LLM call saved."""
+        with self._lock:
+            out: Dict[str, float] = dict(self._counters)
+            out["memory_entries"] = len(self._memory)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / lookups if lookups else 0.0
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+@lru_cache(maxsize=None)
+def get_default_cache() -> Optional[ParseCache]:
+    """Process-wide cache configured from env; None when PARSE_CACHE=0.
+
+    PARSE_CACHE_SIZE bounds the memory tier, PARSE_CACHE_TTL is in seconds (0 = no expiry)
+    and PARSE_CACHE_DB enables the SQLite tier at the given path.
+    """
+    if os.getenv("PARSE_CACHE", "1") == "0":
+        return None
+    cache = ParseCache(
+        max_entries=int(os.getenv("PARSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=float(os.getenv("PARSE_CACHE_TTL", DEFAULT_TTL_SECONDS)) or None,
+        db_path=os.getenv("PARSE_CACHE_DB") or None,
+    )
+    logger.info("parse cache: enabled size={} ttl={} db={}", cache.max_entries, cache.ttl_seconds, cache.db_path)
+    return cache
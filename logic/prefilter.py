@@ -0,0 +1,132 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from loguru import logger
+from text_patterns import DATE_TIME_PATTERNS, EVENT_KEYWORDS, PAYMENT_PATTERNS, WEEKDAY_WORDS, strip_marks, with_reversed
+
+
+# WhatsApp placeholders and system lines that never describe an event or task.
+PLACEHOLDER_PATTERNS = [
+    r"^<media omitted>$",
+    r"^<.*(omitted|הושמט).*>$",
+    r"^this message was deleted$",
+    r"^you deleted this message$",
+    r"^הודעה זו נמחקה$",
+    r"^null$",
+]
+
+SYSTEM_PATTERNS = [
+    r"joined using this group's invite link",
+    r"\b(left|joined)$",
+    r"changed (the subject|this group's icon|the group description|their phone number)",
+    r"messages and calls are end-to-end encrypted",
+    r"created group",
+    r"(הצטרף|הצטרפה|הצטרפ/ה).*(קבוצה|הזמנה)",
+    r"(יצא|יצאה|יצא/ה)$",
+    r"(צירף|צירפה|הוסיף|הוסיפה|הסיר|הסירה) את",
+    r"הודעות ושיחות מוצפנות",
+]
+
+def _has_letters_or_digits(text: str) -> bool:
+    return any(unicodedata.category(ch)[0] in ("L", "N") for ch in text)
+
+
+@dataclass
+class PrefilterConfig:
+    enabled: bool = True
+    # In audit mode rejected messages still go to the LLM, so false negatives can be counted.
+    audit: bool = False
+    extra_keywords: list[str] = field(default_factory=list)
+    max_audit_samples: int = 100
+
+
+class PreFilter:
+    """Deterministic gate in front of the LLM.
+
+    check() returns a reason for messages that carry no date/time, weekday,
+    payment-link or event-keyword signal, or None when the message should be
+    parsed by the model.
+    """
+
+    def __init__(self, config: Optional[PrefilterConfig] = None) -> None:
+        self.config = config or PrefilterConfig()
+        self._placeholder_re = re.compile("|".join(PLACEHOLDER_PATTERNS), re.IGNORECASE)
+        self._system_re = re.compile("|".join(SYSTEM_PATTERNS), re.IGNORECASE)
+        signal = (
+            DATE_TIME_PATTERNS
+            + PAYMENT_PATTERNS
+            + with_reversed(WEEKDAY_WORDS + EVENT_KEYWORDS + list(self.config.extra_keywords))
+        )
+        self._signal_re = re.compile("|".join(signal), re.IGNORECASE)
+        self._lock = threading.Lock()
+        self._counters: Counter = Counter()
+        self._reasons: Counter = Counter()
+        self.false_negatives: deque = deque(maxlen=self.config.max_audit_samples)
+
+    def reason(self, text: str) -> Optional[str]:
+        """Return why text is obviously not an event/task, or None if it has a signal."""
+        stripped = (text or "").strip()
+        if not stripped:
+            return "empty message"
+        if self._placeholder_re.search(stripped):
+            return "media or deleted placeholder"
+        if not _has_letters_or_digits(stripped):
+            return "emoji or punctuation only"
+        if self._signal_re.search(strip_marks(stripped)):
+            return None
+        if self._system_re.search(stripped):
+            return "system message"
+        return "no date, time, link or event keyword"
+
+    def check(self, text: str) -> Optional[str]:
+        """Like reason(), but counted in stats(); None means send the text to the LLM."""
+        if not self.config.enabled:
+            return None
+        reason = self.reason(text)
+        with self._lock:
+            self._counters["checked"] += 1
+            if reason is None:
+                self._counters["passed"] += 1
+                return None
+            self._counters["rejected"] += 1
+            self._reasons[reason] += 1
+        logger.info("prefilter: rejected ({})", reason)
+        return reason
+
+    def audit(self, text: str, reason: str, parsed: Any) -> None:
+        """Record the LLM's answer for a message the gate rejected (audit mode)."""
+        kind = getattr(parsed, "kind", None)
+        with self._lock:
+            self._counters["audited"] += 1
+            if kind in ("event", "task"):
+                self._counters["false_negatives"] += 1
+                self.false_negatives.append({"text": text, "reason": reason, "kind": kind})
+        if kind in ("event", "task"):
+            logger.warning("prefilter: audit false negative kind={} text='{}'", kind, (text or "")[:80])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {k: self._counters[k] for k in ("checked", "passed", "rejected", "audited", "false_negatives")}
+            out["reasons"] = dict(self._reasons)
+        out["reject_rate"] = out["rejected"] / out["checked"] if out["checked"] else 0.0
+        out["false_negative_rate"] = out["false_negatives"] / out["audited"] if out["audited"] else 0.0
+        return out
+
+
+@lru_cache(maxsize=None)
+def get_default_prefilter() -> Optional[PreFilter]:
+    """Process-wide pre-filter configured from env; None when PREFILTER=0.
+
+    PREFILTER_AUDIT=1 turns on audit mode, PREFILTER_KEYWORDS adds comma-separated keywords.
+    """
+    if os.getenv("PREFILTER", "1") == "0":
+        return None
+    extra = [k.strip() for k in os.getenv("PREFILTER_KEYWORDS", "").split(",") if k.strip()]
+    config = PrefilterConfig(audit=os.getenv("PREFILTER_AUDIT", "0") == "1", extra_keywords=extra)
+    logger.info("prefilter: enabled audit={} extra_keywords={}", config.audit, len(extra))
+    return PreFilter(config)
@@ -0,0 +1,97 @@
+"""Date/time, weekday, payment and event-keyword patterns shared by the pre-filter,
+prompt compaction and near-duplicate detection, and the text helpers they match with.
+"""
+import re
+import unicodedata
+from typing import Iterable
+
+
+# WhatsApp's edit marker, in English and Hebrew exports.
+EDITED_RE = re.compile(r"<\s*(this message was edited|ההודעה נערכה|הודעה זו נערכה)\s*>", re.IGNORECASE)
+
+DATE_PATTERN = r"\d{1,2}[./\-]\d{1,2}(?:[./\-]\d{2,4})?"  # 10/09, 10.9.25
+
+DATE_TIME_PATTERNS = [
+    DATE_PATTERN,
+    r"\d{1,2}:\d{2}",  # 20:00
+    r"\d{1,2}\s*(?:am|pm)\b",
+    r"(?:בשעה|בשעות|עד השעה|משעה)\s*\d",
+    r"ב[-־]?\d{1,2}(?:[:.]\d{2})?(?:\s|$)",  # ב20:00, ב-8
+]
+
+WEEKDAY_NAMES = [
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת",
+]
+
+# Words whose date depends on when the message was written.
+RELATIVE_DAY_WORDS = [
+    "today", "tonight", "tomorrow", "next week", "this week", "weekend",
+    "מחר", "מחרתיים", "היום", "הערב", "הבוקר", "השבוע", "שבוע הבא", "סופ\"ש", "סוף שבוע",
+]
+
+MONTH_NAMES = [
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december",
+    "ינואר", "פברואר", "מרץ", "אפריל", "מאי", "יוני", "יולי", "אוגוסט",
+    "ספטמבר", "אוקטובר", "נובמבר", "דצמבר",
+]
+
+WEEKDAY_WORDS = WEEKDAY_NAMES + RELATIVE_DAY_WORDS + MONTH_NAMES + [
+    "ראש השנה", "יום כיפור", "סוכות", "חנוכה", "פורים", "פסח", "שבועות",
+]
+
+PAYMENT_PATTERNS = [
+    r"https?://",
+    r"www\.",
+    r"paybox",
+    r"\bbit\b",
+    r"ביט",
+    r"פייבוקס",
+]
+
+EVENT_KEYWORDS = [
+    "event", "meeting", "party", "birthday", "trip", "show", "ceremony", "deadline",
+    "payment", "pay", "register", "rsvp", "bring",
+    "אסיפה", "אסיפת", "מסיבה", "מסיבת", "יום הולדת", "טיול", "הופעה", "הצגה", "פגישה",
+    "אירוע", "מפגש", "טקס", "כנס", "חגיגה", "תשלום", "לשלם", "להעביר", "הרשמה",
+    "להירשם", "להביא", "להגיע", "מתכונת", "בחינה", "מבחן", "חופש", "סגור", "סגורה",
+]
+
+
+def strip_marks(text: str) -> str:
+    # Niqqud and other combining marks would break keyword matching.
+    return "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+
+
+def with_reversed(words: Iterable[str]) -> list[str]:
+    # Some exports carry Hebrew in visual (reversed) order, so match both directions.
+    out = []
+    for w in words:
+        out.append(re.escape(w))
+        if any("\u0590" <= ch <= "\u05ff" for ch in w):
+            out.append(re.escape(w[::-1]))
+    return out
+
+
+# Weekday names and relative day words; longest first, so "מחרתיים" is not read as "מחר".
+DAY_PATTERN = "|".join(with_reversed(sorted(WEEKDAY_NAMES + RELATIVE_DAY_WORDS, key=len, reverse=True)))
+
+
+_DATE_RE = re.compile(r"(?<!\d)(\d{1,2})[./\-](\d{1,2})(?:[./\-]\d{2,4})?(?!\d)")
+# "10 באוקטובר", "October 10".
+_MONTH_DATE_RE = re.compile(
+    r"\d{1,2}\s*(?:ב|of\s+)?(?:%s)|(?:%s)\s+\d{1,2}(?!\d)" % (("|".join(with_reversed(MONTH_NAMES)),) * 2),
+    re.IGNORECASE)
+
+
+def has_absolute_date(text: str) -> bool:
+    """Whether the text names a calendar date (10/09, 10.9.25, 10 באוקטובר), so what it
+    refers to does not depend on the day it was posted. 20.00 is a time, not a date.
+    """
+    text = strip_marks(text or "")
+    for m in _DATE_RE.finditer(text):
+        a, b = int(m.group(1)), int(m.group(2))
+        if 1 <= a <= 31 and 1 <= b <= 31 and min(a, b) <= 12:
+            return True
+    return _MONTH_DATE_RE.search(text) is not None
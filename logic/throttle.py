@@ -0,0 +1,272 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional
+from loguru import logger
+import metrics
+
+
+# HTTP statuses worth retrying: rate limited, or the server failed without doing the work.
+RATE_LIMIT_STATUSES = {429}
+SERVER_ERROR_STATUSES = {500, 502, 503, 504}
+# Calendar reports quota errors as 403 with one of these reasons.
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "RESOURCE_EXHAUSTED")
+
+
+def _status(e: BaseException) -> Optional[int]:
+    for status in (getattr(e, "status_code", None), getattr(getattr(e, "resp", None), "status", None)):
+        try:
+            if status is not None:
+                return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_rate_limited(e: BaseException) -> bool:
+    status = _status(e)
+    if status in RATE_LIMIT_STATUSES:
+        return True
+    return status == 403 and any(reason in str(e) for reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable(e: BaseException, server_errors: bool = True) -> bool:
+    """Rate limits always; 5xx and dropped connections only when the call is safe to repeat."""
+    if is_rate_limited(e):
+        return True
+    if not server_errors:
+        return False
+    if _status(e) in SERVER_ERROR_STATUSES:
+        return True
+    return isinstance(e, (ConnectionError, TimeoutError))
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    resp = getattr(e, "resp", None)
+    try:
+        value = resp.get("retry-after") if resp is not None and hasattr(resp, "get") else None
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity; acquire() waits for enough tokens."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens now (possibly going negative) and return how long to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self, tokens: float = 1) -> float:
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: +1 per limit's worth of successes, halved on a rate-limit error
+    (at most once per cooldown, so one burst of 429s counts as a single signal).
+    """
+
+    def __init__(self, initial: float, minimum: float = 1, maximum: float = 64, cooldown: float = 1.0) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.limit = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < max(1, int(self.limit)):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def acquire_async(self, poll: float = 0.01) -> None:
+        # Sync and async callers share the limit, so waiting is a short poll
+        # rather than an asyncio primitive bound to one loop.
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+            await asyncio.sleep(poll)
+
+    def release(self, outcome: str) -> None:
+        """outcome: 'ok' (increase), 'throttled' (decrease) or anything else (no change)."""
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome == "throttled":
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+
+class Throttle:
+    """Client-side limits for one backend: a token bucket for request rate, an adaptive
+    concurrency limit, and retries with full-jitter exponential backoff.
+
+        throttle.call(request.execute)
+        await throttle.call_async(agent.run, prompt)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: Optional[float] = None,
+        max_concurrency: int = 16,
+        initial_concurrency: Optional[int] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        enabled: bool = True,
+    ) -> None:
+        self.name = name
+        self.enabled = enabled
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst or max(1.0, rate))
+        self.limiter = AdaptiveLimiter(initial_concurrency or max(1, max_concurrency // 2), maximum=max_concurrency,
+                                       cooldown=base_delay)
+        self._rng = random.Random()
+
+    def _backoff(self, attempt: int, e: BaseException) -> float:
+        hinted = _retry_after(e)
+        if hinted is not None:
+            return min(self.max_delay, hinted)
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _failed(self, attempt: int, e: BaseException, server_errors: bool) -> Optional[float]:
+        """Release the slot for a failed attempt; return the backoff delay, or None to give up."""
+        throttled = is_rate_limited(e)
+        self.limiter.release("throttled" if throttled else "error")
+        if attempt >= self.max_retries or not is_retryable(e, server_errors):
+            return None
+        delay = self._backoff(attempt, e)
+        metrics.THROTTLE_RETRIES.inc(self.name, "rate_limited" if throttled else "error")
+        logger.info("throttle[{}]: attempt {} failed ({}), retrying in {:.2f}s limit={:.1f}",
+                    self.name, attempt + 1, e, delay, self.limiter.limit)
+        return delay
+
+    def retry_delay(self, attempt: int, e: BaseException, server_errors: bool = True) -> Optional[float]:
+        """Backoff before retrying part of a call that failed on its own (one item of a batch
+        request that succeeded as a whole); None to give up.
+        """
+        if not self.enabled or attempt >= self.max_retries or not is_retryable(e, server_errors):
+            return None
+        delay = self._backoff(attempt, e)
+        metrics.THROTTLE_RETRIES.inc(self.name, "rate_limited" if is_rate_limited(e) else "error")
+        logger.info("throttle[{}]: item attempt {} failed ({}), retrying in {:.2f}s", self.name, attempt + 1, e, delay)
+        return delay
+
+    def call(self, fn: Callable[..., Any], *args: Any, cost: float = 1, server_errors: bool = True, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) under the limits, retrying retryable errors.
+        server_errors=False retries only rate limits (for calls that are unsafe to repeat).
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                metrics.THROTTLE_WAIT_SECONDS.inc(self.name, value=self.bucket.acquire(cost))
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    self.limiter.release("error")
+                    raise
+                delay = self._failed(attempt, e, server_errors)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.release("ok")
+            return result
+
+    async def call_async(self, fn: Callable[..., Awaitable[Any]], *args: Any, cost: float = 1,
+                         server_errors: bool = True, **kwargs: Any) -> Any:
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        attempt = 0
+        while True:
+            await self.limiter.acquire_async()
+            try:
+                metrics.THROTTLE_WAIT_SECONDS.inc(self.name, value=await self.bucket.acquire_async(cost))
+                result = await fn(*args, **kwargs)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    self.limiter.release("error")
+                    raise
+                delay = self._failed(attempt, e, server_errors)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.release("ok")
+            return result
+
+    def stats(self) -> Dict[str, float]:
+        return {"limit": self.limiter.limit, "in_flight": self.limiter.in_flight}
+
+
+# Defaults sized for the Gemini Flash paid tier and the Calendar per-user quota (600/min;
+# the burst fits one full batch request). Override with <BACKEND>_RPS, _BURST, _MAX_CONCURRENCY.
+_DEFAULTS = {
+    "gemini": {"rps": "10", "burst": "10", "max_concurrency": "16"},
+    "calendar": {"rps": "10", "burst": "50", "max_concurrency": "8"},
+}
+
+
+@lru_cache(maxsize=None)
+def get_throttle(name: str) -> Throttle:
+    """Process-wide throttle for a backend ('gemini' or 'calendar'), configured from env.
+    THROTTLE=0 disables limiting and retries; THROTTLE_MAX_RETRIES bounds the retries.
+    """
+    prefix = name.upper()
+    defaults = _DEFAULTS.get(name, _DEFAULTS["gemini"])
+    rate = float(os.getenv(f"{prefix}_RPS", defaults["rps"]))
+    throttle = Throttle(
+        name,
+        rate=rate,
+        burst=float(os.getenv(f"{prefix}_BURST", defaults["burst"])),
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", defaults["max_concurrency"])),
+        max_retries=int(os.getenv("THROTTLE_MAX_RETRIES", "5")),
+        enabled=os.getenv("THROTTLE", "1") != "0",
+    )
+    logger.info("throttle[{}]: rps={} max_concurrency={} enabled={}", name, rate, throttle.limiter.maximum, throttle.enabled)
+    return throttle
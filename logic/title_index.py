@@ -0,0 +1,187 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+# Minimum similarity (0..1) for two titles to count as the same event.
+DEFAULT_THRESHOLD = float(os.getenv("TITLE_MATCH_THRESHOLD", "0.7"))
+DEFAULT_BUCKET_SECONDS = 24 * 3600
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d+")
+# Hebrew final letters, so a word matches whether or not it is the last in a variant.
+_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+
+
+def _strip_marks(text: str) -> str:
+    # Niqqud and cantillation (Mn), enclosing marks, bidi/format characters and controls.
+    return "".join(ch for ch in text if unicodedata.category(ch) not in ("Mn", "Me", "Cf", "Cc"))
+
+
+def _is_rtl(token: str) -> bool:
+    return any(unicodedata.bidirectional(ch) in ("R", "AL") for ch in token)
+
+
+def title_tokens(title: str) -> List[str]:
+    """Normalized word tokens: NFKC, no marks, casefolded, punctuation and emoji dropped.
+
+    RTL words are stored direction-independently (the smaller of the word and its reverse),
+    so a title that went through utils.rtl() (visual order) matches its logical-order form.
+    """
+    text = _strip_marks(unicodedata.normalize("NFKC", title or "")).casefold().translate(_FINALS)
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if _is_rtl(token):
+            token = min(token, token[::-1])
+        tokens.append(token)
+    return tokens
+
+
+def _trigrams(tokens: Iterable[str]) -> FrozenSet[str]:
+    grams: Set[str] = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+@dataclass(frozen=True)
+class TitleFeatures:
+    tokens: FrozenSet[str]
+    trigrams: FrozenSet[str]
+
+    @classmethod
+    def of(cls, title: str) -> "TitleFeatures":
+        tokens = title_tokens(title)
+        return cls(frozenset(tokens), _trigrams(tokens))
+
+
+def _score(a: TitleFeatures, b: TitleFeatures, shared_trigrams: int) -> float:
+    if not a.tokens or not b.tokens:
+        return 0.0
+    # Every word of the shorter title appears in the longer one ("אסיפת הורים" vs
+    # "אסיפת הורים - עודכן"), which the old substring check accepted.
+    if a.tokens <= b.tokens or b.tokens <= a.tokens:
+        return 1.0
+    return 2 * shared_trigrams / (len(a.trigrams) + len(b.trigrams))
+
+
+def title_similarity(a: str, b: str) -> float:
+    """Similarity of two event titles in 0..1: 1 when one title's words are all in the other,
+    otherwise the Dice coefficient of their character trigrams.
+    """
+    fa, fb = TitleFeatures.of(a), TitleFeatures.of(b)
+    return _score(fa, fb, len(fa.trigrams & fb.trigrams))
+
+
+def best_match(
+    name: str,
+    items: Iterable[Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> Optional[Dict[str, Any]]:
+    """The Calendar event resource whose summary is most similar to name (at least threshold)."""
+    wanted = TitleFeatures.of(name)
+    best, best_score = None, threshold
+    for item in items:
+        features = TitleFeatures.of(item.get("summary") or "")
+        score = _score(wanted, features, len(wanted.trigrams & features.trigrams))
+        if score >= best_score:
+            best, best_score = item, score
+    return best
+
+
+def _bucket(start: Optional[datetime], seconds: int) -> Optional[int]:
+    if start is None:
+        return None
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return int(start.timestamp()) // seconds
+
+
+class TitleIndex:
+    """Trigram inverted index of event titles, partitioned into start-time buckets.
+
+    search() only scores titles sharing at least one trigram with the query in the
+    buckets covering [start, end], so it stays cheap with thousands of events.
+    """
+
+    def __init__(self, bucket_seconds: int = DEFAULT_BUCKET_SECONDS) -> None:
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._features: Dict[str, TitleFeatures] = {}
+        self._buckets: Dict[str, Optional[int]] = {}
+        # bucket -> trigram -> keys
+        self._postings: Dict[Optional[int], Dict[str, Set[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def add(self, key: str, title: str, start: Optional[datetime] = None) -> None:
+        features = TitleFeatures.of(title)
+        bucket = _bucket(start, self.bucket_seconds)
+        with self._lock:
+            self._remove(key)
+            self._features[key] = features
+            self._buckets[key] = bucket
+            postings = self._postings.setdefault(bucket, {})
+            for gram in features.trigrams:
+                postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        features = self._features.pop(key, None)
+        if features is None:
+            return
+        bucket = self._buckets.pop(key)
+        postings = self._postings[bucket]
+        for gram in features.trigrams:
+            keys = postings[gram]
+            keys.discard(key)
+            if not keys:
+                del postings[gram]
+        if not postings:
+            del self._postings[bucket]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._features.clear()
+            self._buckets.clear()
+            self._postings.clear()
+
+    def search(
+        self,
+        title: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        threshold: float = DEFAULT_THRESHOLD,
+    ) -> List[Tuple[float, str]]:
+        """(score, key) pairs scoring at least threshold, best first.
+
+        With start/end only titles added with a start in the covering buckets are
+        considered (callers still check the exact time window); without them, all.
+        """
+        wanted = TitleFeatures.of(title)
+        if not wanted.tokens:
+            return []
+        with self._lock:
+            if start is not None and end is not None:
+                first = _bucket(start, self.bucket_seconds)
+                last = _bucket(end, self.bucket_seconds)
+                buckets = [self._postings[b] for b in range(first, last + 1) if b in self._postings]
+            else:
+                buckets = list(self._postings.values())
+            shared: Counter = Counter()
+            for postings in buckets:
+                for gram in wanted.trigrams:
+                    keys = postings.get(gram)
+                    if keys:
+                        shared.update(keys)
+            scored = [(_score(wanted, self._features[key], n), key) for key, n in shared.items()]
+        return sorted((s for s in scored if s[0] >= threshold), key=lambda s: (-s[0], s[1]))
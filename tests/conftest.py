@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+# Modules import each other as top-level names (`from agent import ...`), so both the
+# repo root and logic/ need to be importable when running pytest from the repo root
+# (benchmarks/ for the offline fakes).
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "logic", ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# Unit tests should not wait on the process-wide rate limits; test_throttle builds its own.
+os.environ.setdefault("THROTTLE", "0")
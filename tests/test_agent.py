@@ -0,0 +1,57 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+import agent
+from agent import parse_event_picture_async, parse_text_async, route_and_parse_async, use_model
+from parse_cache import ParseCache
+from prefilter import PreFilter, PrefilterConfig
+from utils.images import Image
+from fakes import fake_model
+
+LATENCY = 0.2
+MESSAGES = [f"תזכורת: אסיפת הורים כיתה {i} ב-1{i}/9 בשעה 20:00" for i in range(6)]
+
+
+class AsyncAgentTest(unittest.TestCase):
+    def setUp(self):
+        agent.get_text_agent.cache_clear()
+        agent.get_picture_agent.cache_clear()
+
+    def test_concurrent_parses_overlap_and_share_one_agent(self):
+        async def run():
+            gate = PreFilter(PrefilterConfig(enabled=False))
+            return await asyncio.gather(*(route_and_parse_async(m, cache=ParseCache(), prefilter=gate)
+                                          for m in MESSAGES))
+
+        with use_model(fake_model(latency_seconds=LATENCY)):
+            started = time.perf_counter()
+            results = asyncio.run(run())
+            elapsed = time.perf_counter() - started
+        self.assertEqual([r.kind for r in results], ["event"] * len(MESSAGES))
+        self.assertLess(elapsed, LATENCY * len(MESSAGES) / 2)
+        info = agent.get_text_agent.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, len(MESSAGES) - 1))
+
+    def test_text_and_picture_async(self):
+        with use_model(fake_model()):
+            out = asyncio.run(parse_text_async(MESSAGES[0]))
+            self.assertEqual(out.kind, "event")
+            self.assertEqual(out.original_message, MESSAGES[0])
+            if Image is None:
+                return
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "flyer.png")
+                data = io.BytesIO()
+                Image.new("RGB", (200, 100), "white").save(data, format="PNG")
+                with open(path, "wb") as f:
+                    f.write(data.getvalue())
+                picture = asyncio.run(parse_event_picture_async(path))
+        self.assertIn(picture.kind, ("event", "other"))
+        self.assertEqual(agent.get_picture_agent.cache_info().misses, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+import app as app_module
+from agent import use_model
+from chat_router import ChatRouter
+from fakes import fake_model
+from parse_and_sync_service import sync_event
+from test_sharding import FakePool
+
+MEETING = "שימו לב - מחר אסיפת הורים ב-10/9 בשעה 20:00 בבית הספר"
+
+
+class AppRoutingTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        router = ChatRouter({"gan": "gan@group"}, strict=True)
+        patches = [
+            use_model(fake_model()),
+            mock.patch.object(app_module, "calendar_pool", lambda state: self.pool),
+            mock.patch.object(app_module, "get_default_router", lambda: router),
+        ]
+        for p in patches:
+            p.__enter__()
+            self.addCleanup(p.__exit__, None, None, None)
+        self.client = TestClient(app_module.app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+    def test_message_goes_to_routed_calendar(self):
+        r = self.client.post("/messages", json={"text": MEETING, "chat_id": "gan"})
+        self.assertEqual(r.status_code, 200, r.text)
+        self.assertEqual(r.json()["action"], "created")
+        self.assertEqual(list(self.pool.services), ["gan@group"])
+
+    def test_other_calendar_rejected(self):
+        for path in ("/messages", "/messages/async"):
+            r = self.client.post(path, json={"text": MEETING, "chat_id": "gan", "calendar_id": "other@group"})
+            self.assertEqual(r.status_code, 403, path)
+        r = self.client.post("/imports?sync=true&chat_id=gan&calendar_id=other@group", content=b"",
+                             headers={"content-type": "text/plain"})
+        self.assertEqual(r.status_code, 403)
+        r = self.client.post("/messages", json={"text": MEETING, "chat_id": "unknown"})
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(self.pool.services, {})
+
+    def test_import_writes_run_in_order_on_the_chat_shard(self):
+        threads = []
+
+        def on_shard(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return sync_event(*args, **kwargs)
+
+        chat = "".join(f"9/1/25, 0{h}:00 - Dana: {MEETING}\n" for h in range(1, 4)).encode("utf-8")
+        with mock.patch.object(app_module, "sync_event", on_shard):
+            r = self.client.post("/imports?sync=true&chat_id=gan", content=chat, headers={"content-type": "text/plain"})
+        results = sorted((json.loads(line) for line in r.text.splitlines()), key=lambda item: item["index"])
+        self.assertEqual([item["action"] for item in results], ["created", "unchanged", "unchanged"])
+        shard = app_module.app.state.jobs.shard("gan")
+        self.assertEqual(threads, [f"job-shard-{shard}"] * 3)
+
+    def test_malformed_ndjson_lines_are_reported_not_fatal(self):
+        lines = [json.dumps({"text": MEETING}), "{not json", "[1, 2]", json.dumps({"text": "תודה רבה!"})]
+        r = self.client.post("/imports", content="\n".join(lines).encode("utf-8"),
+                             headers={"content-type": "application/x-ndjson"})
+        self.assertEqual(r.status_code, 200)
+        results = sorted((json.loads(line) for line in r.text.splitlines()), key=lambda item: item["index"])
+        self.assertEqual(len(results), 4)
+        self.assertEqual([("error" in item) for item in results], [False, True, True, False])
+        self.assertEqual(results[0]["kind"], "event")
+        self.assertEqual(results[2]["offset"], len(lines[0]) + len(lines[1]) + 2)
+
+
+class JobQueueApiTest(unittest.TestCase):
+    """The queue endpoints, with a stub handler that blocks until the test opens the gate."""
+
+    def setUp(self):
+        self.gate = threading.Event()
+        self.handled = []
+
+        def handle(payload, pool):
+            self.gate.wait(5)
+            self.handled.append((payload.chat_id, payload.text))
+            return app_module.MessageOut(kind="other")
+
+        patches = [
+            mock.patch.dict(os.environ, {"JOB_WORKERS": "2", "JOB_QUEUE_SIZE": "2"}),
+            mock.patch.object(app_module, "handle_message", handle),
+            mock.patch.object(app_module, "calendar_pool", lambda state: FakePool()),
+            mock.patch.object(app_module, "get_default_router", ChatRouter),
+        ]
+        for p in patches:
+            p.__enter__()
+            self.addCleanup(p.__exit__, None, None, None)
+        self.client = TestClient(app_module.app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+        self.addCleanup(self.gate.set)
+
+    def _wait(self, job_id):
+        for _ in range(500):
+            job = self.client.get(f"/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail(f"job {job_id} did not finish")
+
+    def test_async_message_and_job_polling(self):
+        r = self.client.post("/messages/async", json={"text": "hello", "chat_id": "gan"})
+        self.assertEqual(r.status_code, 202)
+        job_id = r.json()["job_id"]
+        self.assertIn(self.client.get(f"/jobs/{job_id}").json()["status"], ("queued", "running"))
+        self.gate.set()
+        self.assertEqual(self._wait(job_id), {"job_id": job_id, "status": "done", "result": {
+            "kind": "other", "name": None, "date": None, "action": None, "event_id": None}, "error": None})
+        self.assertEqual(self.client.get("/jobs/unknown").status_code, 404)
+
+    def test_full_shard_is_429(self):
+        statuses = [self.client.post("/messages/async", json={"text": str(n), "chat_id": "gan"}).status_code
+                    for n in range(5)]
+        # One job running, two waiting; the rest are rejected.
+        self.assertEqual(statuses[:2], [202, 202])
+        self.assertEqual(statuses[-1], 429)
+        r = self.client.post("/messages", json={"text": "sync", "chat_id": "gan"})
+        self.assertEqual((r.status_code, r.headers["Retry-After"]), (429, "1"))
+
+    def test_messages_of_a_chat_run_in_order(self):
+        chats = ("gan", "school")
+        self.assertNotEqual(*(app_module.app.state.jobs.shard(chat) for chat in chats))
+        job_ids = [self.client.post("/messages/async", json={"text": str(n), "chat_id": chat}).json()["job_id"]
+                   for n in range(2) for chat in chats]
+        self.gate.set()
+        for job_id in job_ids:
+            self._wait(job_id)
+        for chat in chats:
+            self.assertEqual([text for chat_id, text in self.handled if chat_id == chat], ["0", "1"])
+
+    def test_slow_message_is_504_and_keeps_running(self):
+        with mock.patch.object(app_module, "MESSAGE_TIMEOUT_SECONDS", 0.05):
+            r = self.client.post("/messages", json={"text": "slow", "chat_id": "gan"})
+        self.assertEqual(r.status_code, 504)
+        job_id = r.json()["detail"]["job_id"]
+        self.gate.set()
+        self.assertEqual(self._wait(job_id)["status"], "done")
+        self.assertEqual(self.handled, [("gan", "slow")])
+
+
+class CalendarPoolStartupTest(unittest.TestCase):
+    def test_built_at_startup_and_retried_after_failure(self):
+        pool = FakePool()
+        with mock.patch("calendar_pool.CalendarClientPool.from_env", side_effect=[RuntimeError("no network"), pool]) \
+                as from_env, TestClient(app_module.app):
+            self.assertEqual(from_env.call_count, 1)
+            state = app_module.app.state
+            self.assertIsNone(state.calendars)
+            self.assertEqual(state.calendars_error, "no network")
+            # The failure is not permanent: the next caller builds the pool.
+            self.assertIs(app_module.calendar_pool(state), pool)
+            self.assertIs(app_module.calendar_pool(state), pool)
+            self.assertEqual(from_env.call_count, 2)
+        del state.calendars
+
+
+if __name__ == '__main__':
+    unittest.main()
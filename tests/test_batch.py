@@ -0,0 +1,86 @@
+import json
+import unittest
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+from agent import BatchMessage, estimate_tokens, pack_batches, parse_batch, use_model
+from parse_cache import ParseCache
+from prefilter import PreFilter, PrefilterConfig
+from fakes import _prompt, fake_model
+
+MEETING = "שימו לב - מחר אסיפת הורים ב-10/9 בשעה 20:00 בבית הספר"
+
+
+def _messages(n, text=MEETING):
+    return [BatchMessage(id=str(i), text=f"{text} #{i}") for i in range(n)]
+
+
+def _model(calls, max_batch=1, broken="BROKEN", quota="QUOTA"):
+    """fake_model, except that batches over max_batch messages and any prompt containing
+    broken get an answer that does not validate, and prompts containing quota get a 429.
+    """
+    respond = fake_model().function
+
+    async def model(messages, info):
+        prompt = _prompt(messages[:1])  # the original request, also on output retries
+        size = len(json.loads(prompt)) if len(info.output_tools) == 1 else 1
+        calls.append(size)
+        if quota in prompt:
+            raise ModelHTTPError(429, "gemini", "RESOURCE_EXHAUSTED")
+        if size > max_batch or broken in prompt:
+            return ModelResponse(parts=[TextPart("garbage")])
+        return await respond(messages, info)
+
+    return FunctionModel(model)
+
+
+class PackBatchesTest(unittest.TestCase):
+    def test_token_budget_and_item_cap(self):
+        messages = _messages(10)
+        cost = estimate_tokens(messages[0].text) + 20
+        batches = pack_batches(messages, max_tokens=cost * 3, max_items=25)
+        self.assertEqual([len(b) for b in batches], [3, 3, 3, 1])
+        self.assertEqual([len(b) for b in pack_batches(messages, max_tokens=10_000, max_items=4)], [4, 4, 2])
+        self.assertEqual([m.id for b in batches for m in b], [m.id for m in messages])
+
+    def test_oversized_message_gets_its_own_batch(self):
+        messages = _messages(2) + [BatchMessage(id="big", text="x" * 3000)] + _messages(1)
+        self.assertEqual([len(b) for b in pack_batches(messages, max_tokens=200)], [2, 1, 1])
+
+
+class ParseBatchTest(unittest.TestCase):
+    def _parse(self, messages, model, cache=None):
+        gate = PreFilter(PrefilterConfig(enabled=False))
+        with use_model(model):
+            return parse_batch(messages, cache=cache or ParseCache(), prefilter=gate, max_items=8)
+
+    def test_invalid_batches_are_split_until_they_validate(self):
+        calls = []
+        results = self._parse(_messages(8), _model(calls, max_batch=2))
+        self.assertTrue(all(r.kind == "event" for r in results))
+        self.assertEqual([r.original_message for r in results], [m.text for m in _messages(8)])
+        # 8 -> 4 + 4 -> four valid pairs (invalid answers are also retried once by the agent).
+        self.assertEqual(sorted(set(calls)), [2, 4, 8])
+        self.assertEqual(calls.count(2), 4)
+
+    def test_failing_message_does_not_lose_the_others(self):
+        messages = _messages(6) + [BatchMessage(id="bad", text="BROKEN 20:00")]
+        cache = ParseCache()
+        results = self._parse(messages, _model([]), cache=cache)
+        self.assertEqual([r.kind for r in results], ["event"] * 6 + ["other"])
+        self.assertTrue(results[-1].reason.startswith("parse error"))
+        # The error is not cached; the good results are.
+        self.assertEqual(cache.stats()["memory_entries"], 6)
+
+    def test_quota_error_is_raised_after_caching_other_batches(self):
+        messages = _messages(8) + [BatchMessage(id="limited", text="QUOTA 20:00")]
+        cache = ParseCache()
+        with self.assertRaises(ModelHTTPError) as caught:
+            self._parse(messages, _model([], max_batch=8), cache=cache)
+        self.assertEqual(caught.exception.status_code, 429)
+        # Packed as 8 + 1: the first batch's results are kept for the retry; none is an Other.
+        self.assertEqual(cache.stats()["writes"], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
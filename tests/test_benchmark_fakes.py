@@ -0,0 +1,45 @@
+import io
+import unittest
+from datetime import datetime
+from agent import Event, route_and_parse, use_model
+from calendar_mirror import CalendarMirror
+from google_wrapper import GoogleCalendarWrapper
+from parse_and_sync_service import sync_event
+from fakes import FakeCalendarService, fake_model, synthetic_chat
+from utils.whatsapp_export import iter_messages
+
+
+class FakeCalendarTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService()
+        self.wrapper = GoogleCalendarWrapper(self.service, calendar_id="bench")
+        self.event = Event(name="אסיפת הורים", description="d", date=datetime(2025, 9, 10, 20, 0), location="גן")
+
+    def test_sync_event_creates_then_leaves_unchanged(self):
+        first = sync_event(self.event, self.wrapper, "Asia/Jerusalem")
+        second = sync_event(self.event, self.wrapper, "Asia/Jerusalem")
+        self.assertEqual(first["action"], "created")
+        self.assertEqual(second, {"action": "unchanged", "event_id": first["event_id"]})
+        self.assertEqual(self.service.calls["patch"], 0)
+
+    def test_mirror_sees_remote_changes_through_sync_token(self):
+        mirror = CalendarMirror(self.wrapper, max_staleness_seconds=0)
+        event_id = self.wrapper.create_event(self.event, tz="Asia/Jerusalem")
+        self.assertEqual(len(mirror.between(datetime(2025, 9, 10), datetime(2025, 9, 11), "Asia/Jerusalem")), 1)
+        self.wrapper.delete_event(event_id)
+        self.assertEqual(mirror.between(datetime(2025, 9, 10), datetime(2025, 9, 11), "Asia/Jerusalem"), [])
+
+
+class FakeModelTest(unittest.TestCase):
+    def test_synthetic_chat_routes_offline(self):
+        texts = [m.text for m in iter_messages(io.BytesIO(synthetic_chat(40, seed=1).encode("utf-8")))]
+        self.assertEqual(len(texts), 41)
+        with use_model(fake_model()):
+            kinds = {route_and_parse(t).kind for t in texts}
+            out = route_and_parse("שימו לב - מחר אסיפת הורים ב20:00")
+        self.assertIn("other", kinds)
+        self.assertEqual((out.kind, out.date.hour), ("event", 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
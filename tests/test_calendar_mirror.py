@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime
+from agent import Event
+from calendar_mirror import CalendarMirror
+from google_wrapper import GoogleCalendarWrapper
+from parse_and_sync_service import sync_event
+from fakes import FakeCalendarService, FakeHttpError
+
+MEETING = datetime(2025, 9, 10, 20, 0)
+
+
+class CalendarMirrorTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService()
+        self.wrapper = GoogleCalendarWrapper(self.service, calendar_id="cal")
+        self.event_id = self.wrapper.create_event(
+            Event(name="אסיפת הורים כיתה ב", description="", location="", date=MEETING), tz="UTC")
+        self.mirror = CalendarMirror(self.wrapper)
+
+    def test_find_within_window_with_fuzzy_title(self):
+        self.mirror.seed()
+        self.assertEqual(self.mirror.find("אסיפת הורים - כיתה ב'", MEETING.replace(hour=21), 120)["id"],
+                         self.event_id)
+        self.assertIsNone(self.mirror.find("אסיפת הורים כיתה ב", MEETING.replace(hour=23), 120))
+        self.assertIsNone(self.mirror.find("טיול שנתי", MEETING, 120))
+        self.assertEqual(self.service.calls["list"], 1)
+
+    def test_cancelled_event_is_dropped_through_the_sync_token(self):
+        self.mirror.seed()
+        token = self.mirror.sync_token
+        self.wrapper.delete_event(self.event_id)
+        self.mirror.refresh()
+        self.assertNotEqual(self.mirror.sync_token, token)
+        self.assertEqual(len(self.mirror), 0)
+        self.assertIsNone(self.mirror.find("אסיפת הורים כיתה ב", MEETING, 120))
+
+    def test_expired_sync_token_reseeds(self):
+        self.mirror.seed()
+        self.wrapper.create_event(Event(name="טיול שנתי", description="", location="", date=MEETING), tz="UTC")
+        list_events = self.service._list
+
+        def gone(syncToken=None, **params):
+            if syncToken:
+                raise FakeHttpError(410, "sync token expired")
+            return list_events(**params)
+
+        self.service._list = gone
+        self.mirror.refresh()
+        self.assertEqual(len(self.mirror), 2)
+        self.assertIsNotNone(self.mirror.sync_token)
+
+    def test_sync_event_uses_the_mirror_without_listing(self):
+        self.mirror.seed()
+        lists = self.service.calls["list"]
+        trip = Event(name="טיול שנתי", description="", location="", date=datetime(2025, 9, 12, 8, 0))
+        created = sync_event(trip, self.wrapper, "UTC", mirror=self.mirror)
+        self.assertEqual(created["action"], "created")
+        # upsert: the mirror already has the new event, before any sync.
+        self.assertEqual(self.mirror.find("טיול שנתי", trip.date, 120)["id"], created["event_id"])
+        again = sync_event(trip, self.wrapper, "UTC", mirror=self.mirror)
+        self.assertEqual(again, {"action": "unchanged", "event_id": created["event_id"]})
+        moved = sync_event(trip.model_copy(update={"date": datetime(2025, 9, 12, 9, 0)}), self.wrapper, "UTC",
+                           mirror=self.mirror)
+        self.assertEqual(moved, {"action": "updated", "event_id": created["event_id"]})
+        self.assertEqual(self.service.calls["list"], lists)
+        self.assertEqual(self.service.calls["insert"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import unittest
+from unittest import mock
+import calendar_pool
+from calendar_pool import CalendarClientPool
+
+
+class CalendarClientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.credentials = object()
+        self.built = []
+        patches = [
+            mock.patch.object(calendar_pool, "build", side_effect=self._build),
+            mock.patch.object(calendar_pool.google_auth_httplib2, "AuthorizedHttp",
+                              side_effect=lambda credentials, http: mock.Mock(credentials=credentials)),
+            mock.patch.object(calendar_pool, "HttpRequest", side_effect=lambda http, *a, **kw: http),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _build(self, *args, **kwargs):
+        self.built.append(kwargs)
+        return mock.Mock(name="service")
+
+    def test_one_service_and_an_http_object_per_thread(self):
+        pool = CalendarClientPool(self.credentials, "main@group", mirror=True)
+        self.assertEqual(len(self.built), 1)
+        self.assertIs(pool.get().service, pool.service)
+        self.assertIs(pool.get("gan@group").service, pool.service)
+
+        request_builder = self.built[0]["requestBuilder"]
+        mine = [request_builder(None), request_builder(None)]
+        theirs = []
+        threads = [threading.Thread(target=lambda: theirs.append(request_builder(None))) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertIs(mine[0], mine[1])
+        self.assertIs(mine[0], self.built[0]["http"])
+        self.assertEqual(len({id(http) for http in mine[:1] + theirs}), 4)
+        self.assertTrue(all(http.credentials is self.credentials for http in mine + theirs))
+
+    def test_wrappers_and_mirrors_reused_per_calendar(self):
+        pool = CalendarClientPool(self.credentials, "main@group", mirror=True)
+        self.assertIs(pool.get(), pool.get("main@group"))
+        self.assertIs(pool.get("gan@group"), pool.get("gan@group"))
+        self.assertIsNot(pool.get("gan@group"), pool.get())
+        self.assertEqual(pool.get("gan@group").calendar_id, "gan@group")
+        self.assertIs(pool.mirror(), pool.mirror("main@group"))
+        self.assertIs(pool.mirror("gan@group").wrapper, pool.get("gan@group"))
+        self.assertIsNot(pool.mirror("gan@group"), pool.mirror())
+        self.assertIsNone(CalendarClientPool(self.credentials, "main@group").mirror())
+
+
+if __name__ == '__main__':
+    unittest.main()
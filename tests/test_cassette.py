@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pydantic_ai.models.function import FunctionModel
+from agent import _build_model, use_model
+from cassette import Cassette, CassetteMiss, ReplayedError, diff, use_cassette
+from google_wrapper import GoogleCalendarWrapper
+from parse_and_sync_service import process_message
+from parse_cache import ParseCache
+from fakes import FakeCalendarService, fake_model
+
+MESSAGES = [
+    "שימו לב - מחר אסיפת הורים ב-10/9 בשעה 20:00 בבית הספר",
+    "תזכורת: לשלם 50 ש\"ח לועד עד 12/9 https://payboxapp.page.link/abc",
+    "מישהו ראה את המעיל הכחול של דני?",
+    "שימו לב - מחר אסיפת הורים ב-10/9 בשעה 20:00 בבית הספר",
+]
+
+
+def _offline(messages, info):
+    raise AssertionError("replay must not call the model")
+
+
+class CassetteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "run.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _run(self, cassette, model, service):
+        wrapper = GoogleCalendarWrapper(service)
+        # No parse cache shared between runs: every message reaches the model (or the cassette).
+        with use_cassette(cassette), use_model(model), mock.patch("agent.get_default_cache", ParseCache):
+            return [process_message(text, wrapper, "Asia/Jerusalem") for text in MESSAGES]
+
+    def test_replay_matches_recording_offline(self):
+        recording = Cassette(self.path, "record")
+        recorded = self._run(recording, fake_model(), FakeCalendarService())
+        recording.close()
+
+        replay_service = FakeCalendarService()
+        replaying = Cassette(self.path, "replay")
+        replayed = self._run(replaying, FunctionModel(_offline), replay_service)
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(sum(replay_service.calls.values()), 0)
+        self.assertEqual(replaying.misses, 0)
+        self.assertGreater(replaying.hits, len(MESSAGES))
+        replaying.close()
+
+    def test_replay_needs_no_model_or_api_key(self):
+        recording = Cassette(self.path, "record")
+        recorded = self._run(recording, fake_model(), FakeCalendarService())
+        recording.close()
+
+        replaying = Cassette(self.path, "replay")
+        env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "GEMINI_API_KEY")}
+        _build_model.cache_clear()
+        try:
+            with mock.patch.dict(os.environ, env, clear=True), use_cassette(replaying), \
+                    mock.patch("agent.get_default_cache", ParseCache):
+                wrapper = GoogleCalendarWrapper(FakeCalendarService())
+                replayed = [process_message(text, wrapper, "Asia/Jerusalem") for text in MESSAGES]
+        finally:
+            _build_model.cache_clear()
+            replaying.close()
+        self.assertEqual(replayed, recorded)
+
+    def test_errors_replayed_and_misses(self):
+        recording = Cassette(self.path, "record")
+
+        def failing():
+            raise ReplayedError(404, "gone")
+
+        with self.assertRaises(ReplayedError):
+            recording.call("calendar", failing, request={"op": "get", "id": "x"})
+        recording.call("calendar", lambda: {"n": 1}, request={"op": "list"})
+        recording.call("calendar", lambda: {"n": 2}, request={"op": "list"})
+        recording.close()
+
+        replaying = Cassette(self.path, "replay")
+        with self.assertRaises(ReplayedError) as raised:
+            replaying.call("calendar", failing, request={"op": "get", "id": "x"})
+        self.assertEqual(raised.exception.resp.status, 404)
+        # Repeated requests replay in recorded order, then stay on the last answer.
+        self.assertEqual([replaying.call("calendar", None, request={"op": "list"})["n"] for _ in range(3)], [1, 2, 2])
+        with self.assertRaises(CassetteMiss):
+            replaying.call("calendar", None, request={"op": "get", "id": "y"})
+        replaying.close()
+
+    def test_diff_reports_changed_parses(self):
+        old, new = Cassette(self.path, "record"), Cassette(os.path.join(self.tmp.name, "new.db"), "record")
+        for cassette, answer in ((old, "event"), (new, "other")):
+            for text in ("a", "b"):
+                result = answer if text == "a" else "task"
+                cassette.call("llm", lambda: {"kind": result}, request=["v1" if cassette is old else "v2", text],
+                              input=text, label=text)
+        changed, compared = diff(old, new)
+        self.assertEqual(compared, 2)
+        self.assertEqual([(c.label, c.old, c.new) for c in changed], [("a", {"kind": "event"}, {"kind": "other"})])
+        old.close()
+        new.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+from agent import parse_text, use_model
+from compact import CompactionConfig, PromptCompactor, estimate_tokens, strip_decorations
+from fakes import fake_model
+
+FILLER = "מישהו יודע אם הגן פתוח בחופש? הילדים שאלו אותי כל הבוקר ולא ידעתי מה לענות להם. "
+MEETING = "אסיפת הורים ב-10/09 בשעה 20:00 בבית הספר."
+
+
+class CompactTest(unittest.TestCase):
+    def setUp(self):
+        self.compactor = PromptCompactor(CompactionConfig(token_budget=80, min_tokens=40))
+
+    def test_keeps_signal_within_budget(self):
+        text = "🎉🎉 *שלום לכולם!!!* 🎉🎉\n" + FILLER * 10 + MEETING + " " + FILLER * 10
+        result = self.compactor.compact(text)
+        self.assertIn("20:00", result.text)
+        self.assertIn("10/09", result.text)
+        self.assertLessEqual(result.tokens, 80)
+        self.assertGreater(result.saved, 0)
+        self.assertLess(result.kept, result.sentences)
+
+    def test_short_messages_unchanged(self):
+        text = "🎉 *מחר* אסיפה ב-20:00!!!"
+        self.assertEqual(self.compactor(text), text)
+
+    def test_strip_decorations(self):
+        self.assertEqual(strip_decorations("❤️❤️ *תודה* _רבה_!!!\n\n👍🏽 ₪50 https://x.com/~a_b"),
+                         "תודה רבה!\n₪50 https://x.com/~a_b")
+
+    def test_parse_text_keeps_full_original_message(self):
+        text = FILLER * 10 + MEETING
+        with use_model(fake_model()), mock.patch("agent.get_default_compactor", return_value=self.compactor):
+            out = parse_text(text)
+        self.assertEqual(out.original_message, text)
+        self.assertGreater(estimate_tokens(text), 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+from agent import Event
+from google_wrapper import GoogleCalendarWrapper, CALENDAR_BATCH_LIMIT, MissingBatchResponse
+from parse_and_sync_service import sync_event
+from throttle import Throttle
+from fakes import FakeBatch, FakeCalendarService, FakeHttpError
+
+
+class CalendarBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService()
+        self.wrapper = GoogleCalendarWrapper(self.service, calendar_id="cal")
+        self.event = Event(name="אסיפת הורים", description="d", date=datetime(2025, 9, 10, 20, 0), location="x")
+
+    def test_chunks_to_batch_limit(self):
+        batches = []
+        new_batch = self.service.new_batch_http_request
+
+        def recording_batch(callback=None):
+            batch = new_batch(callback)
+            batches.append(batch.items)
+            return batch
+
+        self.service.new_batch_http_request = recording_batch
+        with self.wrapper.batch() as b:
+            for _ in range(CALENDAR_BATCH_LIMIT * 2 + 1):
+                b.create_event(self.event, tz="Asia/Jerusalem")
+        self.assertEqual([len(items) for items in batches], [CALENDAR_BATCH_LIMIT, CALENDAR_BATCH_LIMIT, 1])
+        self.assertEqual(len(self.service._events), CALENDAR_BATCH_LIMIT * 2 + 1)
+        self.assertTrue(all(r.ok and r.event_id for r in b.results))
+
+    def test_update_delete_and_per_item_errors(self):
+        seen = []
+        with self.wrapper.batch() as b:
+            b.create_event(self.event)
+        event_id = b.results[0].event_id
+        with self.wrapper.batch() as b:
+            b.update_event(event_id, name="עודכן", callback=seen.append)
+            b.delete_event("missing", callback=seen.append)
+        self.assertEqual(self.service._events[event_id]["summary"], "עודכן")
+        self.assertEqual(self.service._events[event_id]["description"], "d")
+        self.assertEqual([r.op for r in seen], ["update", "delete"])
+        self.assertTrue(seen[0].ok)
+        self.assertEqual(seen[1].error.resp.status, 404)
+
+    def test_update_with_stale_etag_fails_412(self):
+        with self.wrapper.batch() as b:
+            b.create_event(self.event)
+        event_id = b.results[0].event_id
+        etag = self.service._events[event_id]["etag"]
+        self.wrapper.update_event(event_id, location="Room 2")
+        with self.wrapper.batch() as b:
+            b.update_event(event_id, name="עודכן", etag=etag)
+        self.assertEqual(b.results[0].error.resp.status, 412)
+        self.assertEqual(self.service._events[event_id]["summary"], "אסיפת הורים")
+
+
+class CalendarBatchRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService()
+        self.wrapper = GoogleCalendarWrapper(self.service, calendar_id="cal")
+        self.event = Event(name="אסיפת הורים", description="d", date=datetime(2025, 9, 10, 20, 0), location="x")
+        throttle = Throttle("calendar", rate=1000, base_delay=0.001, max_retries=3)
+        patcher = mock.patch("google_wrapper.get_throttle", return_value=throttle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _limit_inserts(self, times, error):
+        insert = self.service._insert
+        failures = iter(range(times))
+
+        def limited(body):
+            if next(failures, None) is not None:
+                raise error
+            return insert(body)
+
+        self.service._insert = limited
+
+    def test_rate_limited_items_are_resent(self):
+        self._limit_inserts(3, FakeHttpError(403, "rateLimitExceeded"))
+        with self.wrapper.batch() as b:
+            for _ in range(5):
+                b.create_event(self.event)
+        self.assertTrue(all(r.ok and r.event_id for r in b.results))
+        self.assertEqual(self.service.calls["insert"], 5)
+        # One batch of 5, then one of the 3 limited items.
+        self.assertEqual(self.service.calls["batch"], 2)
+
+    def test_other_item_errors_and_exhausted_retries_are_reported(self):
+        self._limit_inserts(10, FakeHttpError(429, "too many requests"))
+        with self.wrapper.batch() as b:
+            b.create_event(self.event)
+            b.delete_event("missing")
+        self.assertEqual([r.error.resp.status for r in b.results], [429, 404])
+        self.assertEqual(self.service.calls["batch"], 4)
+        self.assertEqual(self.service.calls["delete"], 1)
+
+    def test_missing_response_is_an_error(self):
+        class DroppingBatch(FakeBatch):
+            def execute(self):
+                self.items = self.items[:-1]
+                super().execute()
+
+        self.service.new_batch_http_request = lambda callback=None: DroppingBatch(self.service)
+        with self.wrapper.batch() as b:
+            b.create_event(self.event)
+            b.create_event(self.event)
+        self.assertTrue(b.results[0].ok)
+        self.assertIsInstance(b.results[1].error, MissingBatchResponse)
+        self.assertIsNone(b.results[1].event_id)
+
+
+class UpdateEventTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService()
+        self.wrapper = GoogleCalendarWrapper(self.service, calendar_id="cal")
+        event = Event(name="אסיפה", description="d", date=datetime(2025, 9, 10, 20, 0), location="x")
+        self.event_id = self.wrapper.create_event(event, tz="Asia/Jerusalem")
+        self.current = self.wrapper.get_event(self.event_id)
+
+    def test_patch_sends_only_changed_fields_with_etag(self):
+        with mock.patch.object(FakeCalendarService, "_patch", autospec=True,
+                               side_effect=FakeCalendarService._patch) as patch:
+            self.wrapper.update_event(
+                self.event_id, name="אסיפה - עודכן", description="d", start=datetime(2025, 9, 10, 20, 0),
+                tz="Asia/Jerusalem", current=self.current,
+            )
+        patch.assert_called_once_with(self.service, self.event_id, {"summary": "אסיפה - עודכן"}, self.current["etag"])
+        self.assertEqual(self.service._events[self.event_id]["location"], "x")
+
+    def test_stale_etag_is_rejected(self):
+        self.wrapper.update_event(self.event_id, location="Room 2")
+        with self.assertRaises(FakeHttpError) as caught:
+            self.wrapper.update_event(self.event_id, name="אסיפה - עודכן", current=self.current)
+        self.assertEqual(caught.exception.resp.status, 412)
+        self.assertEqual(self.service._events[self.event_id]["summary"], "אסיפה")
+
+    def test_no_request_when_nothing_changed(self):
+        out = self.wrapper.update_event(self.event_id, name="אסיפה", location="x", current=self.current)
+        self.assertIs(out, self.current)
+        self.assertEqual(self.service.calls["patch"], 0)
+
+
+class SyncEventConflictTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeCalendarService()
+        self.wrapper = GoogleCalendarWrapper(self.service, calendar_id="cal")
+        self.event = Event(name="אסיפה", description="d", date=datetime(2025, 9, 10, 20, 0), location="x")
+        self.event_id = self.wrapper.create_event(self.event, tz="UTC")
+
+    def test_412_rereads_and_patches_latest_version(self):
+        stale = self.wrapper.get_event(self.event_id)
+        # Someone else edits the event after our lookup read it.
+        self.wrapper.update_event(self.event_id, location="Room 2")
+        self.service._events[self.event_id]["colorId"] = "5"
+        changed = self.event.model_copy(update={"name": "אסיפה - עודכן", "location": None})
+        with mock.patch("parse_and_sync_service.find_existing_item", return_value=stale):
+            result = sync_event(changed, self.wrapper, "UTC")
+        self.assertEqual(result, {"action": "updated", "event_id": self.event_id})
+        current = self.wrapper.get_event(self.event_id)
+        self.assertEqual(current["summary"], "אסיפה - עודכן")
+        # The concurrent edits we did not touch survive.
+        self.assertEqual((current["location"], current["colorId"]), ("Room 2", "5"))
+        # First patch failed on If-Match; the retry is conditional on the re-read etag.
+        self.assertEqual(self.service.calls["patch"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+import unittest
+from pydantic_ai.models.function import FunctionModel
+from agent import route_and_parse, use_model
+from parse_cache import ParseCache
+from utils.images import Image, detect_media_type, hamming, prepare_image, thumbnail_diff
+from fakes import fake_model
+
+
+def _flyer(size=(2400, 1600), fmt="PNG", **save_args) -> bytes:
+    from PIL import ImageDraw
+    img = Image.new("RGB", (2400, 1600), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(0, 2400, 300):
+        draw.rectangle([i, i // 3, i + 150, i // 3 + 400], fill=(i % 255, 80, 200))
+    out = io.BytesIO()
+    img.resize(size).save(out, format=fmt, **save_args)
+    return out.getvalue()
+
+
+def _dated_flyer(date: str, width=1080, fmt="PNG", **save_args) -> bytes:
+    """The same flyer template with only the date changed."""
+    from PIL import ImageDraw, ImageFont
+    img = Image.new("RGB", (1080, 1350), (250, 240, 220))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, 1080, 300], fill=(40, 90, 160))
+    font = ImageFont.load_default(size=40)
+    draw.text((100, 120), "Parents meeting", font=font, fill="white")
+    draw.text((100, 600), f"Date: {date}", font=font, fill="black")
+    draw.text((100, 800), "Time: 20:00", font=font, fill="black")
+    out = io.BytesIO()
+    img.resize((width, width * 1350 // 1080)).save(out, format=fmt, **save_args)
+    return out.getvalue()
+
+
+class MediaTypeTest(unittest.TestCase):
+    def test_detects_from_magic_bytes(self):
+        self.assertEqual(detect_media_type(b"\x89PNG\r\n\x1a\n...."), "image/png")
+        self.assertEqual(detect_media_type(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "image/webp")
+        self.assertEqual(detect_media_type(b"\xff\xd8\xff\xe0"), "image/jpeg")
+
+
+@unittest.skipIf(Image is None, "Pillow not installed")
+class PrepareImageTest(unittest.TestCase):
+    def test_downscales_large_images(self):
+        prepared = prepare_image(_flyer(fmt="BMP"), max_side=800)
+        self.assertEqual(prepared.media_type, "image/jpeg")
+        from PIL import Image as PILImage
+        self.assertLessEqual(max(PILImage.open(io.BytesIO(prepared.data)).size), 800)
+
+    def test_recompressed_forward_has_close_hash(self):
+        original = prepare_image(_flyer())
+        forwarded = prepare_image(_flyer(size=(1200, 800), fmt="JPEG", quality=40))
+        self.assertLessEqual(hamming(original.phash, forwarded.phash), 6)
+        self.assertLessEqual(thumbnail_diff(original.thumb, forwarded.thumb), 16)
+
+    def test_same_template_with_another_date_is_not_the_same_image(self):
+        first, second = prepare_image(_dated_flyer("1/10")), prepare_image(_dated_flyer("8/10"))
+        # The hash cannot tell them apart; the thumbnails can.
+        self.assertLessEqual(hamming(first.phash, second.phash), 6)
+        self.assertGreater(thumbnail_diff(first.thumb, second.thumb), 16)
+
+
+@unittest.skipIf(Image is None, "Pillow not installed")
+class SimilarImageRouteTest(unittest.TestCase):
+    def _route(self, images):
+        calls = []
+        respond = fake_model().function
+
+        async def model(messages, info):
+            calls.append(info)
+            return await respond(messages, info)
+
+        cache = ParseCache()
+        with tempfile.TemporaryDirectory() as tmp, use_model(FunctionModel(model)):
+            for i, data in enumerate(images):
+                path = os.path.join(tmp, f"flyer{i}.jpg")
+                with open(path, "wb") as f:
+                    f.write(data)
+                route_and_parse(path, cache=cache)
+        return len(calls), cache.stats()["image_matches"]
+
+    def test_recompressed_forward_is_parsed_once(self):
+        forward = _dated_flyer("1/10", width=720, fmt="JPEG", quality=40)
+        self.assertEqual(self._route([_dated_flyer("1/10"), forward]), (1, 1))
+
+    def test_new_flyer_from_the_same_template_is_parsed(self):
+        self.assertEqual(self._route([_dated_flyer("1/10"), _dated_flyer("8/10")]), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
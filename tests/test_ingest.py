@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from agent import use_model
+from chat_router import ChatRouter
+from ingest import IngestLedger, ingest_chat, main
+from fakes import fake_model
+from test_sharding import FakePool
+
+FIRST = (
+    "8/31/25, 17:14 - Dana: מחר אסיפת הורים ב20:00 בגן\n"
+    "8/31/25, 17:20 - Noa: תודה!\n"
+    "8/31/25, 18:02 - Dana: מסיבת סוכות ב-10/10 בשעה 17:00\n"
+)
+LATER = (
+    "9/1/25, 08:00 - Noa: חוג ציור ב-12/10 בשעה 16:00\n"
+    "9/1/25, 08:05 - Dana: 👍\n"
+)
+
+
+class IngestLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.chat = os.path.join(self.tmp.name, "chat.txt")
+        self.ledger = IngestLedger(os.path.join(self.tmp.name, "ledger.db"))
+        self.seen = []
+        self.broken = set()
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def _process(self, text, wrapper, tz, linked_event_id=None):
+        self.seen.append(text)
+        if text in self.broken:
+            raise RuntimeError("calendar unavailable")
+        return {"kind": "other"}
+
+    def _ingest(self, content):
+        with open(self.chat, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.seen = []
+        return ingest_chat(self.chat, "gan", None, "UTC", self.ledger, process=self._process)
+
+    def test_reimport_only_processes_new_messages(self):
+        first = self._ingest(FIRST)
+        self.assertEqual((first.total, first.processed), (3, 3))
+        again = self._ingest(FIRST + LATER)
+        self.assertEqual(self.seen, ["חוג ציור ב-12/10 בשעה 16:00", "👍"])
+        self.assertEqual((again.total, again.processed, again.skipped_old + again.skipped_seen), (5, 2, 3))
+        self.assertEqual(self.ledger.watermark("gan").timestamp.isoformat(), "2025-09-01T08:05:00")
+
+    def test_failed_message_is_retried_and_holds_the_watermark(self):
+        self.broken = {"מסיבת סוכות ב-10/10 בשעה 17:00"}
+        first = self._ingest(FIRST + LATER)
+        self.assertEqual((first.processed, first.failed), (4, 1))
+        self.assertEqual(self.ledger.watermark("gan").timestamp.isoformat(), "2025-08-31T17:20:00")
+
+        self.broken = set()
+        again = self._ingest(FIRST + LATER)
+        # Only the failed message is processed again; the later ones are in the ledger.
+        self.assertEqual(self.seen, ["מסיבת סוכות ב-10/10 בשעה 17:00"])
+        self.assertEqual((again.processed, again.failed, again.skipped_seen), (1, 0, 3))
+        self.assertEqual(self.ledger.watermark("gan").timestamp.isoformat(), "2025-09-01T08:05:00")
+
+
+class IngestMainTest(unittest.TestCase):
+    def test_cli_ingests_each_chat_and_resumes(self):
+        pool = FakePool()
+        with tempfile.TemporaryDirectory() as tmp:
+            chat = os.path.join(tmp, "gan.txt")
+            with open(chat, "w", encoding="utf-8") as f:
+                f.write(FIRST)
+            argv = [f"gan={chat}", "--ledger", os.path.join(tmp, "ledger.db")]
+            with use_model(fake_model()), mock.patch("calendar_pool.CalendarClientPool.from_env", return_value=pool), \
+                    mock.patch("ingest.get_default_router", return_value=ChatRouter()), redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(main(argv), 0)
+                self.assertEqual(main(argv), 0)
+        runs = out.getvalue().splitlines()
+        self.assertIn("processed=3", runs[0])
+        self.assertIn("processed=0", runs[1])
+        self.assertEqual(pool.services["default"].calls["insert"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
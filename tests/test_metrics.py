@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from metrics import Registry, timed, STAGE_SECONDS, CALENDAR_REQUESTS
+from google_wrapper import GoogleCalendarWrapper
+from fakes import FakeCalendarService, FakeHttpError
+
+
+class MetricsTest(unittest.TestCase):
+    def test_prometheus_text(self):
+        registry = Registry()
+        calls = registry.counter("calls_total", "Calls.", ("op",))
+        latency = registry.histogram("latency_seconds", "Latency.", ("op",), buckets=(0.1, 1.0))
+        calls.inc('say "hi"')
+        calls.inc('say "hi"', value=2)
+        latency.observe(0.05, "a")
+        latency.observe(0.5, "a")
+        latency.observe(5, "a")
+        text = registry.render()
+        self.assertIn("# TYPE calls_total counter", text)
+        self.assertIn('calls_total{op="say \\"hi\\""} 3', text)
+        self.assertIn('latency_seconds_bucket{op="a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{op="a",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{op="a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_sum{op="a"} 5.55', text)
+        self.assertIn('latency_seconds_count{op="a"} 3', text)
+
+    def test_timed_sync_and_async(self):
+        @timed("test_sync")
+        def f(x):
+            return x + 1
+
+        @timed("test_async")
+        async def g(x):
+            return x * 2
+
+        before = STAGE_SECONDS.count("test_sync"), STAGE_SECONDS.count("test_async")
+        self.assertEqual(f(1), 2)
+        self.assertEqual(asyncio.run(g(2)), 4)
+        self.assertEqual((STAGE_SECONDS.count("test_sync"), STAGE_SECONDS.count("test_async")),
+                         (before[0] + 1, before[1] + 1))
+
+    def test_calendar_outcomes(self):
+        wrapper = GoogleCalendarWrapper(FakeCalendarService())
+        before = CALENDAR_REQUESTS.value("delete", "ok"), CALENDAR_REQUESTS.value("delete", "404")
+        created = wrapper.service.events().insert(calendarId="c", body={"summary": "x"}).execute()
+        wrapper.delete_event(created["id"])
+        with self.assertRaises(FakeHttpError):
+            wrapper.delete_event("missing")
+        self.assertEqual(CALENDAR_REQUESTS.value("delete", "404"), before[1] + 1)
+        self.assertEqual(CALENDAR_REQUESTS.value("delete", "ok"), before[0] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from near_dup import NearDuplicateIndex, signals
+from text_patterns import has_absolute_date
+from google_wrapper import GoogleCalendarWrapper
+from ingest import IngestLedger, ingest_chat
+from parse_and_sync_service import sync_event
+from agent import Event
+from fakes import FakeCalendarService
+
+ANNOUNCEMENT = "שימו לב - מחר אסיפת הורים ב20:00 בגן, נא להגיע בזמן"
+CHAT = (
+    f"8/31/25, 17:14 - Dana: {ANNOUNCEMENT}\n"
+    f"8/31/25, 17:20 - Dana: {ANNOUNCEMENT} 🙏 <This message was edited>\n"
+    f"8/31/25, 18:02 - Dana: {ANNOUNCEMENT.replace('20:00', '20:30')}\n"
+)
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+    def test_variants(self):
+        index = NearDuplicateIndex()
+        index.add("a", ANNOUNCEMENT, scope="gan")
+        edited = index.query(f"🎉 {ANNOUNCEMENT}!! <This message was edited>", scope="gan")
+        self.assertEqual(edited.key, "a")
+        self.assertTrue(edited.same_signals)
+        moved = index.query(ANNOUNCEMENT.replace("20:00", "20:30"), scope="gan")
+        self.assertEqual((moved.key, moved.added, moved.removed), ("a", ["20:30"], ["20:00"]))
+        self.assertIsNone(index.query("תזכורת: מסיבת סוכות בגן ביום רביעי 10/10 בשעה 17:00", scope="gan"))
+        self.assertIsNone(index.query(ANNOUNCEMENT, scope="other chat"))
+        self.assertIsNone(index.query("תודה!", scope="gan"))
+
+    def test_signals(self):
+        self.assertEqual(signals("ביום 10/10 בשעה 17:00, פרטים ב https://example.com/x"),
+                         ["10/10", "17:00", "https://example.com/x"])
+        self.assertEqual(signals("מחרתיים ביום רביעי 17:00"), ["מחרתיים", "רביעי", "17:00"])
+
+    def test_has_absolute_date(self):
+        self.assertTrue(all(map(has_absolute_date, ["ב-10/10 בשעה 17:00", "ב8.9", "10 באוקטובר", "October 10"])))
+        self.assertFalse(any(map(has_absolute_date, ["מחר אסיפה ב20:00", "ב20.00", "חוג ב16:00"])))
+
+    def test_changed_day_word_is_an_update(self):
+        index = NearDuplicateIndex()
+        index.add("a", ANNOUNCEMENT, scope="gan")
+        moved = index.query(ANNOUNCEMENT.replace("מחר", "מחרתיים"), scope="gan")
+        self.assertEqual((moved.key, moved.same_signals), ("a", False))
+        self.assertEqual((moved.added, moved.removed), (["מחרתיים"], ["מחר"]))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "near_dups.db")
+            index = NearDuplicateIndex(path)
+            index.add("a", ANNOUNCEMENT, scope="gan")
+            index.close()
+            reloaded = NearDuplicateIndex(path)
+            self.assertEqual(len(reloaded), 1)
+            self.assertEqual(reloaded.query(ANNOUNCEMENT, scope="gan").key, "a")
+            reloaded.close()
+
+
+class IngestNearDuplicatesTest(unittest.TestCase):
+    def test_edit_skipped_and_time_change_updates_event(self):
+        service = FakeCalendarService()
+        wrapper = GoogleCalendarWrapper(service)
+        calls = []
+
+        def process(text, wrapper, tz, linked_event_id=None):
+            calls.append(linked_event_id)
+            hour, minute = (20, 30) if "20:30" in text else (20, 0)
+            # Title reworded by the model, so only the link finds the earlier event.
+            name = "Parents meeting" if linked_event_id is None else "אסיפת הורים"
+            event = Event(name=name, description="", location="", date=datetime(2025, 9, 1, hour, minute))
+            return dict(kind="event", **sync_event(event, wrapper, "UTC", linked_event_id=linked_event_id))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            chat = os.path.join(tmp, "chat.txt")
+            with open(chat, "w", encoding="utf-8") as f:
+                f.write(CHAT)
+            ledger = IngestLedger(os.path.join(tmp, "ledger.db"))
+            report = ingest_chat(chat, "gan", wrapper, "UTC", ledger, process=process,
+                                 near_dups=NearDuplicateIndex())
+            ledger.close()
+
+        self.assertEqual((report.processed, report.near_duplicates, report.linked_updates), (3, 2, 1))
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(calls[0])
+        self.assertIsNotNone(calls[1])
+        self.assertEqual(service.calls["insert"], 1)
+        self.assertEqual(service.calls["patch"], 1)
+
+
+    def test_relative_repost_on_another_day_is_a_new_occurrence(self):
+        reminder = "תזכורת: מחר חוג ציור ב16:00 במתנ\"ס, להביא סינר"
+        party = "תזכורת: מסיבת סוכות בגן ב-10/10 בשעה 17:00, נא להגיע בלבן"
+        chat = (
+            f"9/1/25, 08:00 - Dana: {reminder}\n"
+            f"9/1/25, 09:00 - Dana: {party}\n"
+            f"9/8/25, 08:00 - Dana: {reminder}\n"
+            f"9/8/25, 09:00 - Dana: {party}\n"
+        )
+        calls = []
+
+        def process(text, wrapper, tz, linked_event_id=None):
+            calls.append((text, linked_event_id))
+            return {"kind": "event", "action": "created", "event_id": f"evt{len(calls)}"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "chat.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(chat)
+            ledger = IngestLedger(os.path.join(tmp, "ledger.db"))
+            report = ingest_chat(path, "gan", None, "UTC", ledger, process=process, near_dups=NearDuplicateIndex())
+            ledger.close()
+
+        # Next week's class is its own event; the dated party is still a repeat.
+        self.assertEqual(calls, [(reminder, None), (party, None), (reminder, None)])
+        self.assertEqual((report.processed, report.events, report.near_duplicates), (4, 3, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+from agent import _text_key
+from compact import CompactionConfig, PromptCompactor
+from parse_cache import ParseCache, text_key, image_key
+
+
+class ParseCacheTest(unittest.TestCase):
+    def test_text_key_normalizes_whitespace(self):
+        self.assertEqual(text_key(" מחר  אסיפה\n", "m", "1"), text_key("מחר אסיפה", "m", "1"))
+        self.assertNotEqual(text_key("מחר אסיפה", "m", "1"), text_key("מחר אסיפה", "m", "2"))
+        self.assertNotEqual(text_key("x", "m", "1"), image_key(b"x", "m", "1"))
+
+    def test_relative_dates_keyed_by_reference_day(self):
+        monday, tuesday = datetime(2025, 9, 8, 9, 0), datetime(2025, 9, 9, 9, 0)
+        relative = "מחר אסיפה ב20:00"
+        self.assertNotEqual(_text_key(relative, monday), _text_key(relative, tuesday))
+        self.assertEqual(_text_key(relative, monday), _text_key(relative, monday.replace(hour=18)))
+        self.assertNotEqual(_text_key("Meeting on Wednesday", monday), _text_key("Meeting on Wednesday", tuesday))
+        # Undated text gets the message date, so it depends on the day too.
+        for undated in ("אסיפה ב20:00 בבית הספר", "נא להעביר 50 ש\"ח בפייבוקס"):
+            self.assertNotEqual(_text_key(undated, monday), _text_key(undated, monday.replace(day=15)))
+        # Absolute dates resolve the same on any day.
+        self.assertEqual(_text_key("אסיפה ב-10/9 ב20:00", monday), _text_key("אסיפה ב-10/9 ב20:00", tuesday))
+
+    def test_key_covers_provider_and_compaction(self):
+        text = "אסיפה ב-10/9 ב20:00"
+        plain = _text_key(text)
+        with mock.patch("agent.MODEL_ID", "openai:gemini-2.5-flash"):
+            self.assertNotEqual(_text_key(text), plain)
+        compacted = set()
+        for budget in (300, 200):
+            compactor = PromptCompactor(CompactionConfig(token_budget=budget))
+            with mock.patch("agent.get_default_compactor", return_value=compactor):
+                compacted.add(_text_key(text))
+        self.assertEqual(len(compacted), 2)
+        self.assertNotIn(plain, compacted)
+
+    def test_lru_eviction_and_counters(self):
+        cache = ParseCache(max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        self.assertEqual(cache.get("a"), "1")
+        cache.set("c", "3")  # evicts "b", the least recently used
+        self.assertIsNone(cache.get("b"))
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        cache = ParseCache(ttl_seconds=0.01)
+        cache.set("a", "1")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, "cache.db")
+            first = ParseCache(db_path=db)
+            first.set("a", '{"kind": "other"}')
+            first.close()
+            second = ParseCache(db_path=db)
+            self.assertEqual(second.get("a"), '{"kind": "other"}')
+            self.assertEqual(second.stats()["disk_hits"], 1)
+            second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from prefilter import PreFilter, PrefilterConfig
+
+
+class PreFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.gate = PreFilter()
+
+    def test_rejects_obvious_other(self):
+        for text in ["תודה רבה!", "thanks", "❤️❤️👍", "<Media omitted>", "This message was deleted",
+                     "Dana joined using this group's invite link", ""]:
+            self.assertIsNotNone(self.gate.check(text), text)
+
+    def test_passes_event_and_task_signals(self):
+        for text in [
+            "שימו לב - מחר אסיפת הורים ב20:00",
+            "Parents meeting on 10/09",
+            "שימוש ב-PayBox חינם! https://links.payboxapp.com/1",
+            "ביום רביעי הקרוב יתקיים טיול",
+            "םירוה תפיסא",  # visually reversed Hebrew, as in some exports
+        ]:
+            self.assertIsNone(self.gate.check(text), text)
+
+    def test_stats_and_audit(self):
+        gate = PreFilter(PrefilterConfig(audit=True))
+        reason = gate.check("thanks")
+        gate.check("מחר אסיפה")
+        gate.audit("thanks", reason, type("Parsed", (), {"kind": "task"})())
+        stats = gate.stats()
+        self.assertEqual(stats["checked"], 2)
+        self.assertEqual(stats["reject_rate"], 0.5)
+        self.assertEqual(stats["false_negatives"], 1)
+        self.assertEqual(len(gate.false_negatives), 1)
+
+    def test_extra_keywords_and_disable(self):
+        self.assertIsNotNone(self.gate.check("hackathon everyone"))
+        self.assertIsNone(PreFilter(PrefilterConfig(extra_keywords=["hackathon"])).check("hackathon everyone"))
+        self.assertIsNone(PreFilter(PrefilterConfig(enabled=False)).check("thanks"))
+
+
+if __name__ == '__main__':
+    unittest.main()
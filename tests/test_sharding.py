@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from chat_router import CalendarNotAllowed, ChatRouter, UnknownChat
+from google_wrapper import GoogleCalendarWrapper
+from ingest import IngestLedger, ingest_chats
+from job_queue import ShardedJobQueue
+from utils.whatsapp_export import iter_whatsapp_chat
+from fakes import FakeCalendarService, synthetic_chat
+
+
+class FakePool:
+    def __init__(self) -> None:
+        self.tz = "UTC"
+        self.default_calendar_id = "default"
+        self.services = {}
+
+    def get(self, calendar_id=None):
+        service = self.services.setdefault(calendar_id or "default", FakeCalendarService())
+        return GoogleCalendarWrapper(service, calendar_id=calendar_id or "default")
+
+    def mirror(self, calendar_id=None):
+        return None
+
+
+class ChatRouterTest(unittest.TestCase):
+    def test_routes_default_and_strict(self):
+        router = ChatRouter({"gan": "gan@group"}, default_calendar_id="main")
+        self.assertEqual(router.calendar_for("gan"), "gan@group")
+        self.assertEqual(router.calendar_for("other"), "main")
+        self.assertEqual(router.calendar_for(None), "main")
+        with self.assertRaises(UnknownChat):
+            ChatRouter({"gan": "gan@group"}, strict=True).calendar_for("other")
+
+    def test_resolve_only_accepts_the_routed_calendar(self):
+        router = ChatRouter({"gan": "gan@group"})
+        self.assertEqual(router.resolve("gan", "gan@group"), "gan@group")
+        self.assertEqual(router.resolve("other", None, default_calendar_id="main"), "main")
+        self.assertEqual(router.resolve(None, "main", default_calendar_id="main"), "main")
+        with self.assertRaises(CalendarNotAllowed):
+            router.resolve("gan", "class5@group")
+        with self.assertRaises(CalendarNotAllowed):
+            router.resolve("other", "gan@group", default_calendar_id="main")
+
+    def test_from_env(self):
+        with mock.patch.dict(os.environ, {"CHAT_CALENDARS": '{"gan": "gan@group", "5": "class5@group"}'}):
+            router = ChatRouter.from_env()
+        self.assertEqual(router.calendar_for("5"), "class5@group")
+        self.assertIsNone(router.calendar_for("other"))
+
+
+class ShardedJobQueueTest(unittest.TestCase):
+    def test_order_kept_per_key_and_keys_run_in_parallel(self):
+        seen = {}
+        running = set()
+        overlap = []
+        lock = threading.Lock()
+
+        def handler(key, n):
+            with lock:
+                running.add(key)
+                overlap.append(len(running))
+            time.sleep(0.001 * (n % 3))
+            with lock:
+                seen.setdefault(key, []).append(n)
+                running.discard(key)
+            return n
+
+        jobs = ShardedJobQueue(handler, workers=4, max_queue=100)
+        keys = [f"chat-{i}" for i in range(8)]
+        self.assertGreater(len({jobs.shard(key) for key in keys}), 1)
+        jobs.start()
+        submitted = [jobs.submit(key, key, n) for n in range(20) for key in keys]
+        for job in submitted:
+            self.assertTrue(job.wait(5))
+        jobs.stop()
+        self.assertEqual(seen, {key: list(range(20)) for key in keys})
+        self.assertGreater(max(overlap), 1)
+        self.assertEqual(jobs.stats()["done"], len(submitted))
+
+    def test_failure_is_reported(self):
+        def handler():
+            raise ValueError("boom")
+
+        jobs = ShardedJobQueue(handler, workers=1)
+        jobs.start()
+        job = jobs.submit("gan")
+        job.wait(5)
+        jobs.stop()
+        self.assertEqual(job.status, "failed")
+        self.assertIsInstance(job.exception, ValueError)
+
+
+class IngestChatsTest(unittest.TestCase):
+    def test_each_chat_goes_to_its_calendar_in_order(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            chats = {}
+            for seed, chat_id in enumerate(("gan", "class5")):
+                path = os.path.join(tmp, f"{chat_id}.txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(synthetic_chat(40, seed=seed, long_every=0))
+                chats[chat_id] = path
+            calls = []
+
+            def process(text, wrapper, tz, linked_event_id=None):
+                calls.append((wrapper.calendar_id, text))
+                return {"kind": "other"}
+
+            ledger = IngestLedger(os.path.join(tmp, "ledger.db"))
+            router = ChatRouter({"gan": "gan@group", "class5": "class5@group"}, strict=True)
+            reports = ingest_chats(chats, FakePool(), ledger, router=router, workers=2, process=process)
+            ledger.close()
+
+            for chat_id, path in chats.items():
+                expected = [m.text for m in iter_whatsapp_chat(path)]
+                self.assertEqual(reports[chat_id].processed, len(expected))
+                self.assertEqual([text for calendar_id, text in calls if calendar_id == f"{chat_id}@group"], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
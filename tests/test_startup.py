@@ -0,0 +1,17 @@
+import os
+import unittest
+from unittest import mock
+from bench_import import profile_import
+
+
+class StartupTest(unittest.TestCase):
+    def test_entry_modules_import_lazily_without_api_key(self):
+        env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "GEMINI_API_KEY")}
+        with mock.patch.dict(os.environ, env, clear=True):
+            for module in ("agent", "parse_and_sync_service"):
+                result = profile_import(module, repeat=1)
+                self.assertEqual(result["heavy_loaded"], [], module)
+
+
+if __name__ == '__main__':
+    unittest.main()
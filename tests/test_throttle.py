@@ -0,0 +1,83 @@
+import asyncio
+import time
+import unittest
+from throttle import AdaptiveLimiter, Throttle, TokenBucket, is_retryable
+from fakes import FakeHttpError
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class ThrottleTest(unittest.TestCase):
+    def make(self, **kwargs):
+        kwargs.setdefault("base_delay", 0.001)
+        return Throttle("test", rate=1000, burst=1000, max_concurrency=4, **kwargs)
+
+    def test_retries_rate_limits_then_succeeds(self):
+        throttle = self.make()
+        calls = []
+
+        def flaky():
+            calls.append(throttle.limiter.limit)
+            if len(calls) < 3:
+                raise RateLimited("quota")
+            return "ok"
+
+        self.assertEqual(throttle.call(flaky), "ok")
+        self.assertEqual(calls, [2, 1, 1])  # halved on the rate limit, floored at 1
+        self.assertEqual(throttle.limiter.in_flight, 0)
+        self.assertEqual(throttle.limiter.limit, 2)  # additive increase after the success
+
+    def test_gives_up_and_skips_unsafe_retries(self):
+        throttle = self.make(max_retries=2)
+        calls = []
+
+        def failing(status):
+            calls.append(status)
+            raise FakeHttpError(status, "boom")
+
+        with self.assertRaises(FakeHttpError):
+            throttle.call(failing, 503)
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        with self.assertRaises(FakeHttpError):
+            throttle.call(failing, 503, server_errors=False)
+        with self.assertRaises(FakeHttpError):
+            throttle.call(failing, 404)
+        self.assertEqual(calls, [503, 404])
+        self.assertTrue(is_retryable(FakeHttpError(403, "userRateLimitExceeded")))
+        self.assertFalse(is_retryable(FakeHttpError(403, "forbidden")))
+
+    def test_async_call_and_additive_increase(self):
+        throttle = self.make()
+
+        async def work(i):
+            await asyncio.sleep(0)
+            return i
+
+        async def main():
+            return await asyncio.gather(*(throttle.call_async(work, i) for i in range(20)))
+
+        self.assertEqual(asyncio.run(main()), list(range(20)))
+        self.assertGreater(throttle.limiter.limit, 2)
+        self.assertLessEqual(throttle.limiter.limit, 4)
+
+    def test_token_bucket_paces_requests(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.045)
+
+    def test_limiter_caps_concurrency(self):
+        limiter = AdaptiveLimiter(initial=2, maximum=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertFalse(limiter._try_acquire())
+        limiter.release("ok")
+        self.assertTrue(limiter._try_acquire())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from title_index import TitleIndex, best_match, title_similarity
+from utils.utils import rtl
+
+
+class TitleSimilarityTest(unittest.TestCase):
+    def test_variants_match(self):
+        name = "אסיפת הורים"
+        for variant in ("אסיפת הורים - עודכן", rtl(name), "אֲסִיפַת הוֹרִים!", "אסיפת ההורים", "❣️ אסיפת הורים ❣️"):
+            self.assertGreaterEqual(title_similarity(name, variant), 0.7, variant)
+        self.assertGreaterEqual(title_similarity("Parents meeting", "parent-meeting"), 0.7)
+
+    def test_different_events_do_not_match(self):
+        self.assertLess(title_similarity("אסיפת הורים", "מסיבת סוכות"), 0.7)
+        self.assertLess(title_similarity("יום הולדת לנועה", "יום הולדת ליואב"), 0.7)
+        self.assertIsNone(best_match("אסיפת הורים", [{"summary": "מסיבת חנוכה"}, {}]))
+
+
+class TitleIndexTest(unittest.TestCase):
+    def test_search_by_bucket_and_remove(self):
+        index = TitleIndex()
+        day = datetime(2025, 9, 10, 17, 0, tzinfo=timezone.utc)
+        index.add("a", "אסיפת הורים", day)
+        index.add("b", "מסיבת סוכות", day)
+        index.add("c", "אסיפת הורים", day + timedelta(days=30))
+        hits = index.search("אסיפת ההורים", day - timedelta(hours=2), day + timedelta(hours=2))
+        self.assertEqual([key for _, key in hits], ["a"])
+        index.remove("a")
+        self.assertEqual(index.search("אסיפת הורים", day, day), [])
+        self.assertEqual(len(index), 2)
+
+    def test_scores_thousands_of_candidates_quickly(self):
+        index = TitleIndex()
+        day = datetime(2025, 9, 10, tzinfo=timezone.utc)
+        for i in range(5000):
+            index.add(str(i), f"אירוע מספר {i} בגן", day)
+        started = time.perf_counter()
+        hits = index.search("אירוע מספר 4321 בגן", day, day, threshold=0.9)
+        self.assertEqual(hits[0][1], "4321")
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import random
+import unicodedata
+import unittest
+from bidi.algorithm import get_display
+from utils.utils import rtl, _sanitize_for_bidi
+
+
+def reference_sanitize(s: str) -> str:
+    out = []
+    for ch in s:
+        if ch in ("\n", "\t"):
+            out.append(ch)
+            continue
+        if unicodedata.category(ch) in ("Cc", "Cs", "Cf"):
+            continue
+        out.append(ch)
+    return "".join(out)
+
+
+def reference_rtl(s: str) -> str:
+    lines = reference_sanitize(s or "").splitlines()
+    out_lines = []
+    for line in lines:
+        try:
+            out_lines.append(get_display(line))
+        except Exception:
+            out_lines.append(line)
+    return "\n".join(out_lines)
+
+
+# Hebrew with niqqud, Arabic letters and digits, Latin, digits, brackets, emoji,
+# directional and zero-width formatting characters, controls and line separators.
+ALPHABET = (
+    "אבגדהוזחטיכלמנסעפצקרשת" "ְִֵֶַָֹֻּ" "ابتثجح" "٠١٢٣٤٥"
+    "abcXYZ" "0123456789" " .,:-/()[]<>!?\"'" "😍❤️🌹"
+    "‎‏‪‫‬‭‮⁦⁧⁨⁩​﻿­"
+    "\t\r\n\x0b\x0c\x1c\x85  \x00\x07"
+)
+
+
+class RtlEquivalenceTest(unittest.TestCase):
+    def test_random_strings_match_reference(self):
+        rng = random.Random(1234)
+        for _ in range(2000):
+            s = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60)))
+            self.assertEqual(_sanitize_for_bidi(s), reference_sanitize(s), repr(s))
+            self.assertEqual(rtl(s), reference_rtl(s), repr(s))
+
+    def test_every_bmp_control_and_format_char(self):
+        s = "".join(chr(cp) for cp in range(0x10000) if unicodedata.category(chr(cp)) in ("Cc", "Cf"))
+        self.assertEqual(_sanitize_for_bidi(s + "שלום"), reference_sanitize(s + "שלום"))
+
+    def test_announcement_and_empty(self):
+        text = ("שימו לב - מחר אסיפת הורים ב20:00\n"
+                "❣️נשמח לראותכם 10/09 בשעה 20:00 (בגן)‏ <This message was edited>\n"
+                "Parents meeting, 10/09 at 20:00\n\n"
+                "https://links.payboxapp.com/1")
+        self.assertEqual(rtl(text), reference_rtl(text))
+        self.assertEqual(rtl(None), "")
+        self.assertEqual(rtl(""), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
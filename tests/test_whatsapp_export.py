@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from utils.whatsapp_export import iter_whatsapp_chat, parse_whatsapp_chat, parse_timestamp
+
+CHAT = (
+    "\u200e8/31/25, 17:13 - Messages and calls are end-to-end encrypted.\n"
+    "8/31/25, 17:14 - Dana: שימו לב - מחר אסיפת הורים ב20:00\n"
+    "9/1/25, 09:05 - Yossi: first line\n"
+    "second line\n"
+    "\n"
+    "third line\n"
+    "9/2/25, 21:30 - Dana: <Media omitted>\n"
+)
+
+
+class WhatsappExportTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(CHAT)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_parses_messages(self):
+        messages = list(iter_whatsapp_chat(self.path))
+        self.assertEqual(len(messages), 4)
+        self.assertIsNone(messages[0].author)
+        self.assertEqual(messages[1].author, "Dana")
+        self.assertEqual(messages[1].timestamp, datetime(2025, 8, 31, 17, 14))
+        self.assertEqual(messages[2].text, "first line\nsecond line\nthird line")
+        self.assertEqual(parse_whatsapp_chat(self.path)[3],
+                         {"date": "9/2/25", "time": "21:30", "author": "Dana", "text": "<Media omitted>"})
+
+    def test_resume_from_offset(self):
+        messages = list(iter_whatsapp_chat(self.path))
+        resumed = list(iter_whatsapp_chat(self.path, start_offset=messages[1].end_offset))
+        self.assertEqual([m.text for m in resumed], [m.text for m in messages[2:]])
+        self.assertEqual([m.offset for m in resumed], [m.offset for m in messages[2:]])
+        with open(self.path, "rb") as f:
+            f.seek(messages[2].offset)
+            self.assertTrue(f.readline().startswith(b"9/1/25, 09:05"))
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp("11/10/25", "09:19", dayfirst=True), datetime(2025, 10, 11, 9, 19))
+        self.assertEqual(parse_timestamp("8/31/25", "5:13 PM"), datetime(2025, 8, 31, 17, 13))
+        # Impossible month-first date falls back to day-first
+        self.assertEqual(parse_timestamp("31/8/2025", "00:01"), datetime(2025, 8, 31, 0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
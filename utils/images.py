@@ -0,0 +1,110 @@
+import io
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it images are sent as-is
+    Image = None
+    ImageOps = None
+
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1600"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# Large enough that a changed date or time on a flyer changes some pixels by tens of levels,
+# while a re-compressed or resized forward stays within a few.
+THUMB_SIZE = (64, 64)
+
+# Formats the vision model accepts directly.
+_SUPPORTED = {"image/jpeg", "image/png", "image/webp"}
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    media_type: str
+    # 64-bit difference hash; None when Pillow is missing or the image can't be decoded.
+    phash: Optional[int]
+    original_size: int
+    # THUMB_SIZE grayscale pixels, to confirm a phash match (see thumbnail_diff).
+    thumb: Optional[bytes] = None
+
+
+def detect_media_type(data: bytes) -> str:
+    """Media type from the file's magic bytes (falls back to image/jpeg)."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1", b"ftyphevc"):
+        return "image/heic"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    return "image/jpeg"
+
+
+def dhash(img, size: int = 8) -> int:
+    """Difference hash: robust to re-compression and resizing (e.g. WhatsApp forwards)."""
+    gray = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = gray.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def thumbnail(img, size=THUMB_SIZE) -> bytes:
+    return img.convert("L").resize(size, Image.LANCZOS).tobytes()
+
+
+def thumbnail_diff(a: bytes, b: bytes) -> int:
+    """Largest per-pixel difference between two thumbnails (255 if their sizes differ).
+    dhash cannot see text; this can, so a phash match is only trusted when this is small.
+    """
+    if len(a) != len(b):
+        return 255
+    return max((abs(x - y) for x, y in zip(a, b)), default=0)
+
+
+def prepare_image(data: bytes, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_QUALITY) -> PreparedImage:
+    """Detect the real media type, downscale to max_side and re-encode when that helps,
+    and compute a perceptual hash and thumbnail for flyer deduplication.
+    """
+    media_type = detect_media_type(data)
+    if Image is None:
+        return PreparedImage(data, media_type, None, len(data))
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        return PreparedImage(data, media_type, None, len(data))
+    phash, thumb = dhash(img), thumbnail(img)
+    too_big = max(img.size) > max_side
+    if not too_big and media_type in _SUPPORTED:
+        return PreparedImage(data, media_type, phash, len(data), thumb)
+    if img.mode in ("RGBA", "LA", "P"):
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    if too_big:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    encoded = out.getvalue()
+    if media_type in _SUPPORTED and len(encoded) >= len(data):
+        return PreparedImage(data, media_type, phash, len(data), thumb)
+    return PreparedImage(encoded, "image/jpeg", phash, len(data), thumb)
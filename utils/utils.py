@@ -1,25 +1,73 @@
-from bidi.algorithm import get_display
+from functools import lru_cache
+import re
 import unicodedata
 
-def _sanitize_for_bidi(s: str) -> str:
-    out = []
-    for ch in s:
-        if ch in ("\n", "\t"):
-            out.append(ch)
-            continue
-        cat = unicodedata.category(ch)
-        if cat in ("Cc", "Cs", "Cf"):
+# Only planes 0, 1 and 14 contain Cc/Cs/Cf or right-to-left (R/AL/AN) code points;
+# planes 2-3 are CJK and 15-16 private use, so scanning them would only cost time.
+_SCAN_RANGES = ((0x0000, 0x20000), (0xE0000, 0xE1000))
+
+_deletions = None
+_rtl_re = None
+
+
+def _char_class(codepoints: list) -> str:
+    parts = []
+    start = prev = codepoints[0]
+    for cp in codepoints[1:] + [None]:
+        if cp is not None and cp == prev + 1:
+            prev = cp
             continue
-        out.append(ch)
-    return "".join(out)
+        parts.append(re.escape(chr(start)) if start == prev else f"{re.escape(chr(start))}-{re.escape(chr(prev))}")
+        if cp is not None:
+            start = prev = cp
+    return "[" + "".join(parts) + "]"
 
-def rtl(s: str) -> str:
-    text = _sanitize_for_bidi(s or "")
-    lines = text.splitlines()
+
+def _tables():
+    """Build (once) the str.translate deletion table and the RTL-character regex."""
+    global _deletions, _rtl_re
+    if _deletions is None:
+        deletions = {}
+        rtl_codepoints = []
+        for lo, hi in _SCAN_RANGES:
+            for cp in range(lo, hi):
+                ch = chr(cp)
+                if unicodedata.category(ch) in ("Cc", "Cs", "Cf") and ch not in ("\n", "\t"):
+                    deletions[cp] = None
+                if unicodedata.bidirectional(ch) in ("R", "AL", "AN"):
+                    rtl_codepoints.append(cp)
+        _rtl_re = re.compile(_char_class(rtl_codepoints))
+        _deletions = deletions
+    return _deletions, _rtl_re
+
+
+def _sanitize_for_bidi(s: str) -> str:
+    # Drop control/surrogate/format characters (keeping newlines and tabs).
+    return s.translate(_tables()[0])
+
+
+def _get_display(line: str) -> str:
+    # Imported on first use: LTR-only text never needs python-bidi.
+    from bidi.algorithm import get_display
+    return get_display(line)
+
+
+@lru_cache(maxsize=4096)
+def _rtl_cached(s: str) -> str:
+    text = _sanitize_for_bidi(s)
+    has_rtl = _tables()[1].search
     out_lines = []
-    for line in lines:
+    for line in text.splitlines():
+        # With no R/AL/AN characters every bidi level is 0, so the display order is unchanged.
+        if not has_rtl(line):
+            out_lines.append(line)
+            continue
         try:
-            out_lines.append(get_display(line))
+            out_lines.append(_get_display(line))
         except Exception:
             out_lines.append(line)
     return "\n".join(out_lines)
+
+
+def rtl(s: str) -> str:
+    return _rtl_cached(s or "")
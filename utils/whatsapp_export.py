@@ -0,0 +1,154 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+# Android export: 8/31/25, 17:13 - Name: Message text
+# iOS export:     [8/31/25, 17:13:05] Name: Message text
+# Author is optional (system messages); time may carry seconds and AM/PM.
+_DATE = r"(\d{1,2}[/.]\d{1,2}[/.]\d{2,4})"
+_TIME = r"(\d{1,2}:\d{2}(?::\d{2})?(?:\s?[APap]\.?[Mm]\.?)?)"
+_ANDROID_RE = re.compile(rf"^{_DATE},? {_TIME} - (.*)$")
+_IOS_RE = re.compile(rf"^\[{_DATE},? {_TIME}\] (.*)$")
+# Author names do not contain ": ", so the first one splits author from text.
+_AUTHOR_RE = re.compile(r"^(.*?): (.*)$", re.DOTALL)
+# Exports sprinkle direction marks and the BOM in front of timestamps.
+_LEADING_MARKS = "\ufeff\u200e\u200f\u202a\u202b\u202c\u202d\u202e"
+
+
+@dataclass
+class ChatMessage:
+    """One message from a WhatsApp export.
+
+    offset is the byte offset of the message's first line; end_offset is where the
+    next message starts, i.e. the checkpoint to resume from once this one is processed.
+    """
+    date: Optional[str]
+    time: Optional[str]
+    author: Optional[str]
+    text: str
+    timestamp: Optional[datetime]
+    offset: int
+    end_offset: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Legacy shape: keys 'date', 'time', 'author', 'text'."""
+        return {"date": self.date, "time": self.time, "author": self.author, "text": self.text}
+
+
+def parse_timestamp(date: str, time_: str, dayfirst: bool = False) -> Optional[datetime]:
+    """Parse export date/time strings ('8/31/25', '17:13' or '5:13:02 PM') into a datetime.
+
+    If the preferred field order gives an impossible date the other order is tried.
+    """
+    try:
+        a, b, year = (int(x) for x in re.split(r"[/.]", date))
+    except ValueError:
+        return None
+    if year < 100:
+        year += 2000
+    t = time_.strip().upper().replace(".", "")
+    pm = t.endswith("PM")
+    am = t.endswith("AM")
+    parts = [int(x) for x in t.rstrip("APM ").split(":")]
+    hour, minute = parts[0], parts[1]
+    second = parts[2] if len(parts) > 2 else 0
+    if pm and hour < 12:
+        hour += 12
+    elif am and hour == 12:
+        hour = 0
+    orders = [(a, b), (b, a)] if dayfirst else [(b, a), (a, b)]
+    for day, month in orders:
+        try:
+            return datetime(year, month, day, hour, minute, second)
+        except ValueError:
+            continue
+    return None
+
+
+def _match_header(line: str):
+    m = _ANDROID_RE.match(line) or _IOS_RE.match(line)
+    if not m:
+        return None
+    date, time_, rest = m.groups()
+    am = _AUTHOR_RE.match(rest)
+    if am:
+        return date, time_, am.group(1), am.group(2)
+    return date, time_, None, rest
+
+
+def iter_messages(
+    stream: BinaryIO,
+    start_offset: int = 0,
+    encoding: str = "utf-8",
+    dayfirst: bool = False,
+) -> Iterator[ChatMessage]:
+    """Lazily yield messages from a binary stream positioned at start_offset.
+
+    Memory use is bounded by the longest single message, regardless of export size.
+    """
+    offset = start_offset
+    current: Optional[ChatMessage] = None
+    parts: List[str] = []
+
+    def _flush(end: int) -> ChatMessage:
+        current.text = "\n".join(parts)
+        current.end_offset = end
+        return current
+
+    for raw_line in stream:
+        line_offset = offset
+        offset += len(raw_line)
+        line = raw_line.decode(encoding, errors="replace").rstrip("\r\n")
+        if not line.strip():
+            # Skip completely empty lines
+            continue
+        header = _match_header(line.lstrip(_LEADING_MARKS))
+        if header:
+            # Start of a new message
+            if current is not None:
+                yield _flush(line_offset)
+            date, time_, author, text = header
+            current = ChatMessage(
+                date=date,
+                time=time_,
+                author=author,
+                text="",
+                timestamp=parse_timestamp(date, time_, dayfirst=dayfirst),
+                offset=line_offset,
+                end_offset=offset,
+            )
+            parts = [text.strip()]
+        elif current is not None:
+            # Continuation of the previous message (multi-line message)
+            parts.append(line)
+        else:
+            # The stream starts with a continuation line: keep it as an undated message.
+            current = ChatMessage(None, None, None, "", None, line_offset, offset)
+            parts = [line]
+
+    if current is not None:
+        yield _flush(offset)
+
+
+def iter_whatsapp_chat(
+    file_path: str,
+    start_offset: int = 0,
+    encoding: str = "utf-8",
+    dayfirst: bool = False,
+) -> Iterator[ChatMessage]:
+    """Stream messages from an exported chat file, optionally resuming at a byte offset
+    previously taken from ChatMessage.end_offset.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(start_offset)
+        yield from iter_messages(f, start_offset=start_offset, encoding=encoding, dayfirst=dayfirst)
+
+
+def parse_whatsapp_chat(file_path: str, encoding: str = "utf-8") -> List[Dict[str, Any]]:
+    """Parse a WhatsApp-exported chat text file into a list of messages.
+
+    Returns a list of dictionaries with keys: 'date', 'time', 'author', 'text'.
+    Prefer iter_whatsapp_chat for large exports.
+    """
+    return [m.as_dict() for m in iter_whatsapp_chat(file_path, encoding=encoding)]